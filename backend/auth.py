@@ -2,16 +2,119 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from database import db
+from collections import OrderedDict
+from typing import Optional
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "leet-code-secret-key")
 ALGORITHM = "HS256"
 
+# Resolved principals are cached per token, so repeat requests with the same
+# bearer token (every /api/code/run click, room polling, ...) skip both the
+# JWT decode and the users lookup. Entries never outlive the token's own exp.
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "4096"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+
+class PrincipalCache:
+    """Size-bounded LRU of token -> user document with a short TTL"""
+
+    def __init__(self, max_entries: int = PRINCIPAL_CACHE_SIZE, ttl: float = PRINCIPAL_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # token -> (expires_at, email, user); expires_at is wall-clock like JWT exp
+        self._entries = OrderedDict()
+        self._tokens_by_email = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, token: str) -> Optional[dict]:
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, _, user = entry
+        if expires_at <= time.time():
+            self._remove(token)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return dict(user)
+
+    def put(self, token: str, email: str, user: dict, token_exp: Optional[float] = None):
+        if self.max_entries <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        if token in self._entries:
+            self._remove(token)
+        self._entries[token] = (expires_at, email, dict(user))
+        self._tokens_by_email.setdefault(email, set()).add(token)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate_user(self, email: str):
+        """Forget every cached token for ``email``; call after changing or deleting that user"""
+        for token in list(self._tokens_by_email.get(email, ())):
+            self._remove(token)
+            self.invalidations += 1
+
+    def invalidate_token(self, token: str):
+        """Forget one token, e.g. on logout"""
+        if token in self._entries:
+            self._remove(token)
+            self.invalidations += 1
+
+    def clear(self):
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._tokens_by_email.clear()
+
+    def _remove(self, token: str):
+        _, email, _ = self._entries.pop(token)
+        tokens = self._tokens_by_email.get(email)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_email[email]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+principal_cache = PrincipalCache()
+
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
+    cached = principal_cache.get(token)
+    if cached is not None:
+        return cached
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -25,7 +128,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
 
-    user = db.users.find_one({"email": email})
+    user = await db.users.find_one({"email": email})
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+    principal_cache.put(token, email, user, payload.get("exp"))
+    return user
@@ -0,0 +1,59 @@
+"""Measure the per-request cost of auth.get_current_user with and without
+the principal cache.
+
+Run from the backend directory against a database (MONGO_URI/MONGO_DB_NAME):
+    python bench_auth.py
+A throwaway user is inserted for the run and removed afterwards.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from jose import jwt
+
+import auth
+from database import db, close_database
+
+BENCH_EMAIL = "bench-auth@example.com"
+ROUNDS = 2000
+
+
+async def time_requests(token: str) -> float:
+    """Mean seconds per get_current_user call over ROUNDS sequential requests"""
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        await auth.get_current_user(token)
+    return (time.perf_counter() - started) / ROUNDS
+
+
+async def main():
+    await db.users.delete_many({"email": BENCH_EMAIL})
+    await db.users.insert_one({"email": BENCH_EMAIL, "hashed_password": "-", "created_at": datetime.utcnow()})
+    token = jwt.encode(
+        {"sub": BENCH_EMAIL, "exp": datetime.utcnow() + timedelta(minutes=15)},
+        auth.SECRET_KEY,
+        algorithm=auth.ALGORITHM,
+    )
+    try:
+        # Warm up the connection pool so neither run pays for connecting
+        await db.users.find_one({"email": BENCH_EMAIL})
+
+        # A zero-size cache stores nothing: every call decodes and queries
+        auth.principal_cache = auth.PrincipalCache(max_entries=0)
+        uncached = await time_requests(token)
+
+        auth.principal_cache = auth.PrincipalCache()
+        cached = await time_requests(token)
+        stats = auth.principal_cache.stats()
+    finally:
+        await db.users.delete_many({"email": BENCH_EMAIL})
+        close_database()
+
+    print(f"Auth overhead per request, {ROUNDS} requests with one token:")
+    print(f"  JWT decode + users lookup: {uncached * 1e6:9.1f} µs")
+    print(f"  principal cache:           {cached * 1e6:9.1f} µs  (hit rate {stats['hit_rate']:.3f})")
+    print(f"  → {uncached / cached:.0f}x less time, {ROUNDS - stats['misses']} of {ROUNDS} lookups skipped")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+"""Compare the per-request cost of the generated test runner script with the
+precompiled harness + cached test case artifact.
+
+Run from the backend directory: python bench_harness.py
+(standalone: needs neither MongoDB nor the runner container)
+"""
+import json
+import os
+import random
+import timeit
+
+HARNESS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "runner", "harness.py")
+
+PROBLEM_TITLE = "Two Sum"
+USER_CODE = '''def twoSum(nums, target):
+    seen = {}
+    for i, n in enumerate(nums):
+        if target - n in seen:
+            return [seen[target - n], i]
+        seen[n] = i
+'''
+FUNC_NAME = "twoSum"
+ROUNDS = 200
+
+
+def two_sum_cases(n_cases=100):
+    # Same shape as seed_problems.generate_two_sum_cases
+    cases = []
+    for _ in range(n_cases):
+        size = random.randint(2, 10)
+        nums = random.sample(range(1, 50), size)
+        i, j = random.sample(range(size), 2)
+        cases.append({"input": {"nums": nums, "target": nums[i] + nums[j]}, "output": sorted([i, j])})
+    return cases
+
+
+def generated_script(harness_source: str, cases: list) -> str:
+    # What the old path wrote per request: harness + solution + embedded cases
+    # (same layout as code_execution.create_test_runner)
+    call_args = ", ".join(repr(arg) for arg in (USER_CODE, FUNC_NAME, cases, PROBLEM_TITLE, 0, len(cases)))
+    return harness_source + "\n\nrun_cases(" + call_args + ")\n"
+
+
+def main():
+    cases = two_sum_cases()
+    with open(HARNESS_PATH) as f:
+        harness_source = f.read()
+
+    script = generated_script(harness_source, cases)
+    harness_job = {
+        "op": "run_harness",
+        "cases_key": f"{PROBLEM_TITLE}:0123456789abcdef",
+        "code": USER_CODE,
+        "func_name": FUNC_NAME,
+        "problem_title": PROBLEM_TITLE,
+        "start": 0,
+        "end": len(cases),
+        "total": len(cases),
+        "timeout": 10,
+        "stream": True,
+    }
+
+    script_bytes = len(script.encode("utf-8"))
+    job_bytes = len(json.dumps(harness_job).encode("utf-8"))
+    script_compile = timeit.timeit(lambda: compile(script, "<runner>", "exec"), number=ROUNDS) / ROUNDS
+    code_compile = timeit.timeit(lambda: compile(USER_CODE, "<solution>", "exec"), number=ROUNDS) / ROUNDS
+
+    print(f"Per request, {len(cases)} test cases:")
+    print(f"  generated script:    {script_bytes:7d} bytes written, {script_compile * 1e6:8.1f} µs to compile")
+    print(f"  precompiled harness: {job_bytes:7d} bytes sent,    {code_compile * 1e6:8.1f} µs to compile")
+    print(f"  → {script_bytes / job_bytes:.1f}x fewer bytes, {script_compile / code_compile:.1f}x less compile time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Load-simulate the quick-play matcher and report match latency and tick cost.
+
+Run from the backend directory; no database is needed, room creation is
+simulated with a short sleep:
+    python bench_matchmaking.py
+    python bench_matchmaking.py --players 20000 --rate 5000
+
+Two scenarios run against a fresh Matchmaker on its real tick loop:
+  - steady: players arrive at --rate per second until --players have queued
+  - burst: --players enqueue at once (e.g. right after a restart)
+Difficulty preferences and ratings are drawn at random.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from matchmaker import MATCHMAKING_TICK_MS, QUEUE_DIFFICULTIES, Matchmaker
+
+# Share of players per difficulty preference (Easy, Medium, Hard, any)
+DIFFICULTY_WEIGHTS = (30, 40, 20, 10)
+RATING_MEAN = 1200
+RATING_SPREAD = 250
+# Simulated cost of inserting one room
+CREATE_ROOM_SECONDS = 0.002
+# Give up on stragglers this long after the last arrival
+DRAIN_TIMEOUT = 30
+
+
+def percentile(values: list, q: float) -> float:
+    return values[int(q * (len(values) - 1))] if values else 0.0
+
+
+async def simulate(players: int, rate: float) -> dict:
+    """Queue ``players`` (all at once if ``rate`` is 0) and wait for them to be matched"""
+    waits = []
+
+    async def create_match(tickets, difficulty):
+        await asyncio.sleep(CREATE_ROOM_SECONDS)
+        now = time.monotonic()
+        waits.extend(now - ticket.enqueued_at for ticket in tickets)
+        return {"code": "BENCH"}
+
+    async def notify(tickets, room):
+        pass
+
+    matchmaker = Matchmaker(create_match=create_match, notify=notify, max_queue=players)
+    await matchmaker.start()
+    started = time.monotonic()
+    for n in range(players):
+        if rate:
+            delay = started + n / rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await matchmaker.enqueue(
+            f"bench-{n}",
+            f"bench-{n}",
+            random.choices(QUEUE_DIFFICULTIES, DIFFICULTY_WEIGHTS)[0],
+            random.gauss(RATING_MEAN, RATING_SPREAD),
+        )
+    arrived = time.monotonic()
+
+    # At most one odd player per queue can be left without a partner. Matched
+    # players leave the queue before their room exists, so also wait for those.
+    leftover_ok = (matchmaker.room_size - 1) * len(QUEUE_DIFFICULTIES)
+    while (
+        (len(matchmaker) > leftover_ok or len(waits) + len(matchmaker) < players)
+        and time.monotonic() - arrived < DRAIN_TIMEOUT
+    ):
+        await asyncio.sleep(MATCHMAKING_TICK_MS / 1000)
+    elapsed = time.monotonic() - started
+    await matchmaker.stop()
+
+    stats = matchmaker.stats()
+    waits.sort()
+    return {
+        "matched": len(waits),
+        "unmatched": len(matchmaker),
+        "elapsed": elapsed,
+        "p50": percentile(waits, 0.5),
+        "p90": percentile(waits, 0.9),
+        "p99": percentile(waits, 0.99),
+        "max": waits[-1] if waits else 0.0,
+        "ticks": stats["ticks"],
+        "max_tick_ms": stats["max_tick_ms"],
+        "max_pair_ms": stats["max_pair_ms"],
+    }
+
+
+def report(name: str, result: dict):
+    print(f"📊 {name}: matched {result['matched']} players in {result['elapsed']:.1f}s, "
+          f"{result['unmatched']} left unmatched")
+    print(f"   wait p50 {result['p50'] * 1000:.0f} ms, p90 {result['p90'] * 1000:.0f} ms, "
+          f"p99 {result['p99'] * 1000:.0f} ms, max {result['max'] * 1000:.0f} ms")
+    print(f"   {result['ticks']} ticks every {MATCHMAKING_TICK_MS} ms, slowest {result['max_tick_ms']:.1f} ms "
+          f"({result['max_pair_ms']:.1f} ms of it pairing)")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=5000)
+    parser.add_argument("--rate", type=float, default=1000, help="arrivals per second in the steady scenario")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    report(f"steady ({args.rate:.0f} players/s)", await simulate(args.players, args.rate))
+    report(f"burst ({args.players} players at once)", await simulate(args.players, 0))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+"""Explain the hot room/user/problem queries and fail if any of them scans a collection.
+
+Run from the backend directory against a database (MONGO_URI/MONGO_DB_NAME):
+    python check_query_plans.py
+Indexes are ensured first, so this also works on a fresh database. Exits 1
+if any winning plan contains a COLLSCAN stage. tests/test_query_plans.py
+runs the same check under pytest whenever MONGO_URI is set.
+"""
+import asyncio
+import sys
+
+from bson import ObjectId
+from database import db, close_database
+from indexes import ensure_indexes
+
+ROOM_CODE = "ABC123"
+USER_ID = "plan-check-user"
+PAGE_CURSOR = ObjectId("000000000000000000000000")
+
+# (description, collection, filter, sort) for every query the request path issues
+HOT_QUERIES = [
+    ("problem by title (detail, run_code)", "problems", {"title": "Two Sum"}, None),
+    ("listing page", "problems", {"_id": {"$gt": PAGE_CURSOR}}, [("_id", 1)]),
+    ("listing page by difficulty", "problems", {"difficulty": "Easy", "_id": {"$gt": PAGE_CURSOR}}, [("_id", 1)]),
+    ("listing page by tag", "problems", {"tags": "array", "_id": {"$gt": PAGE_CURSOR}}, [("_id", 1)]),
+    ("users by email (login, auth)", "users", {"email": "someone@example.com"}, None),
+    ("room by code (join, leave, start, cancel)", "rooms", {"code": ROOM_CODE}, [("active", -1)]),
+    ("active room by code", "rooms", {"code": ROOM_CODE, "active": True}, None),
+    ("player's active room (create, get_user_room)", "rooms", {"players.id": USER_ID, "active": True}, None),
+    ("player's other active room (join)", "rooms",
+     {"active": True, "code": {"$ne": ROOM_CODE}, "players.id": USER_ID}, None),
+    ("player in room by code (leave)", "rooms", {"code": ROOM_CODE, "players.id": USER_ID}, [("active", -1)]),
+    ("unfinished player in running game (completion)", "rooms",
+     {"code": ROOM_CODE, "active": True, "started": True,
+      "players": {"$elemMatch": {"id": USER_ID, "completed": {"$ne": True}}}},
+     None),
+    ("running games with a deadline (match clock)", "rooms",
+     {"active": True, "started": True, "endsAt": {"$ne": None}}, None),
+]
+
+
+def plan_stages(plan) -> list:
+    """Every stage name in an explain plan tree"""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(plan_stages(item))
+    return stages
+
+
+async def winning_plans() -> list:
+    """(description, winning plan stages) for every query in HOT_QUERIES"""
+    plans = []
+    for description, collection, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        plans.append((description, plan_stages(explain["queryPlanner"]["winningPlan"])))
+    return plans
+
+
+async def main() -> int:
+    await ensure_indexes()
+    failures = 0
+    for description, stages in await winning_plans():
+        if "COLLSCAN" in stages:
+            failures += 1
+            print(f"❌ {description}: COLLSCAN ({' -> '.join(stages)})")
+        else:
+            print(f"✅ {description}: {' -> '.join(stages)}")
+
+    close_database()
+    if failures:
+        print(f"❌ {failures} hot queries scan a collection")
+        return 1
+    print("✅ No hot query scans a collection")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
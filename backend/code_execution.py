@@ -1,18 +1,24 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import Optional
+import asyncio
 import subprocess
-import tempfile
 import os
 import json
+import math
 import time
 from datetime import datetime
 import sys
-import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from database import db
+from room_engine import room_store
 from auth import get_current_user
+from runner_pool import RunnerPoolError, check_runner_pool, run_harness_in_pool
+from job_queue import QueueFullError, run_scheduler
+from verdict_cache import verdict_cache, verdict_key
+from problem_catalog import SAMPLE_CASE_COUNT, problem_catalog
+from socket_server import sio
 
 router = APIRouter(prefix="/api/code", tags=["code"])
 
@@ -22,6 +28,8 @@ class CodeExecutionRequest(BaseModel):
     user_id: str
     room_code: Optional[str] = None
     is_submit: bool = False
+    # Socket.IO sid of the submitting tab; per-test progress is pushed there
+    socket_id: Optional[str] = None
 
 # Check if Docker container is running
 def check_docker_container():
@@ -42,8 +50,490 @@ def check_docker_container():
         print(f"❌ Failed to check Docker container: {e}")
         return False
 
-# Check container on startup
-docker_available = check_docker_container()
+# Wall clock limit for a single run, in seconds
+EXECUTION_TIMEOUT = 10
+
+# Resource limits for a single run. A problem document can override any of
+# them with a "limits" sub-document, e.g. {"limits": {"cpu_seconds": 4}}.
+DEFAULT_LIMITS = {
+    "wall_seconds": EXECUTION_TIMEOUT,
+    "cpu_seconds": float(os.getenv("RUN_CPU_SECONDS", "5")),
+    # Peak resident memory, so it includes the interpreter itself
+    "memory_mb": int(os.getenv("RUN_MEMORY_MB", "256")),
+    "output_bytes": int(os.getenv("RUN_OUTPUT_BYTES", str(1024 * 1024))),
+}
+
+# Verdicts for runs stopped by a limit: (short code, message)
+LIMIT_VERDICTS = {
+    "time": ("TLE", "Time Limit Exceeded"),
+    "memory": ("MLE", "Memory Limit Exceeded"),
+    "output": ("OLE", "Output Limit Exceeded"),
+}
+
+# docker exec exit status of a job killed by SIGKILL (the `timeout` below or
+# the kernel's OOM killer) / SIGXCPU
+KILLED_EXIT_CODES = (137, -9)
+CPU_LIMIT_EXIT_CODES = (152, -24)
+# Matches MEMORY_LIMIT_EXIT in runner/harness.py
+MEMORY_LIMIT_EXIT = 86
+
+# The harness the runner container executes; the docker exec fallback
+# embeds its source into a one-off script
+HARNESS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "runner", "harness.py")
+with open(HARNESS_PATH) as f:
+    HARNESS_SOURCE = f.read()
+
+# Parallel test sharding for full submissions is opt-in: set SUBMIT_SHARDS,
+# or "parallel_shards" on a problem document to override it per problem.
+DEFAULT_SUBMIT_SHARDS = int(os.getenv("SUBMIT_SHARDS", "1"))
+MIN_CASES_PER_SHARD = 10
+
+# Minimum seconds between compact progress updates sent to a whole room
+ROOM_PROGRESS_INTERVAL = 0.25
+
+# How long a runner probe result is trusted: a healthy one for
+# RUNNER_PROBE_INTERVAL, a failed one only for RUNNER_RETRY_INTERVAL, so a
+# runner container started after the backend is picked up without a restart
+RUNNER_PROBE_INTERVAL = float(os.getenv("RUNNER_PROBE_INTERVAL", "30"))
+RUNNER_RETRY_INTERVAL = float(os.getenv("RUNNER_RETRY_INTERVAL", "5"))
+
+
+class RunnerStatus:
+    """Whether the docker exec fallback and the warm pool are usable, re-probed over time"""
+
+    def __init__(self):
+        self.docker = False
+        self.pool = False
+        self._checked_at = None
+        self._probe = None
+
+    def probe(self):
+        """Blocking check, used once at startup"""
+        self.docker = check_docker_container()
+        self.pool = check_runner_pool()
+        self._checked_at = time.monotonic()
+
+    async def refresh(self):
+        """Re-probe off the event loop if the last result is too old; concurrent callers share one probe"""
+        ttl = RUNNER_PROBE_INTERVAL if self.docker and self.pool else RUNNER_RETRY_INTERVAL
+        if self._checked_at is not None and time.monotonic() - self._checked_at < ttl:
+            return
+        if self._probe is None:
+            self._probe = asyncio.ensure_future(self._reprobe())
+        await asyncio.shield(self._probe)
+
+    async def _reprobe(self):
+        try:
+            self.docker, self.pool = await asyncio.gather(
+                asyncio.to_thread(check_docker_container),
+                asyncio.to_thread(check_runner_pool),
+            )
+            self._checked_at = time.monotonic()
+        finally:
+            self._probe = None
+
+    def pool_failed(self):
+        """A pool job failed to reach the runner; use docker exec until the next probe"""
+        self.pool = False
+        self._checked_at = time.monotonic()
+
+
+# Check container and warm worker pool on startup
+runner_status = RunnerStatus()
+runner_status.probe()
+
+
+async def _run_docker_command(args: list, timeout: float, input_data: Optional[bytes] = None):
+    """Run a docker CLI command without blocking the event loop.
+
+    ``input_data`` is written to the command's stdin. Returns
+    (returncode, stdout, stderr), or None if it timed out. The client
+    process is killed on timeout or cancellation.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.PIPE if input_data is not None else None,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(input_data), timeout=timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return None
+    except asyncio.CancelledError:
+        proc.kill()
+        raise
+    return (
+        proc.returncode,
+        stdout.decode("utf-8", errors="replace"),
+        stderr.decode("utf-8", errors="replace"),
+    )
+
+
+def problem_limits(problem: dict) -> dict:
+    """The problem's resource limits, filled in from DEFAULT_LIMITS"""
+    overrides = problem.get("limits") or {}
+    return {key: overrides.get(key, default) for key, default in DEFAULT_LIMITS.items()}
+
+
+async def run_with_docker_exec(test_script: str, limits: dict) -> dict:
+    """Fallback path: pipe the script into a one-off `docker exec python -`
+
+    The script applies the CPU and memory rlimits itself. Output is only
+    checked once the run is over, so the wall clock bounds how much of it
+    can pile up.
+    """
+    # Execute code in the running Docker container. The script travels over
+    # stdin, so nothing touches the host filesystem. Killing the docker exec
+    # client does not stop the process inside the container, so the
+    # container-side `timeout` enforces the limit there as well.
+    print(f"🐳 Executing code in Docker container")
+    wall_seconds = limits["wall_seconds"]
+    started = time.monotonic()
+    result = await _run_docker_command([
+        "docker", "exec", "-i", "leet-code-runner",
+        "timeout", "-s", "KILL", str(wall_seconds),
+        "python", "-"
+    ], timeout=wall_seconds + 2, input_data=test_script.encode("utf-8"))
+
+    if result is None:
+        return {"returncode": -1, "stdout": "", "stderr": "", "timed_out": True, "limit_exceeded": "time"}
+    # SIGKILL shows up as 128+9 from docker exec, -9 for a directly killed
+    # client. Only a kill at the `timeout` deadline is a time limit; an
+    # earlier one came from the OOM killer.
+    if result[0] in KILLED_EXIT_CODES:
+        if time.monotonic() - started >= wall_seconds:
+            return {"returncode": -1, "stdout": "", "stderr": "", "timed_out": True, "limit_exceeded": "time"}
+        return {"returncode": result[0], "stdout": "", "stderr": "", "timed_out": False, "limit_exceeded": "memory"}
+
+    returncode, stdout, stderr = result
+    limit_exceeded = None
+    if len(stdout) + len(stderr) > limits["output_bytes"]:
+        limit_exceeded = "output"
+    elif returncode in CPU_LIMIT_EXIT_CODES:
+        limit_exceeded = "time"
+    elif returncode == MEMORY_LIMIT_EXIT:
+        limit_exceeded = "memory"
+    return {
+        "returncode": returncode,
+        "stdout": stdout,
+        "stderr": stderr,
+        "timed_out": False,
+        "limit_exceeded": limit_exceeded,
+    }
+
+
+async def execute_test_job(job: dict, test_cases: list, on_line=None) -> dict:
+    """Run a harness job on the warm pool, falling back to docker exec
+
+    On the pool only the job (user code plus a reference to the cached test
+    case artifact) is sent. The docker exec fallback still builds a full
+    script, and only the pool streams stdout lines to ``on_line``.
+    """
+    case_count = job["end"] - job["start"]
+    limits = job["limits"]
+    if runner_status.pool:
+        try:
+            print(f"🔥 Executing code on warm runner pool for {case_count} test cases")
+            return await run_harness_in_pool(job, test_cases, timeout=limits["wall_seconds"], on_line=on_line)
+        except RunnerPoolError as e:
+            print(f"⚠️ {e}, falling back to docker exec")
+            runner_status.pool_failed()
+
+    if not runner_status.docker:
+        return {"error": "Runner pool is unavailable"}
+
+    print(f"💾 Creating test runner script")
+    test_script = create_test_runner(
+        job["code"], test_cases[job["start"]:job["end"]], job["problem_title"], job["start"], job["total"], limits
+    )
+    return await run_with_docker_exec(test_script, limits)
+
+
+async def run_test_cases(
+    code: str,
+    problem_title: str,
+    test_cases: list,
+    cases_key: str,
+    case_count: int,
+    start: int = 0,
+    end: Optional[int] = None,
+    on_progress=None,
+    limits: Optional[dict] = None,
+):
+    """Run tests ``start``..``end`` of the first ``case_count`` cases and parse the verdict
+
+    ``test_cases`` is the problem's full test set and ``cases_key``
+    identifies it (title + version) in the runner's artifact cache.
+    ``on_progress`` is awaited with each per-test progress record the
+    runner prints while it works through the cases. ``limits`` defaults
+    to DEFAULT_LIMITS.
+    """
+    limits = limits or DEFAULT_LIMITS
+    job = {
+        "cases_key": cases_key,
+        "code": code,
+        "func_name": extract_function_name(code, problem_title),
+        "problem_title": problem_title,
+        "start": start,
+        "end": case_count if end is None else end,
+        "total": case_count,
+        "limits": limits,
+    }
+
+    async def on_line(line: str):
+        if on_progress is None or not line.startswith('{"progress"'):
+            return
+        try:
+            progress = json.loads(line)["progress"]
+        except (json.JSONDecodeError, KeyError):
+            return
+        await on_progress(progress)
+
+    result = await execute_test_job(job, test_cases, on_line)
+    if "error" in result:
+        return result
+
+    print(f"🐳 Code execution finished")
+    verdict = parse_verdict(result, limits)
+    # Whole-process usage is only reported by the pool
+    if result.get("rusage"):
+        verdict.setdefault("stats", {})["process"] = result["rusage"]
+    return verdict
+
+
+def parse_verdict(result: dict, limits: dict) -> dict:
+    """Turn a runner result (returncode/stdout/stderr/timed_out) into a verdict"""
+    limit_exceeded = result.get("limit_exceeded")
+    if limit_exceeded in LIMIT_VERDICTS:
+        code, message = LIMIT_VERDICTS[limit_exceeded]
+        if limit_exceeded == "time":
+            detail = f"{limits['cpu_seconds']}s CPU, {limits['wall_seconds']}s wall"
+        elif limit_exceeded == "memory":
+            detail = f"{limits['memory_mb']} MB"
+        else:
+            detail = f"{limits['output_bytes']} bytes"
+        return {"error": f"{message} ({detail})", "verdict": code, "limits": limits}
+
+    if result["timed_out"]:
+        return {"error": f"Code execution timed out ({limits['wall_seconds']} seconds)"}
+
+    if result["returncode"] != 0:
+        return {"error": f"Runtime error: {result['stderr'][:500]}"}
+
+    output = result["stdout"].strip()
+    if not output:
+        return {"error": "No output from code execution"}
+
+    # The verdict is the last line; anything before it is progress output
+    output = output.splitlines()[-1]
+    print(f"📤 Docker output: {output[:200]}...")
+
+    try:
+        return json.loads(output)
+    except json.JSONDecodeError:
+        return {"error": f"Invalid JSON output: {output[:200]}"}
+
+
+def merge_run_stats(verdicts: list) -> dict:
+    """Combine the ``stats`` of shard verdicts, in case order, into one block
+
+    CPU time and per-case wall time add up across shards, while memory is
+    the largest peak of any shard. The process wall time is the longest
+    shard's, since shards run side by side.
+    """
+    stats = [verdict["stats"] for verdict in verdicts if verdict.get("stats")]
+    merged = {
+        "wall_ms": round(sum(s.get("wall_ms", 0) for s in stats), 3),
+        "cpu_ms": round(sum(s.get("cpu_ms", 0) for s in stats), 3),
+        "peak_rss_kb": max((s.get("peak_rss_kb", 0) for s in stats), default=0),
+        "cases": [case for s in stats for case in s.get("cases", [])],
+    }
+    processes = [s["process"] for s in stats if s.get("process")]
+    if processes:
+        merged["process"] = {
+            "wall_ms": max(p["wall_ms"] for p in processes),
+            "user_cpu_ms": round(sum(p["user_cpu_ms"] for p in processes), 3),
+            "sys_cpu_ms": round(sum(p["sys_cpu_ms"] for p in processes), 3),
+            "max_rss_kb": max(p["max_rss_kb"] for p in processes),
+            "shards": len(processes),
+        }
+    return merged
+
+
+def submission_shard_count(problem: dict, case_count: int) -> int:
+    """How many parallel shards to split a full submission into (1 = off)"""
+    shards = int(problem.get("parallel_shards", DEFAULT_SUBMIT_SHARDS))
+    # Don't bother splitting small test sets; process startup would dominate.
+    # Each shard takes a scheduler slot, so never ask for more than exist.
+    shards = min(shards, case_count // MIN_CASES_PER_SHARD, run_scheduler.max_concurrency)
+    return max(1, shards)
+
+
+async def run_sharded_test_cases(
+    code: str,
+    problem_title: str,
+    test_cases: list,
+    cases_key: str,
+    case_count: int,
+    shard_count: int,
+    on_progress=None,
+    limits: Optional[dict] = None,
+) -> dict:
+    """Run contiguous slices of the first ``case_count`` cases in parallel and merge the verdicts.
+
+    As soon as a shard fails, every shard covering later cases is cancelled
+    (which kills its job in the runner). Shards covering earlier cases keep
+    running, so the verdict always reports the lowest failing test, exactly
+    as a sequential run would.
+    """
+    total = case_count
+    size = math.ceil(total / shard_count)
+    tasks = [
+        asyncio.create_task(run_test_cases(
+            code, problem_title, test_cases, cases_key, total,
+            start, min(start + size, total), on_progress, limits
+        ))
+        for start in range(0, total, size)
+    ]
+    outcomes = {}
+    first_failed = len(tasks)
+
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.cancelled():
+                    continue
+                index = tasks.index(task)
+                outcomes[index] = task.result()
+                if outcomes[index].get("passed") is not True and index < first_failed:
+                    first_failed = index
+                    for later in tasks[index + 1:]:
+                        later.cancel()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if first_failed < len(tasks):
+        print(f"🧩 Shard {first_failed + 1}/{len(tasks)} reported the first failure")
+        # Earlier shards all finished, so their timings belong in the verdict
+        verdict = dict(outcomes[first_failed])
+        verdict["stats"] = merge_run_stats([outcomes[i] for i in range(first_failed + 1)])
+        return verdict
+
+    return {
+        "passed": True,
+        "passed_tests": total,
+        "total_tests": total,
+        "all_passed": True,
+        "stats": merge_run_stats([outcomes[i] for i in range(len(tasks))])
+    }
+
+
+@router.get("/queue")
+async def get_queue_stats():
+    """Runner queue depth, throughput and wait-time metrics"""
+    return run_scheduler.stats()
+
+
+def progress_reporter(request: CodeExecutionRequest, total: int):
+    """Build the on_progress callback that pushes test results over Socket.IO
+
+    The submitting client gets a ``test_progress`` event per finished test.
+    For submits in a room, everyone in the room also gets a compact
+    ``room_progress`` ("X/total") update, throttled to ROOM_PROGRESS_INTERVAL.
+    """
+    if not request.socket_id and not (request.is_submit and request.room_code):
+        return None
+
+    finished = set()
+    last_room_emit = 0.0
+
+    async def on_progress(progress: dict):
+        nonlocal last_room_emit
+        finished.add(progress.get("test_number"))
+        if request.socket_id:
+            await sio.emit("test_progress", {
+                "problem_title": request.problem_title,
+                "test_number": progress.get("test_number"),
+                "passed": progress.get("passed"),
+                "wall_ms": progress.get("wall_ms"),
+                "completed": len(finished),
+                "total": total,
+            }, to=request.socket_id)
+
+        now = time.monotonic()
+        if request.is_submit and request.room_code and (
+            now - last_room_emit >= ROOM_PROGRESS_INTERVAL or len(finished) == total
+        ):
+            last_room_emit = now
+            await sio.emit("room_progress", {
+                "userId": request.user_id,
+                "completed": len(finished),
+                "total": total,
+            }, to=request.room_code)
+
+    return on_progress
+
+
+# Submission records still being written; holding the tasks keeps them from
+# being garbage collected mid-write and lets shutdown wait for them
+_pending_records = set()
+
+
+def record_submission_later(request: CodeExecutionRequest, results: dict, shard_count: int):
+    """Write the submission record in the background, off the response path"""
+    task = asyncio.create_task(record_submission(request, results, shard_count))
+    _pending_records.add(task)
+    task.add_done_callback(_record_done)
+
+
+def _record_done(task: asyncio.Task):
+    _pending_records.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"⚠️ Failed to record submission stats: {task.exception()}")
+
+
+async def flush_submission_records():
+    """Wait for background submission records (called on shutdown)"""
+    if _pending_records:
+        await asyncio.gather(*_pending_records, return_exceptions=True)
+
+
+async def record_submission(request: CodeExecutionRequest, results: dict, shard_count: int):
+    """Persist one executed run with its resource usage for later analysis"""
+    document = {
+        "user_id": request.user_id,
+        "problem_title": request.problem_title,
+        "room_code": request.room_code,
+        "is_submit": request.is_submit,
+        "passed": results.get("passed") is True,
+        "all_passed": bool(results.get("all_passed")),
+        "failed_at": results.get("failed_at"),
+        "passed_tests": results.get("passed_tests"),
+        "total_tests": results.get("total_tests"),
+        "error": results.get("error"),
+        "verdict": results.get("verdict"),
+        "shards": shard_count,
+        # Verdict cache hits carry the stats of the run they were cached from
+        "stats": results.get("stats"),
+        "cached": bool(results.get("cached")),
+        "created_at": datetime.utcnow(),
+    }
+    try:
+        await db.submissions.insert_one(document)
+    except Exception as e:
+        print(f"⚠️ Failed to record submission stats: {e}")
+
+
+@router.get("/cache")
+async def get_cache_stats():
+    """Verdict cache size and hit/miss counters"""
+    return verdict_cache.stats()
 
 
 @router.post("/run")
@@ -61,95 +551,73 @@ async def run_code(
 
     print(f"🔍 Code execution request: {problem_title}, user: {user_id}, is_submit: {is_submit}")
 
-    # Get problem and test cases first
-    problem = db.problems.find_one({"title": problem_title})
-    if not problem:
+    # Get problem and test cases first (cached in-process)
+    problem = await problem_catalog.get_by_title(problem_title)
+    test_data = await problem_catalog.get_test_data(problem["_id"]) if problem else None
+    if not test_data:
         print(f"❌ Problem '{problem_title}' not found in database")
         raise HTTPException(status_code=404, detail="Problem not found")
 
-    print(f"✅ Found problem with {len(problem.get('test_cases', []))} test cases")
+    print(f"✅ Found problem with {len(test_data['test_cases'])} test cases")
 
     # Determine how many test cases to run
-    test_cases = problem["test_cases"]
+    test_cases = test_data["test_cases"]
     if is_submit:
         # Run all test cases
         cases_to_run = test_cases
     else:
-        # Run only first 3 test cases
-        cases_to_run = test_cases[:3]
-
-    if not docker_available:
+        # Run only the sample cases shown with the problem
+        cases_to_run = test_cases[:SAMPLE_CASE_COUNT]
+
+    limits = problem_limits(problem)
+
+    # Identical code against an unchanged test set gets the stored verdict
+    test_version = test_data["test_cases_version"]
+    verdict_cache.observe_version(problem_title, test_version)
+    cache_key = verdict_key(code, problem_title, test_version, is_submit, limits)
+    # Names this test set in the runner's artifact cache
+    cases_key = f"{problem_title}:{test_version}"
+    shard_count = submission_shard_count(problem, len(cases_to_run)) if is_submit else 1
+    cached = verdict_cache.get(cache_key)
+    if cached is not None:
+        print(f"⚡ Verdict cache hit for {problem_title}, user: {user_id}")
+        cached["cached"] = True
+        # Still a submission, even though nothing ran
+        record_submission_later(request, cached, shard_count)
+        if is_submit and cached.get("all_passed") and room_code:
+            await update_room_completion(room_code, user_id)
+        return cached
+
+    await runner_status.refresh()
+    if not runner_status.docker and not runner_status.pool:
         raise HTTPException(
             status_code=500,
             detail="Docker container is not available. Please run: docker-compose up -d"
         )
 
     try:
-        print(f"💾 Creating test runner script")
-
-        # Create test runner script
-        test_script = create_test_runner(code, cases_to_run, problem_title)
-
-        # Create a unique filename to avoid conflicts
-        import uuid
-        unique_id = str(uuid.uuid4())[:8]
-        script_name = f"test_runner_{unique_id}.py"
-
-        # Write script to the temp-execution directory (mapped to container)
-        script_path = f"temp-execution/{script_name}"
-        with open(script_path, "w") as f:
-            f.write(test_script)
-
-        print(f"✅ Created test runner: {script_name}")
-
-        # Verify file was created and is accessible to container
-        container_path = f"/app/temp-execution/{script_name}"
-        check_result = subprocess.run([
-            "docker", "exec", "leet-code-runner",
-            "ls", "-la", container_path
-        ], capture_output=True, text=True)
-
-        if check_result.returncode != 0:
-            print(f"❌ File not accessible in container: {container_path}")
-            print(f"❌ Container ls output: {check_result.stderr}")
-            return {"error": f"File not accessible in container: {script_name}"}
-
-        print(f"✅ File verified in container: {container_path}")
-
-        # Execute code in the running Docker container
-        print(f"🐳 Executing code in Docker container for {len(cases_to_run)} test cases")
-
-        result = subprocess.run([
-            "docker", "exec", "leet-code-runner",
-            "python", container_path
-        ], capture_output=True, text=True, timeout=10)
-
-        # Clean up the script file
-        try:
-            os.remove(script_path)
-            print(f"🧹 Cleaned up: {script_path}")
-        except Exception as cleanup_error:
-            print(f"⚠️ Cleanup warning: {cleanup_error}")  # Don't fail on cleanup errors
-
-        print(f"🐳 Docker execution finished")
-
-        if result.returncode != 0:
-            return {"error": f"Runtime error: {result.stderr[:500]}"}
-
-        output = result.stdout.strip()
-        if not output:
-            return {"error": "No output from code execution"}
-
-        print(f"📤 Docker output: {output[:200]}...")
-
-        try:
-            results = json.loads(output)
-        except json.JSONDecodeError:
-            return {"error": f"Invalid JSON output: {output[:200]}"}
+        on_progress = progress_reporter(request, len(cases_to_run))
+
+        # One slot per shard, so shards never queue inside the runner
+        async with run_scheduler.slot(user_id=user_id, room_code=room_code, is_submit=is_submit, weight=shard_count):
+            if shard_count > 1:
+                print(f"🧩 Running {len(cases_to_run)} test cases in {shard_count} parallel shards")
+                results = await run_sharded_test_cases(
+                    code, problem_title, test_cases, cases_key, len(cases_to_run), shard_count, on_progress, limits
+                )
+            else:
+                results = await run_test_cases(
+                    code, problem_title, test_cases, cases_key, len(cases_to_run),
+                    on_progress=on_progress, limits=limits
+                )
 
         # Handle both old format (list) and new format (single dict)
         if isinstance(results, dict):
             # New format: single result object
+            record_submission_later(request, results, shard_count)
+            # Only real verdicts are cached, never timeouts or system errors
+            if "passed" in results:
+                verdict_cache.put(cache_key, problem_title, results)
             # Check if it's a submit and user passed all tests, update room
             if is_submit and results.get("all_passed") and room_code:
                 await update_room_completion(room_code, user_id)
@@ -173,8 +641,17 @@ async def run_code(
 
             return result_data
 
-    except subprocess.TimeoutExpired:
-        return {"error": "Code execution timed out (10 seconds)"}
+    except QueueFullError as e:
+        print(f"🚦 Rejected run for {user_id}: {e} (position {e.queue_position})")
+        raise HTTPException(
+            status_code=429,
+            detail={
+                "error": str(e),
+                "queue_position": e.queue_position,
+                "retry_after": e.retry_after,
+            },
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except Exception as e:
         print(f"❌ System error in code execution: {str(e)}")
         print(f"❌ Error type: {type(e).__name__}")
@@ -183,162 +660,33 @@ async def run_code(
         return {"error": f"System error: {str(e)}"}
 
 
-def create_test_runner(user_code: str, test_cases: list, problem_title: str) -> str:
-    """Create a Python script that runs the user's code against test cases"""
+def create_test_runner(
+    user_code: str,
+    test_cases: list,
+    problem_title: str,
+    case_offset: int = 0,
+    total_cases: Optional[int] = None,
+    limits: Optional[dict] = None,
+) -> str:
+    """Create a self-contained Python script that runs the user's code against test cases
+
+    Used by the docker exec fallback; it is the runner's harness module
+    with the test cases embedded. ``case_offset`` and ``total_cases`` let
+    the script run one shard of a larger test set while still reporting
+    global test numbers. The script sets ``limits`` as rlimits on itself.
+    """
+    if total_cases is None:
+        total_cases = len(test_cases)
 
     # Extract function name from user code
     func_name = extract_function_name(user_code, problem_title)
 
-    # Convert test cases to proper Python representation
-    import json
-
-    # Convert JSON null to Python None in test cases
-    def convert_nulls(obj):
-        if isinstance(obj, dict):
-            return {k: convert_nulls(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [convert_nulls(item) for item in obj]
-        elif obj is None:
-            return None
-        else:
-            return obj
-
-    cleaned_test_cases = convert_nulls(test_cases)
-
-    runner_template = '''
-import json
-import sys
-import traceback
-import math
-import heapq
-import bisect
-import itertools
-import functools
-import operator
-from collections import defaultdict, deque, Counter, OrderedDict
-from typing import List, Dict, Set, Optional, Tuple
-
-def validate_solution(actual_output, expected_output, input_data, problem_title):
-    """Custom validation for problems that may have multiple valid solutions"""
-
-    if problem_title == "Two Sum":
-        # For Two Sum, check if the returned indices sum to the target
-        if not isinstance(actual_output, list) or len(actual_output) != 2:
-            return False
-        try:
-            nums = input_data.get("nums") if isinstance(input_data, dict) else input_data
-            target = input_data.get("target") if isinstance(input_data, dict) else None
-            if target is None:
-                return actual_output == expected_output
-
-            i, j = actual_output[0], actual_output[1]
-            if i < 0 or j < 0 or i >= len(nums) or j >= len(nums) or i == j:
-                return False
-            return nums[i] + nums[j] == target
-        except (IndexError, KeyError, TypeError):
-            return False
-
-    elif problem_title == "Reverse String":
-        # For string reversal, both should be strings and one should be reverse of input
-        if not isinstance(actual_output, str):
-            return False
-        try:
-            s = input_data.get("s") if isinstance(input_data, dict) else input_data
-            return actual_output == s[::-1]
-        except:
-            return actual_output == expected_output
-
-    elif problem_title == "Merge Two Sorted Lists":
-        # For merged lists, check if result is properly sorted and contains all elements
-        if not isinstance(actual_output, list):
-            return False
-        try:
-            list1 = input_data.get("list1", []) if isinstance(input_data, dict) else []
-            list2 = input_data.get("list2", []) if isinstance(input_data, dict) else []
-            all_elements = sorted(list1 + list2)
-            return sorted(actual_output) == all_elements and actual_output == sorted(actual_output)
-        except:
-            return actual_output == expected_output
-
-    # For other problems, use exact match
-    return actual_output == expected_output
-
-# User's code
-''' + user_code + '''
-
-# Test cases (with proper None handling)
-test_cases = ''' + repr(cleaned_test_cases) + '''
-problem_title = ''' + repr(problem_title) + '''
-
-results = []
-total_cases = len(test_cases)
-
-for i, test_case in enumerate(test_cases):
-    try:
-        # Get input parameters
-        input_data = test_case["input"]
-        expected_output = test_case["output"]
-
-        # Call user's function
-        if isinstance(input_data, dict):
-            # Multiple parameters
-            actual_output = ''' + func_name + '''(**input_data)
-        else:
-            # Single parameter
-            actual_output = ''' + func_name + '''(input_data)
-
-        # Check if output matches expected (with custom validation for certain problems)
-        passed = validate_solution(actual_output, expected_output, input_data, problem_title)
-
-        if passed:
-            # Test passed, continue to next test
-            results.append({
-                "passed": True,
-                "test_number": i + 1,
-                "input": input_data,
-                "expected": expected_output,
-                "output": actual_output
-            })
-        else:
-            # Test failed, stop here and return failure details
-            result = {
-                "passed": False,
-                "failed_at": i + 1,
-                "total_tests": total_cases,
-                "input": input_data,
-                "expected": expected_output,
-                "output": actual_output,
-                "passed_tests": len(results)
-            }
-            print(json.dumps(result, default=str))
-            sys.exit(0)
-
-    except Exception as e:
-        # Exception occurred, stop here and return error details
-        result = {
-            "passed": False,
-            "failed_at": i + 1,
-            "total_tests": total_cases,
-            "input": input_data if 'input_data' in locals() else None,
-            "expected": expected_output if 'expected_output' in locals() else None,
-            "output": None,
-            "error": str(e),
-            "passed_tests": len(results)
-        }
-        print(json.dumps(result, default=str))
-        sys.exit(0)
-
-# If we get here, all tests passed
-result = {
-    "passed": True,
-    "passed_tests": len(results),
-    "total_tests": total_cases,
-    "all_passed": True
-}
-print(json.dumps(result, default=str))
-'''
-
-    return runner_template
+    call_args = ", ".join(
+        repr(arg) for arg in (
+            limits or DEFAULT_LIMITS, user_code, func_name, test_cases, problem_title, case_offset, total_cases
+        )
+    )
+    return HARNESS_SOURCE + "\n\nrun_limited(" + call_args + ")\n"
 
 
 def extract_function_name(code: str, problem_title: str) -> str:
@@ -372,60 +720,16 @@ def extract_function_name(code: str, problem_title: str) -> str:
 
 async def update_room_completion(room_code: str, user_id: str):
     """Update room with user completion"""
-    room = db.rooms.find_one({"code": room_code})
-    if not room or not room.get("started"):
+    # One atomic update marks the player and, if they were last, the game
+    room = await room_store.complete_player(room_code, user_id)
+    if not room:
         return
 
-    # Update player completion status
-    for player in room["players"]:
-        if player["id"] == user_id and not player.get("completed"):
-            player["completed"] = True
-            player["completedAt"] = datetime.utcnow().isoformat()
-            break
-
-    # Always update player data first
-    db.rooms.update_one(
-        {"_id": room["_id"]},
-        {"$set": {"players": room["players"]}}
-    )
-
-    # Broadcast room update immediately so leaderboard updates in real-time
-    room["_id"] = str(room["_id"])
-    if "created_at" in room:
-        room["created_at"] = room["created_at"].isoformat()
     # Import here to avoid circular imports
-    from socket_server import broadcast_room_update
-    await broadcast_room_update(room)
-    print(f"📡 Broadcasted immediate update for room {room_code} - player {user_id} completed")
-
-    # Check if everyone has completed now
-    all_completed = all(player.get("completed", False) for player in room["players"])
-
-    # If everyone completed for the first time, mark room as finished
-    if all_completed and not room.get("gameCompleted"):
-        print(f"🏁 Game completed for room {room_code}! Marking as finished.")
-
-        # Update with game completion flags
-        db.rooms.update_one(
-            {"_id": room["_id"]},
-            {"$set": {"gameCompleted": True, "active": False}}
-        )
+    from socket_server import broadcast_room_delta, completion_ops
+    await broadcast_room_delta(room, completion_ops(room, user_id))
 
-        # Update room object for final broadcast
-        room["gameCompleted"] = True
-        room["active"] = False
-
-        # Broadcast final game completed state
-        await broadcast_room_update(room)
-        print(f"📡 Broadcasted final game completion for room {room_code}")
-
-        return  # Exit early since we already broadcast
-
-    # Broadcast update
-    room["_id"] = str(room["_id"])
-    if "created_at" in room:
-        room["created_at"] = room["created_at"].isoformat()
-
-    # Import here to avoid circular imports
-    from socket_server import broadcast_room_update
-    await broadcast_room_update(room)
\ No newline at end of file
+    if room.get("gameCompleted"):
+        print(f"🏁 Game completed for room {room_code}! Broadcasted final state")
+    else:
+        print(f"📡 Broadcasted update for room {room_code} - player {user_id} completed")
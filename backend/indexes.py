@@ -0,0 +1,67 @@
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from database import db
+
+# Indexes the hot queries rely on, created once at startup. Each spec is
+# created on its own, so one that conflicts with existing data (e.g. two
+# active rooms sharing a code) is reported without blocking the rest.
+# backend/check_query_plans.py verifies none of those queries scan.
+
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_1", unique=True),
+    ],
+    "problems": [
+        # Detail lookups and run_code go by title
+        IndexModel([("title", ASCENDING)], name="title_unique", unique=True),
+        # Listing pages: equality filter, then _id order for the cursor
+        IndexModel([("difficulty", ASCENDING), ("_id", ASCENDING)], name="difficulty_id"),
+        IndexModel([("tags", ASCENDING), ("_id", ASCENDING)], name="tags_id"),
+    ],
+    "rooms": [
+        # find_room / join / leave / start / cancel look rooms up by code
+        IndexModel([("code", ASCENDING), ("active", ASCENDING)], name="code_active"),
+        # Room codes are only reused once the earlier room is inactive
+        IndexModel(
+            [("code", ASCENDING)],
+            name="code_unique_while_active",
+            unique=True,
+            partialFilterExpression={"active": True},
+        ),
+        # "Which active room is this player in?" (create, join, get_user_room)
+        IndexModel([("players.id", ASCENDING), ("active", ASCENDING)], name="players_id_active"),
+        # Running games with a deadline, which match_clock re-reads
+        IndexModel(
+            [("endsAt", ASCENDING)],
+            name="ends_at_running",
+            partialFilterExpression={"active": True, "started": True},
+        ),
+        # Set when a room is deactivated (see room_repository.ROOM_RETENTION_HOURS);
+        # Mongo deletes the room once it passes
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "presence": [
+        # Shared presence stamps (see presence.py) are only read within a
+        # grace period of being written; drop the ones nobody refreshes
+        IndexModel([("seen_at", ASCENDING)], name="seen_at_ttl", expireAfterSeconds=3600),
+    ],
+    "matchmaking_queue": [
+        # The matching worker reloads the queue in line order every tick
+        IndexModel([("enqueued_at", ASCENDING)], name="enqueued_at"),
+        # Queue length per difficulty for /api/matchmaking/status
+        IndexModel([("difficulty", ASCENDING)], name="difficulty"),
+    ],
+}
+
+
+async def ensure_indexes():
+    """Create every index in INDEXES that doesn't exist yet"""
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+        for index in indexes:
+            name = index.document["name"]
+            try:
+                await collection.create_indexes([index])
+            except OperationFailure as e:
+                print(f"⚠️ Could not create index {collection_name}.{name}: {e}")
+    print("✅ MongoDB indexes ensured")
@@ -0,0 +1,231 @@
+import asyncio
+import math
+import os
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+# Bounded scheduler in front of the code runner. Every /api/code/run call
+# takes a slot per runner job it will start (a sharded submission takes one
+# per shard) before it touches the runner; when not enough slots are free
+# the call waits in a fair queue, and when the queue is full it is rejected
+# straight away with a retry hint instead of timing out.
+
+# Defaults to the runner pool size so jobs never queue inside the container
+MAX_CONCURRENCY = int(os.getenv("CODE_RUN_MAX_CONCURRENCY", os.getenv("RUNNER_POOL_SIZE", "4")))
+MAX_QUEUE = int(os.getenv("CODE_RUN_MAX_QUEUE", "200"))
+# Practice runs are shed first: they are only queued while the queue is
+# below this fraction of MAX_QUEUE, leaving the rest for submissions.
+PRACTICE_QUEUE_FRACTION = float(os.getenv("CODE_RUN_PRACTICE_QUEUE_FRACTION", "0.75"))
+# Queued + running jobs a single user may have at once
+MAX_PENDING_PER_USER = int(os.getenv("CODE_RUN_MAX_PENDING_PER_USER", "2"))
+
+# Recent samples kept for the wait/service time metrics
+METRIC_SAMPLES = 500
+
+
+class QueueFullError(Exception):
+    """Raised when a job can't be queued; carries a retry hint for the client"""
+
+    def __init__(self, message: str, queue_position: int, retry_after: int):
+        super().__init__(message)
+        self.queue_position = queue_position
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    __slots__ = ("future", "user_id", "is_submit", "weight", "enqueued_at")
+
+    def __init__(self, user_id: str, is_submit: bool, weight: int):
+        self.future = asyncio.get_running_loop().create_future()
+        self.user_id = user_id
+        self.is_submit = is_submit
+        self.weight = weight
+        self.enqueued_at = time.monotonic()
+
+
+def _percentile(samples, fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class SubmissionScheduler:
+    """Bounded-concurrency scheduler with priority and fair queuing.
+
+    Submissions (``is_submit=True``) are always dispatched before practice
+    runs. Within each class, jobs are served round-robin across rooms and
+    then round-robin across users inside a room, so one busy room or one
+    click-happy user can't starve everyone else. A job that needs more
+    slots than are free waits at the head of the line until they are, so
+    lighter jobs behind it can't starve it either.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = MAX_CONCURRENCY,
+        max_queue: int = MAX_QUEUE,
+        max_pending_per_user: int = MAX_PENDING_PER_USER,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_pending_per_user = max_pending_per_user
+        # Slots in use, i.e. runner jobs in flight
+        self.running = 0
+        # priority (True = submit) -> room key -> user id -> deque of tickets
+        self._queues = {True: OrderedDict(), False: OrderedDict()}
+        self._depth = {True: 0, False: 0}
+        self._pending_per_user = Counter()
+        # Next ticket to dispatch, waiting for enough slots to free up
+        self._head = None
+
+        self.accepted = 0
+        self.rejected = 0
+        self.completed = 0
+        self._wait_samples = deque(maxlen=METRIC_SAMPLES)
+        self._service_samples = deque(maxlen=METRIC_SAMPLES)
+
+    @property
+    def depth(self) -> int:
+        return self._depth[True] + self._depth[False]
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, room_code: Optional[str] = None, is_submit: bool = False, weight: int = 1):
+        """Hold ``weight`` runner slots (one per concurrent runner job) for the ``async with`` block"""
+        weight = max(1, min(weight, self.max_concurrency))
+        await self._acquire(user_id, room_code, is_submit, weight)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._service_samples.append(time.monotonic() - started)
+            self.completed += 1
+            self._pending_per_user[user_id] -= 1
+            if self._pending_per_user[user_id] <= 0:
+                del self._pending_per_user[user_id]
+            self.running -= weight
+            self._dispatch()
+
+    def retry_after(self) -> int:
+        """Rough seconds until a newly queued job would start"""
+        avg_service = (
+            sum(self._service_samples) / len(self._service_samples)
+            if self._service_samples else 1.0
+        )
+        return max(1, math.ceil(avg_service * (self.depth + 1) / self.max_concurrency))
+
+    def _reject(self, message: str):
+        self.rejected += 1
+        raise QueueFullError(message, queue_position=self.depth + 1, retry_after=self.retry_after())
+
+    async def _acquire(self, user_id: str, room_code: Optional[str], is_submit: bool, weight: int):
+        if self._pending_per_user[user_id] >= self.max_pending_per_user:
+            self._reject("Too many runs in flight for this user")
+
+        # Fast path: enough free slots and nobody waiting ahead of us
+        if self.running + weight <= self.max_concurrency and self.depth == 0:
+            self.running += weight
+            self._pending_per_user[user_id] += 1
+            self.accepted += 1
+            self._wait_samples.append(0.0)
+            return
+
+        limit = self.max_queue if is_submit else int(self.max_queue * PRACTICE_QUEUE_FRACTION)
+        if self.depth >= limit:
+            self._reject("Code runner queue is full")
+
+        ticket = _Ticket(user_id, is_submit, weight)
+        room_key = room_code or f"solo:{user_id}"
+        rooms = self._queues[is_submit]
+        rooms.setdefault(room_key, OrderedDict()).setdefault(user_id, deque()).append(ticket)
+        self._depth[is_submit] += 1
+        self._pending_per_user[user_id] += 1
+        self.accepted += 1
+
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled():
+                # Slots were granted just as the caller gave up; hand them on
+                self.running -= weight
+                self._dispatch()
+            else:
+                # Still queued: _next_ticket skips cancelled tickets lazily.
+                # A heavier job may have been holding back lighter ones
+                # behind it, so let the next one try.
+                self._depth[is_submit] -= 1
+                if ticket is self._head:
+                    self._head = None
+                self._dispatch()
+            self._pending_per_user[user_id] -= 1
+            if self._pending_per_user[user_id] <= 0:
+                del self._pending_per_user[user_id]
+            raise
+
+        self._wait_samples.append(time.monotonic() - ticket.enqueued_at)
+
+    def _next_ticket(self) -> Optional[_Ticket]:
+        for is_submit in (True, False):
+            rooms = self._queues[is_submit]
+            while rooms:
+                room_key, users = next(iter(rooms.items()))
+                user_id, tickets = next(iter(users.items()))
+                ticket = tickets.popleft()
+
+                # Rotate: this user goes to the back of the room, and the
+                # room goes to the back of the line
+                del users[user_id]
+                if tickets:
+                    users[user_id] = tickets
+                del rooms[room_key]
+                if users:
+                    rooms[room_key] = users
+
+                if ticket.future.cancelled():
+                    continue
+                self._depth[is_submit] -= 1
+                return ticket
+        return None
+
+    def _dispatch(self):
+        while self.running < self.max_concurrency:
+            if self._head is None:
+                self._head = self._next_ticket()
+                if self._head is None:
+                    return
+                # Popped from its queue; depth counts it as the head until it starts
+                self._depth[self._head.is_submit] += 1
+            ticket = self._head
+            if ticket.future.cancelled():
+                # Its caller's CancelledError handler does the bookkeeping
+                self._head = None
+                continue
+            if self.running + ticket.weight > self.max_concurrency:
+                return
+            self._head = None
+            self._depth[ticket.is_submit] -= 1
+            self.running += ticket.weight
+            ticket.future.set_result(None)
+
+    def stats(self) -> dict:
+        waits = list(self._wait_samples)
+        return {
+            "running": self.running,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.depth,
+            "queued_submits": self._depth[True],
+            "queued_runs": self._depth[False],
+            "max_queue": self.max_queue,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "wait_ms_avg": round(1000 * sum(waits) / len(waits), 1) if waits else 0.0,
+            "wait_ms_p50": round(1000 * _percentile(waits, 0.5), 1),
+            "wait_ms_p95": round(1000 * _percentile(waits, 0.95), 1),
+            "retry_after_estimate": self.retry_after(),
+        }
+
+
+run_scheduler = SubmissionScheduler()
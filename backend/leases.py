@@ -0,0 +1,50 @@
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+# Named leases in the leases collection, for work only one worker may do at
+# a time when there are several (match_clock, matchmaker). The holder keeps
+# renewing its lease; once it stops (crash, shutdown), another worker's
+# claim succeeds as soon as the lease has run out.
+
+
+class Lease:
+    """One named lease document, claimed and renewed by this worker"""
+
+    def __init__(self, collection, name: str, seconds: float):
+        self._collection = collection
+        self.name = name
+        self.seconds = seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.held = False
+        self._held_until = 0.0
+        # Claims in between are answered from the last result, so callers
+        # may ask every tick without writing every tick
+        self._next_claim = 0.0
+
+    async def claim(self) -> bool:
+        """Take or renew the lease; True while this worker holds it"""
+        if time.monotonic() < self._next_claim:
+            return self.held
+        now = datetime.utcnow()
+        try:
+            await self._collection.update_one(
+                {"_id": self.name, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.seconds)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            self.held = False  # another worker holds it
+        except PyMongoError as e:
+            print(f"⚠️ Could not renew the {self.name} lease: {e}")
+            # Keep going until our last renewal runs out
+            self.held = self.held and time.monotonic() < self._held_until
+            return self.held
+        else:
+            self.held = True
+            self._held_until = time.monotonic() + self.seconds
+        self._next_claim = time.monotonic() + self.seconds / 5
+        return self.held
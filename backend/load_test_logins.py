@@ -0,0 +1,74 @@
+"""Show event-loop lag during a login storm, with bcrypt inline vs on the
+password_hashing thread pool.
+
+Run from the backend directory: python load_test_logins.py
+(standalone: needs neither MongoDB nor a running server)
+
+A probe task sleeps PROBE_INTERVAL in a loop and records how late it wakes
+up; that lateness is what every Socket.IO connection would see too.
+"""
+import asyncio
+import time
+
+from password_hashing import PasswordHasher, pwd_context
+
+CONCURRENT_LOGINS = 100
+PASSWORD = "correct horse battery staple"
+PROBE_INTERVAL = 0.005
+
+
+async def probe_lag(samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        expected = time.perf_counter() + PROBE_INTERVAL
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append(max(0.0, time.perf_counter() - expected))
+
+
+async def storm(verify) -> tuple:
+    """Run CONCURRENT_LOGINS verifications at once; returns (seconds, lag samples)"""
+    samples = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_lag(samples, stop))
+    await asyncio.sleep(PROBE_INTERVAL * 4)  # baseline samples before the storm
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(verify() for _ in range(CONCURRENT_LOGINS)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await probe
+    assert all(results)
+    return elapsed, samples
+
+
+def summarize(label: str, elapsed: float, samples: list):
+    ordered = sorted(samples)
+    p50 = ordered[len(ordered) // 2]
+    p99 = ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))]
+    print(
+        f"  {label:<22} {elapsed:6.2f}s total, loop lag p50 {p50 * 1000:7.1f} ms, "
+        f"p99 {p99 * 1000:7.1f} ms, max {ordered[-1] * 1000:7.1f} ms ({len(ordered)} probes)"
+    )
+
+
+async def main():
+    hashed = pwd_context.hash(PASSWORD)
+
+    async def inline_verify():
+        # What login used to do: bcrypt on the event loop thread
+        return pwd_context.verify(PASSWORD, hashed)
+
+    hasher = PasswordHasher()
+
+    async def pooled_verify():
+        return await hasher.verify(PASSWORD, hashed)
+
+    print(f"{CONCURRENT_LOGINS} concurrent logins:")
+    summarize("inline bcrypt", *await storm(inline_verify))
+    summarize(f"thread pool ({hasher.workers} workers)", *await storm(pooled_verify))
+    print(f"  pool stats: {hasher.stats()}")
+    hasher.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
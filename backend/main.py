@@ -1,15 +1,21 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr
-from database import db
+from database import db, connect_database, close_database
+from indexes import ensure_indexes
+from room_engine import ROOM_STATE_ENGINE, room_engine
+from presence import presence
+from match_clock import match_clock
+from matchmaker import matchmaker
+from problem_catalog import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, ProblemDetail, problem_catalog
+from bson.errors import InvalidId
 from jose import JWTError, jwt
-from passlib.context import CryptContext
+from password_hashing import HashingBusyError, password_hasher
 from datetime import datetime, timedelta
 from typing import Optional
 from dotenv import load_dotenv
 import os
-from bson import ObjectId
 from fastapi import Path
 
 
@@ -34,13 +40,33 @@ app.add_middleware(
 
 # MongoDB connection is handled in database.py
 users_collection = db.users
-try:
-    users_collection.create_index([("email", 1)], unique=True)
-except Exception:
-    pass  # Index may already exist
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+@app.on_event("startup")
+async def startup():
+    await connect_database()
+    await ensure_indexes()
+    await problem_catalog.start()
+    if ROOM_STATE_ENGINE == "memory":
+        await room_engine.start()
+    # Re-arm deadlines of games that were running before a restart
+    await match_clock.start()
+    await presence.start()
+    await matchmaker.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await problem_catalog.stop()
+    await matchmaker.stop()
+    await match_clock.stop()
+    await presence.stop()
+    # Send room deltas still waiting for their coalescing window
+    await room_broadcaster.flush_all()
+    # Persist live room state that hasn't been written behind yet
+    await room_engine.stop()
+    # Submission records still being written in the background
+    await flush_submission_records()
+    password_hasher.shutdown()
+    close_database()
 
 # Models
 class UserCreate(BaseModel):
@@ -57,11 +83,26 @@ class TokenData(BaseModel):
 # OAuth2
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
-def verify_password(plain, hashed):
-    return pwd_context.verify(plain, hashed)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
+# bcrypt runs on password_hasher's thread pool so it never blocks the event loop
+async def verify_password(plain, hashed):
+    try:
+        return await password_hasher.verify(plain, hashed)
+    except HashingBusyError as e:
+        raise password_busy(e)
+
+async def get_password_hash(password):
+    try:
+        return await password_hasher.hash(password)
+    except HashingBusyError as e:
+        raise password_busy(e)
+
+def password_busy(e: HashingBusyError) -> HTTPException:
+    print(f"🚦 Password hashing saturated: {e}")
+    return HTTPException(
+        status_code=503,
+        detail="Too many sign-ins right now, please retry shortly",
+        headers={"Retry-After": str(e.retry_after)},
+    )
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -70,28 +111,30 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 # get_current_user function moved to auth.py
-from auth import get_current_user
+from auth import get_current_user, principal_cache
 
 # Routes
 @app.post("/api/auth/signup", response_model=Token)
 async def signup(user: UserCreate):
-    if users_collection.find_one({"email": user.email}):
+    if await users_collection.find_one({"email": user.email}):
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = get_password_hash(user.password)
-    users_collection.insert_one({
+    hashed_password = await get_password_hash(user.password)
+    await users_collection.insert_one({
         "email": user.email,
         "hashed_password": hashed_password,
         "created_at": datetime.utcnow()
     })
+    # A re-created account must not resolve to a cached copy of the old one
+    principal_cache.invalidate_user(user.email)
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     token = create_access_token(data={"sub": user.email}, expires_delta=access_token_expires)
     return {"access_token": token, "token_type": "bearer"}
 
 @app.post("/api/auth/login", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = users_collection.find_one({"email": form_data.username})
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    user = await users_collection.find_one({"email": form_data.username})
+    if not user or not await verify_password(form_data.password, user["hashed_password"]):
         raise HTTPException(status_code=401, detail="Incorrect email or password")
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     token = create_access_token(data={"sub": form_data.username}, expires_delta=access_token_expires)
@@ -101,39 +144,78 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
 async def read_users_me(current_user = Depends(get_current_user)):
     return {"email": current_user["email"]}
 
+@app.get("/api/auth/hashing")
+async def get_password_hashing_stats():
+    """Worker usage and queueing of the bcrypt thread pool"""
+    return password_hasher.stats()
+
+@app.get("/api/auth/cache")
+async def get_principal_cache_stats():
+    """Hit rate and size of the token -> user cache in auth.py"""
+    return principal_cache.stats()
+
+
 
+# Seconds browsers may reuse a listing page before revalidating it
+PROBLEM_LIST_MAX_AGE = int(os.getenv("PROBLEM_LIST_MAX_AGE", "30"))
 
 @app.get("/api/problems")
-async def get_problems():
-    problems = list(db.problems.find({}, {"title": 1, "difficulty": 1}))
-    for p in problems:
-        p["_id"] = str(p["_id"])  # convert ObjectId -> string
-    return problems
+async def get_problems(
+    request: Request,
+    difficulty: Optional[str] = None,
+    tag: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    """One page of {_id, title, difficulty, tags} rows plus next_cursor (null on the last page)"""
+    try:
+        page = await problem_catalog.get_listing_page(difficulty, tag, cursor, limit)
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    headers = {"ETag": page.etag, "Cache-Control": f"private, max-age={PROBLEM_LIST_MAX_AGE}"}
+    if etag_matches(request.headers.get("if-none-match"), page.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=page.body, media_type="application/json", headers=headers)
+
+@app.get("/api/problems/cache")
+async def get_problem_cache_stats():
+    """Problem catalog cache mode, size and hit/miss counters"""
+    return problem_catalog.stats()
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+def problem_detail_response(detail: Optional[ProblemDetail], request: Request) -> Response:
+    """Statement, template and sample cases; hidden test cases never leave the server"""
+    if not detail:
+        raise HTTPException(status_code=404, detail="Problem not found")
+    # Browsers revalidate every time, but an unchanged problem costs a bodiless 304
+    headers = {"ETag": detail.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), detail.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=detail.body, media_type="application/json", headers=headers)
 
 @app.get("/api/problems/title/{title}")
-async def get_problem_by_title(title: str):
-    problem = db.problems.find_one({"title": title})
-    if not problem:
-        raise HTTPException(status_code=404, detail="Problem not found")
-    problem["_id"] = str(problem["_id"])
-    return problem
+async def get_problem_by_title(title: str, request: Request):
+    return problem_detail_response(await problem_catalog.get_detail_by_title(title), request)
 
 @app.get("/api/problems/id/{problem_id}")
-async def get_problem_by_id(problem_id: str):
-    problem = db.problems.find_one({"_id": ObjectId(problem_id)})
-    if not problem:
-        raise HTTPException(status_code=404, detail="Problem not found")
-    problem["_id"] = str(problem["_id"])
-    return problem
+async def get_problem_by_id(problem_id: str, request: Request):
+    return problem_detail_response(await problem_catalog.get_detail_by_id(problem_id), request)
 
 from rooms import router as rooms_router
-from code_execution import router as code_router
+from code_execution import flush_submission_records, router as code_router
+from matchmaking import router as matchmaking_router
 
 app.include_router(rooms_router)
 app.include_router(code_router)
+app.include_router(matchmaking_router)
 
 
-from socket_server import sio
+from socket_server import sio, room_broadcaster
 import socketio
 
 # Wrap FastAPI with Socket.IO
@@ -0,0 +1,236 @@
+import asyncio
+import os
+import time
+from typing import Optional
+from database import db
+from leases import Lease
+from room_engine import ROOM_STATE_ENGINE, room_store
+
+# Server-side match clock. Starting a game gives the room an endsAt
+# deadline (epoch ms); when it passes, the game ends with timeUp set, even
+# if players are still working. Deadlines live in a hashed timer wheel:
+# arming and cancelling are dict operations on one slot, and each tick
+# only looks at the slot for that second, so thousands of concurrent
+# matches cost next to nothing between events.
+#
+# Clients count down locally from endsAt. Instead of them polling, the
+# clock sends a match_tick {code, remaining, endsAt} at a few marks
+# (MATCH_TICK_MARKS seconds before the end) to keep them in step.
+#
+# On startup every running game is re-armed from its persisted endsAt;
+# deadlines that passed while the server was down fire on the first tick.
+#
+# With several workers (ROOM_STATE_ENGINE=mongo) only one of them runs the
+# clock, so each tick goes out once: the worker holding the lease document
+# in the leases collection. It renews the lease and re-reads the running
+# games every MATCH_CLOCK_SYNC_SECONDS, which picks up games started on
+# other workers and drops ones that ended there. If it dies, another worker
+# takes over once MATCH_CLOCK_LEASE_SECONDS pass without a renewal.
+
+MATCH_DURATION_SECONDS = int(os.getenv("MATCH_DURATION_SECONDS", "1800"))
+MATCH_TICK_MARKS = (600, 300, 120, 60, 30, 10)
+# Wheel resolution and size: one slot per second, wrapping every WHEEL_SLOTS
+# seconds; longer deadlines just stay in their slot for another lap
+TICK_MS = 1000
+WHEEL_SLOTS = 512
+MATCH_CLOCK_SYNC_SECONDS = float(os.getenv("MATCH_CLOCK_SYNC_SECONDS", "5"))
+MATCH_CLOCK_LEASE_SECONDS = float(os.getenv("MATCH_CLOCK_LEASE_SECONDS", "15"))
+CLOCK_LEASE_ID = "match_clock"
+
+
+class TimerWheel:
+    """Hashed timer wheel keyed by name with O(1) arm and cancel"""
+
+    def __init__(self, tick_ms: int = TICK_MS, slots: int = WHEEL_SLOTS, now_ms: Optional[int] = None):
+        self.tick_ms = tick_ms
+        self._slots = [{} for _ in range(slots)]
+        # key -> slot index holding it
+        self._where = {}
+        # Next tick to process
+        self._tick = (now_ms if now_ms is not None else _now_ms()) // tick_ms
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, key) -> bool:
+        return key in self._where
+
+    def arm(self, key, due_ms: int, payload=None):
+        """Fire ``key`` at ``due_ms``, replacing any timer it already has"""
+        self.cancel(key)
+        # Round up so nothing fires before it is due; overdue timers go in
+        # the next slot to be processed
+        tick = max(-(-due_ms // self.tick_ms), self._tick)
+        slot = tick % len(self._slots)
+        self._slots[slot][key] = (tick, payload)
+        self._where[key] = slot
+
+    def cancel(self, key) -> bool:
+        slot = self._where.pop(key, None)
+        if slot is None:
+            return False
+        del self._slots[slot][key]
+        return True
+
+    def advance(self, now_ms: int) -> list:
+        """Pop every timer due by ``now_ms`` as (key, payload)"""
+        now_tick = now_ms // self.tick_ms
+        if now_tick < self._tick:
+            return []
+        due = []
+        # Past one full lap every slot has been visited once
+        for step in range(min(now_tick - self._tick + 1, len(self._slots))):
+            bucket = self._slots[(self._tick + step) % len(self._slots)]
+            for key, (tick, payload) in list(bucket.items()):
+                if tick <= now_tick:
+                    del bucket[key]
+                    del self._where[key]
+                    due.append((key, payload))
+        self._tick = now_tick + 1
+        return due
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class MatchClock:
+    """Drives match deadlines: sparse tick events, then the time-up transition"""
+
+    def __init__(self, leases=None):
+        self._wheel = TimerWheel()
+        # room code -> the deadline it is armed for
+        self._deadlines = {}
+        self._runner = None
+        # Lease shared by the workers, or None when this is the only one and
+        # always runs the clock
+        self._lease = Lease(leases, CLOCK_LEASE_ID, MATCH_CLOCK_LEASE_SECONDS) if leases is not None else None
+        self.owner = self._lease is None
+        self._next_sync = 0.0
+
+        self.ticks_sent = 0
+        self.time_ups = 0
+        self.rehydrated = 0
+        self._max_lag_ms = 0
+
+    def arm(self, room_code: str, ends_at: int):
+        """Start (or restart) the clock for ``room_code``"""
+        if not self.owner:
+            return  # the lease holder picks it up on its next sync
+        self._deadlines[room_code] = ends_at
+        self._schedule(room_code, ends_at, _now_ms())
+
+    def cancel(self, room_code: str):
+        """Stop the clock, e.g. because the game ended before its deadline"""
+        self._deadlines.pop(room_code, None)
+        self._wheel.cancel(room_code)
+
+    def _schedule(self, room_code: str, ends_at: int, now_ms: int, fired: Optional[int] = None):
+        # The next mark still ahead of us, else the deadline itself (mark 0);
+        # never the one that just fired
+        for mark in MATCH_TICK_MARKS:
+            due = ends_at - mark * 1000
+            if due > now_ms and (fired is None or mark < fired):
+                self._wheel.arm(room_code, due, (ends_at, mark))
+                return
+        self._wheel.arm(room_code, ends_at, (ends_at, 0))
+
+    # ---------------------------
+    # Lifecycle
+    # ---------------------------
+
+    async def start(self):
+        if self._runner is not None:
+            return
+        self.rehydrated = await self._sync()
+        if self.rehydrated:
+            print(f"⏱️ Re-armed match clocks for {self.rehydrated} running games")
+        self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            self._runner = None
+
+    async def _run(self):
+        while True:
+            # Wake just after each tick boundary
+            now = _now_ms()
+            await asyncio.sleep((TICK_MS - now % TICK_MS) / 1000)
+            if self._lease is not None and time.monotonic() >= self._next_sync:
+                try:
+                    await self._sync()
+                except Exception as e:
+                    print(f"⚠️ Match clock sync failed: {e}")
+            now = _now_ms()
+            for room_code, (ends_at, mark) in self._wheel.advance(now):
+                # Cancelled or re-armed while an earlier event was awaited
+                if self._deadlines.get(room_code) != ends_at:
+                    continue
+                self._max_lag_ms = max(self._max_lag_ms, now - (ends_at - mark * 1000))
+                try:
+                    if mark:
+                        await self._tick(room_code, ends_at, mark)
+                        # Only if nothing cancelled or re-armed it during the emit
+                        if self._deadlines.get(room_code) == ends_at and room_code not in self._wheel:
+                            self._schedule(room_code, ends_at, now, fired=mark)
+                    else:
+                        del self._deadlines[room_code]
+                        await self._time_up(room_code, ends_at)
+                except Exception as e:
+                    print(f"⚠️ Match clock event for {room_code} failed: {e}")
+
+    async def _sync(self) -> int:
+        """Claim the clock and arm every running game it doesn't have yet; returns how many"""
+        self._next_sync = time.monotonic() + MATCH_CLOCK_SYNC_SECONDS
+        owner = await self._lease.claim() if self._lease is not None else True
+        if owner != self.owner:
+            print(f"⏱️ This worker {'now runs' if owner else 'no longer runs'} the match clocks")
+            self.owner = owner
+        if not owner:
+            for room_code in list(self._deadlines):
+                self.cancel(room_code)
+            return 0
+
+        known = dict(self._deadlines)
+        running = {room["code"]: room["endsAt"] for room in await room_store.find_timed_rooms()}
+        # Games that ended on another worker; ones armed during the query stay
+        for room_code, ends_at in known.items():
+            if room_code not in running and self._deadlines.get(room_code) == ends_at:
+                self.cancel(room_code)
+        armed = 0
+        for room_code, ends_at in running.items():
+            if self._deadlines.get(room_code) != ends_at:
+                self.arm(room_code, ends_at)
+                armed += 1
+        return armed
+
+    async def _tick(self, room_code: str, ends_at: int, remaining: int):
+        # Import here to avoid circular imports
+        from socket_server import sio
+        self.ticks_sent += 1
+        await sio.emit("match_tick", {"code": room_code, "remaining": remaining, "endsAt": ends_at}, to=room_code)
+
+    async def _time_up(self, room_code: str, ends_at: int):
+        from socket_server import broadcast_room_delta
+        room = await room_store.expire_room(room_code, ends_at)
+        if room is None:
+            return  # finished (or restarted) in the meantime
+        self.time_ups += 1
+        print(f"⏰ Time is up in room {room_code}")
+        await broadcast_room_delta(room, [{"op": "time_up"}, {"op": "game_completed"}, {"op": "room_closed"}])
+
+    def stats(self) -> dict:
+        return {
+            "armed": len(self._wheel),
+            "ticks_sent": self.ticks_sent,
+            "time_ups": self.time_ups,
+            "rehydrated": self.rehydrated,
+            "owner": self.owner,
+            "max_lag_ms": self._max_lag_ms,
+            "default_duration_seconds": MATCH_DURATION_SECONDS,
+        }
+
+
+# A single worker has nobody to share the clock with
+match_clock = MatchClock(leases=db.leases if ROOM_STATE_ENGINE != "memory" else None)
@@ -0,0 +1,423 @@
+import asyncio
+import heapq
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Optional
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from database import db
+from leases import Lease
+from room_engine import ROOM_STATE_ENGINE, room_store
+from room_repository import generate_room_code, serialize_room
+
+# Quick play. Players wait in one queue per difficulty preference ("any"
+# players are wildcards every difficulty can draw on). Every
+# MATCHMAKING_TICK_MS the matcher sorts each queue by rating and groups
+# neighbours whose ratings are close enough. The accepted spread starts at
+# MATCHMAKING_RATING_WINDOW and widens the longer someone has waited, so
+# nobody waits forever on an empty rating band.
+#
+# A matched group is taken out of the queue before anything is awaited, so
+# a player is never handed to two rooms. Their room is then created already
+# started, in a single insert, with the match clock armed. Each player is
+# told over Socket.IO through their personal user channel (see
+# socket_server.user_channel). If creating the room fails, the group goes
+# back into the queue and keeps its place.
+#
+# With a single worker the queue lives in this process; run
+# bench_matchmaking.py to see how it holds up under load. With several
+# (ROOM_STATE_ENGINE=mongo) players may queue on any of them, so tickets go
+# into the matchmaking_queue collection and only the worker holding the
+# matchmaker lease pairs them: every tick it reloads the queue, pairs as
+# above, and claims each group's tickets atomically before creating its
+# room, so a ticket cancelled on another worker in the meantime is never
+# matched.
+
+MATCHMAKING_TICK_MS = int(os.getenv("MATCHMAKING_TICK_MS", "250"))
+MATCHMAKING_ROOM_SIZE = int(os.getenv("MATCHMAKING_ROOM_SIZE", "2"))
+MATCHMAKING_MAX_QUEUE = int(os.getenv("MATCHMAKING_MAX_QUEUE", "20000"))
+# Rating spread accepted right away, and how much it widens per second waited
+MATCHMAKING_RATING_WINDOW = float(os.getenv("MATCHMAKING_RATING_WINDOW", "100"))
+MATCHMAKING_WINDOW_GROWTH = float(os.getenv("MATCHMAKING_WINDOW_GROWTH", "50"))
+# Until players have ratings everyone sits at this one
+DEFAULT_RATING = 1200.0
+MATCHMAKING_LEASE_SECONDS = float(os.getenv("MATCHMAKING_LEASE_SECONDS", "15"))
+MATCHMAKER_LEASE_ID = "matchmaker"
+
+DIFFICULTIES = ("Easy", "Medium", "Hard")
+ANY_DIFFICULTY = "any"
+QUEUE_DIFFICULTIES = DIFFICULTIES + (ANY_DIFFICULTY,)
+
+# Recent waits kept for the latency percentiles in stats
+LATENCY_SAMPLES = 2000
+
+
+class MatchmakingFullError(Exception):
+    """Raised when MATCHMAKING_MAX_QUEUE players are already waiting"""
+
+
+class QueueTicket:
+    __slots__ = ("user_id", "username", "difficulty", "rating", "enqueued_at", "queued_at")
+
+    def __init__(
+        self,
+        user_id: str,
+        username: str,
+        difficulty: str,
+        rating: float,
+        enqueued_at: float,
+        queued_at: Optional[float] = None,
+    ):
+        self.user_id = user_id
+        self.username = username
+        self.difficulty = difficulty
+        self.rating = rating
+        self.enqueued_at = enqueued_at
+        # The same moment on the wall clock, which every worker can compare
+        self.queued_at = time.time() - (time.monotonic() - enqueued_at) if queued_at is None else queued_at
+
+    def window(self, now: float) -> float:
+        """Rating spread this player accepts after waiting until ``now``"""
+        return MATCHMAKING_RATING_WINDOW + MATCHMAKING_WINDOW_GROWTH * (now - self.enqueued_at)
+
+    def to_doc(self) -> dict:
+        return {
+            "_id": self.user_id,
+            "username": self.username,
+            "difficulty": self.difficulty,
+            "rating": self.rating,
+            "enqueued_at": self.queued_at,
+        }
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "QueueTicket":
+        enqueued_at = time.monotonic() - (time.time() - doc["enqueued_at"])
+        return cls(doc["_id"], doc["username"], doc["difficulty"], doc["rating"], enqueued_at, doc["enqueued_at"])
+
+
+class Matchmaker:
+    """Difficulty-bucketed, rating-sorted matcher that pairs players on a tick"""
+
+    def __init__(
+        self,
+        create_match=None,
+        notify=None,
+        tick_ms: int = MATCHMAKING_TICK_MS,
+        room_size: int = MATCHMAKING_ROOM_SIZE,
+        max_queue: int = MATCHMAKING_MAX_QUEUE,
+        shared_queue=None,
+        leases=None,
+    ):
+        # create_match(tickets, difficulty) -> room and notify(tickets, room);
+        # the benchmark swaps in its own
+        self._create_match = create_match or create_match_room
+        self._notify = notify or notify_match
+        self.tick_ms = tick_ms
+        self.room_size = room_size
+        self.max_queue = max_queue
+        # difficulty -> {user id: ticket}, oldest first. With a shared queue
+        # this is the lease holder's copy, reloaded every tick.
+        self._queues = {difficulty: {} for difficulty in QUEUE_DIFFICULTIES}
+        self._tickets = {}
+        self._runner = None
+        # Ticket collection and lease shared by the workers, or None when
+        # this is the only one
+        self._shared = shared_queue
+        self._lease = Lease(leases, MATCHMAKER_LEASE_ID, MATCHMAKING_LEASE_SECONDS) if leases is not None else None
+
+        self.ticks = 0
+        self.matches = 0
+        self.matched_players = 0
+        self.failed_matches = 0
+        self._waits = deque(maxlen=LATENCY_SAMPLES)
+        # Whole ticks (pairing plus creating the rooms) and the pairing alone
+        self._last_tick_ms = 0.0
+        self._max_tick_ms = 0.0
+        self._max_pair_ms = 0.0
+
+    def __len__(self) -> int:
+        return len(self._tickets)
+
+    # ---------------------------
+    # Queue
+    # ---------------------------
+
+    async def enqueue(
+        self,
+        user_id: str,
+        username: str,
+        difficulty: str = ANY_DIFFICULTY,
+        rating: Optional[float] = None,
+    ) -> QueueTicket:
+        """Queue ``user_id``, replacing any ticket they already have"""
+        if difficulty not in self._queues:
+            raise ValueError(f"Unknown difficulty {difficulty!r}")
+        ticket = QueueTicket(
+            user_id,
+            username,
+            difficulty,
+            DEFAULT_RATING if rating is None else rating,
+            time.monotonic(),
+        )
+        if self._shared is not None:
+            queued = await self._shared.estimated_document_count()
+            if queued >= self.max_queue and await self._shared.find_one({"_id": user_id}, {"_id": 1}) is None:
+                raise MatchmakingFullError(f"{queued} players already queued")
+            await self._shared.replace_one({"_id": user_id}, ticket.to_doc(), upsert=True)
+            return ticket
+        if user_id not in self._tickets and len(self._tickets) >= self.max_queue:
+            raise MatchmakingFullError(f"{len(self._tickets)} players already queued")
+        self._dequeue(user_id)
+        self._put(ticket)
+        return ticket
+
+    async def cancel(self, user_id: str) -> bool:
+        """Take ``user_id`` out of the queue; False if they weren't waiting"""
+        removed = self._dequeue(user_id)
+        if self._shared is not None:
+            removed = (await self._shared.delete_one({"_id": user_id})).deleted_count > 0
+        return removed
+
+    async def ticket(self, user_id: str) -> Optional[QueueTicket]:
+        if self._shared is not None:
+            doc = await self._shared.find_one({"_id": user_id})
+            return QueueTicket.from_doc(doc) if doc else None
+        return self._tickets.get(user_id)
+
+    async def queued(self, difficulty: str) -> int:
+        if self._shared is not None:
+            return await self._shared.count_documents({"difficulty": difficulty})
+        return len(self._queues[difficulty])
+
+    def _dequeue(self, user_id: str) -> bool:
+        ticket = self._tickets.pop(user_id, None)
+        if ticket is None:
+            return False
+        del self._queues[ticket.difficulty][user_id]
+        return True
+
+    def _put(self, ticket: QueueTicket):
+        self._tickets[ticket.user_id] = ticket
+        self._queues[ticket.difficulty][ticket.user_id] = ticket
+
+    def _requeue(self, tickets: list):
+        """Put ``tickets`` back where their enqueue time places them in line"""
+        by_difficulty = {}
+        for ticket in sorted(tickets, key=lambda ticket: ticket.enqueued_at):
+            self._tickets[ticket.user_id] = ticket
+            by_difficulty.setdefault(ticket.difficulty, []).append(ticket)
+        for difficulty, returning in by_difficulty.items():
+            # Both sides are already in enqueue order
+            merged = heapq.merge(self._queues[difficulty].values(), returning, key=lambda ticket: ticket.enqueued_at)
+            self._queues[difficulty] = {ticket.user_id: ticket for ticket in merged}
+
+    # ---------------------------
+    # Matching
+    # ---------------------------
+
+    def _pair(self, now: float) -> list:
+        """Pick this tick's groups as (difficulty, tickets) and dequeue them"""
+        matches = []
+        wildcards = self._queues[ANY_DIFFICULTY]
+        # Concrete difficulties first, so wildcards fill their gaps; whatever
+        # wildcards are left then play each other on a random problem
+        for difficulty in QUEUE_DIFFICULTIES:
+            if difficulty == ANY_DIFFICULTY:
+                pool = list(wildcards.values())
+            elif self._queues[difficulty]:
+                pool = list(self._queues[difficulty].values()) + list(wildcards.values())
+            else:
+                continue
+            if len(pool) < self.room_size:
+                continue
+            pool.sort(key=lambda ticket: ticket.rating)
+            i = 0
+            while i + self.room_size <= len(pool):
+                group = pool[i:i + self.room_size]
+                # The most patient player in the group sets how far it may stretch
+                reach = max(ticket.window(now) for ticket in group)
+                if group[-1].rating - group[0].rating <= reach:
+                    for ticket in group:
+                        self._dequeue(ticket.user_id)
+                    matches.append((None if difficulty == ANY_DIFFICULTY else difficulty, group))
+                    i += self.room_size
+                else:
+                    i += 1
+        return matches
+
+    async def match_once(self) -> int:
+        """Run one tick; returns how many groups were matched"""
+        started = time.perf_counter()
+        if self._shared is not None:
+            if not await self._lease.claim():
+                # Another worker does the matching
+                self._queues = {difficulty: {} for difficulty in QUEUE_DIFFICULTIES}
+                self._tickets = {}
+                return 0
+            await self._load_queue()
+            started = time.perf_counter()
+        matches = self._pair(time.monotonic())
+        self._max_pair_ms = max(self._max_pair_ms, (time.perf_counter() - started) * 1000)
+        if self._shared is not None and matches:
+            claimed = await asyncio.gather(*(self._claim_group(group) for _, group in matches))
+            matches = [match for match, ok in zip(matches, claimed) if ok]
+        if matches:
+            await asyncio.gather(*(self._start_match(difficulty, group) for difficulty, group in matches))
+        self.ticks += 1
+        self._last_tick_ms = (time.perf_counter() - started) * 1000
+        self._max_tick_ms = max(self._max_tick_ms, self._last_tick_ms)
+        return len(matches)
+
+    async def _load_queue(self):
+        """Replace this worker's copy of the queue with the shared one"""
+        self._queues = {difficulty: {} for difficulty in QUEUE_DIFFICULTIES}
+        self._tickets = {}
+        docs = await self._shared.find({}).sort("enqueued_at", 1).to_list(length=None)
+        for doc in docs:
+            if doc.get("difficulty") in self._queues:
+                self._put(QueueTicket.from_doc(doc))
+
+    async def _claim_group(self, group: list) -> bool:
+        """Take the group's tickets out of the shared queue; False if one was gone"""
+        claimed = []
+        for ticket in group:
+            # Only the ticket we paired, not one they queued again since
+            result = await self._shared.delete_one({"_id": ticket.user_id, "enqueued_at": ticket.queued_at})
+            if result.deleted_count:
+                claimed.append(ticket.to_doc())
+        if len(claimed) == len(group):
+            return True
+        await self._put_back(claimed)
+        return False
+
+    async def _put_back(self, docs: list):
+        """Return tickets to the shared queue, unless they queued again meanwhile"""
+        if not docs:
+            return
+        try:
+            await self._shared.insert_many(docs, ordered=False)
+        except BulkWriteError:
+            pass  # the ones that queued again keep their new ticket
+
+    async def _start_match(self, difficulty: Optional[str], group: list):
+        try:
+            room = await self._create_match(group, difficulty)
+        except Exception as e:
+            print(f"⚠️ Could not create a room for a quick-play match: {e}")
+            self.failed_matches += 1
+            # Back in line at their original place, unless they queued again
+            # in the meantime
+            if self._shared is not None:
+                await self._put_back([ticket.to_doc() for ticket in group])
+            else:
+                self._requeue([ticket for ticket in group if ticket.user_id not in self._tickets])
+            return
+        now = time.monotonic()
+        self.matches += 1
+        self.matched_players += len(group)
+        self._waits.extend(now - ticket.enqueued_at for ticket in group)
+        await self._notify(group, room)
+
+    # ---------------------------
+    # Lifecycle
+    # ---------------------------
+
+    async def start(self):
+        if self._runner is None:
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            self._runner = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick_ms / 1000)
+            try:
+                await self.match_once()
+            except Exception as e:
+                print(f"⚠️ Matchmaking tick failed: {e}")
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+
+        def percentile(q: float) -> Optional[int]:
+            if not waits:
+                return None
+            return round(waits[int(q * (len(waits) - 1))] * 1000)
+
+        return {
+            "queued": {difficulty: len(queue) for difficulty, queue in self._queues.items()},
+            "ticks": self.ticks,
+            "matches": self.matches,
+            "matched_players": self.matched_players,
+            "failed_matches": self.failed_matches,
+            "wait_p50_ms": percentile(0.5),
+            "wait_p99_ms": percentile(0.99),
+            "last_tick_ms": round(self._last_tick_ms, 2),
+            "max_tick_ms": round(self._max_tick_ms, 2),
+            "max_pair_ms": round(self._max_pair_ms, 2),
+            "tick_ms": self.tick_ms,
+            "room_size": self.room_size,
+            # Whether this worker pairs players (always, without a shared queue)
+            "matching": self._lease is None or self._lease.held,
+        }
+
+
+async def create_match_room(tickets: list, difficulty: Optional[str]) -> dict:
+    """Create the matched group's room, already started, in one insert"""
+    # Import here to avoid circular imports
+    from problem_catalog import problem_catalog
+    from match_clock import MATCH_DURATION_SECONDS, match_clock
+    from presence import presence
+
+    problem = await problem_catalog.random_problem(difficulty)
+    if problem is None:
+        raise LookupError(f"No {difficulty or 'problems'} problems to play")
+    ends_at = int((time.time() + MATCH_DURATION_SECONDS) * 1000)
+
+    # A clashing code is rejected by insert_room; draw another one
+    while True:
+        room = {
+            "problemId": problem["title"],
+            "hostId": tickets[0].user_id,
+            "code": generate_room_code(),
+            "players": [
+                {"id": ticket.user_id, "name": ticket.username, "score": 0, "completed": False, "completedAt": None}
+                for ticket in tickets
+            ],
+            "started": True,
+            "active": True,
+            "matchmade": True,
+            "endsAt": ends_at,
+            "created_at": datetime.utcnow(),
+        }
+        try:
+            await room_store.insert_room(room)
+            break
+        except DuplicateKeyError:
+            print(f"🔁 Room code {room['code']} is taken, retrying")
+
+    match_clock.arm(room["code"], ends_at)
+    for ticket in tickets:
+        # Swept unless their socket joins the room within the grace period
+        presence.expect(ticket.user_id, room["code"])
+    print(f"🤝 Matched {', '.join(ticket.user_id for ticket in tickets)} in room {room['code']}")
+    return serialize_room(room)
+
+
+async def notify_match(tickets: list, room: dict):
+    """Send match_found {room} to every socket of each matched player"""
+    from socket_server import sio, user_channel
+    for ticket in tickets:
+        await sio.emit("match_found", {"room": room}, to=user_channel(ticket.user_id))
+
+
+# A single worker keeps the queue to itself
+_shared = ROOM_STATE_ENGINE != "memory"
+matchmaker = Matchmaker(
+    shared_queue=db.matchmaking_queue if _shared else None,
+    leases=db.leases if _shared else None,
+)
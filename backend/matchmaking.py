@@ -0,0 +1,77 @@
+from fastapi import APIRouter, HTTPException, Depends
+from typing import Optional
+import time
+from auth import get_current_user
+from socket_server import broadcast_room_delta, departure_ops
+from room_engine import room_store
+from presence import presence
+from matchmaker import ANY_DIFFICULTY, QUEUE_DIFFICULTIES, MatchmakingFullError, matchmaker
+from room_repository import serialize_room
+
+router = APIRouter(prefix="/api/matchmaking", tags=["matchmaking"])
+
+# Seconds a client is told to wait when the queue is full
+QUEUE_FULL_RETRY_AFTER = 5
+
+@router.post("/enqueue")
+async def enqueue(
+    userId: str,
+    username: str,
+    difficulty: str = ANY_DIFFICULTY,
+    rating: Optional[float] = None,
+    current_user=Depends(get_current_user),
+):
+    """Join the quick-play queue; match_found arrives over Socket.IO once paired"""
+    if difficulty not in QUEUE_DIFFICULTIES:
+        raise HTTPException(status_code=400, detail=f"difficulty must be one of {', '.join(QUEUE_DIFFICULTIES)}")
+
+    # Queued players can't also be in a room. A game they're playing has to
+    # be finished or left first; one that hasn't started they leave like
+    # create_room does.
+    current_room = await room_store.find_active_room_for_player(userId)
+    if current_room and current_room.get("started", False):
+        raise HTTPException(status_code=400, detail="Finish or leave your current game before queueing")
+    existing_room = await room_store.remove_player(userId, cancel_if_host=True)
+    if existing_room:
+        presence.forget(userId, existing_room["code"])
+        await broadcast_room_delta(existing_room, departure_ops(existing_room, userId))
+
+    try:
+        await matchmaker.enqueue(userId, username, difficulty, rating)
+    except MatchmakingFullError as e:
+        print(f"🚦 Matchmaking queue full: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Too many players are waiting right now, please retry shortly",
+            headers={"Retry-After": str(QUEUE_FULL_RETRY_AFTER)},
+        )
+    return await get_status(userId, current_user)
+
+@router.post("/cancel")
+async def cancel(userId: str, current_user=Depends(get_current_user)):
+    """Leave the quick-play queue"""
+    if not await matchmaker.cancel(userId):
+        raise HTTPException(status_code=404, detail="Not in the matchmaking queue")
+    return {"message": "Left matchmaking queue"}
+
+@router.get("/stats")
+async def get_matchmaking_stats():
+    """Queue sizes, matches made, wait percentiles and tick cost"""
+    return matchmaker.stats()
+
+@router.get("/status/{userId}")
+async def get_status(userId: str, current_user=Depends(get_current_user)):
+    """Still waiting, matched (with the room), or neither - for clients that missed match_found"""
+    ticket = await matchmaker.ticket(userId)
+    if ticket is not None:
+        return {
+            "status": "queued",
+            "difficulty": ticket.difficulty,
+            "rating": ticket.rating,
+            "waitedSeconds": round(time.monotonic() - ticket.enqueued_at, 1),
+            "queued": await matchmaker.queued(ticket.difficulty),
+        }
+    room = await room_store.find_active_room_for_player(userId)
+    if room and room.get("matchmade"):
+        return {"status": "matched", "room": serialize_room(room)}
+    return {"status": "idle"}
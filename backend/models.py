@@ -13,3 +13,5 @@ class Room(BaseModel):
     players: List[Player] = []
     started: bool = False
     timeLeft: Optional[int] = None
+    # Epoch ms when the match clock ends the game
+    endsAt: Optional[int] = None
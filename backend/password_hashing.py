@@ -0,0 +1,117 @@
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+
+# bcrypt is deliberately slow (tens to hundreds of ms per call). Hashing or
+# verifying inline in an async handler freezes the event loop, and with it
+# every Socket.IO connection, for that long. All password work goes through
+# a small thread pool instead (bcrypt releases the GIL while it runs), and
+# a cap on callers waiting for it turns a login storm into fast 503s rather
+# than an unbounded backlog.
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Calls allowed to wait for a worker before new ones are turned away
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "256"))
+
+# Recent samples kept for the wait/service time metrics
+METRIC_SAMPLES = 500
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class HashingBusyError(Exception):
+    """Raised when too many password operations are already waiting"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """Runs bcrypt hash/verify on a bounded thread pool with a capped wait queue"""
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_queue: int = PASSWORD_HASH_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        # Created on first use, inside the server's event loop
+        self._slots = None
+        self.running = 0
+        self.waiting = 0
+
+        self.completed = 0
+        self.rejected = 0
+        self._wait_samples = deque(maxlen=METRIC_SAMPLES)
+        self._service_samples = deque(maxlen=METRIC_SAMPLES)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(pwd_context.verify, password, hashed)
+
+    def retry_after(self) -> int:
+        avg_service = (
+            sum(self._service_samples) / len(self._service_samples)
+            if self._service_samples else 0.2
+        )
+        return max(1, round(avg_service * (self.waiting + 1) / self.workers))
+
+    async def _run(self, func, *args):
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise HashingBusyError("Too many sign-ins in progress", retry_after=self.retry_after())
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        enqueued_at = time.monotonic()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        started = time.monotonic()
+        self._wait_samples.append(started - enqueued_at)
+        self.running += 1
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        except BaseException:
+            self._release(None, started)
+            raise
+        # The slot is held until bcrypt is really done: a caller that gives
+        # up (client gone, timeout) can't stop the thread, so it mustn't let
+        # another hash start next to it
+        future.add_done_callback(lambda done: self._release(done, started))
+        return await asyncio.shield(future)
+
+    def _release(self, future, started: float):
+        if future is not None and not future.cancelled():
+            # Retrieved here in case the caller was cancelled and never will
+            future.exception()
+        self.running -= 1
+        self._slots.release()
+        self._service_samples.append(time.monotonic() - started)
+        self.completed += 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        waits = list(self._wait_samples)
+        services = list(self._service_samples)
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "waiting": self.waiting,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_ms_avg": round(1000 * sum(waits) / len(waits), 1) if waits else 0.0,
+            "hash_ms_avg": round(1000 * sum(services) / len(services), 1) if services else 0.0,
+        }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,210 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from pymongo.errors import PyMongoError
+from database import db
+from room_engine import ROOM_STATE_ENGINE, room_store
+
+# Who is connected to which room. Sockets say who they are in join_room;
+# when a player's last socket for a room goes away (closed tab, lost
+# network) they get PRESENCE_GRACE_SECONDS to reconnect before the sweeper
+# removes them from the room, which also hands over the host and
+# deactivates rooms that end up empty. Players who join over HTTP start
+# the same clock, so one who never opens a socket is cleaned up too.
+#
+# Sockets and grace clocks are tracked per process. With several workers
+# (ROOM_STATE_ENGINE=mongo) a player's HTTP join and their socket can land
+# on different workers, so workers also share a presence collection: each
+# one stamps seen_at on the players it holds a socket for, when they bind
+# and on every sweep. Before removing a player, the sweeper checks whether
+# some worker has held a socket of theirs since its own clock started; if
+# so the player is left to that worker, which starts its own grace period
+# when the socket goes away.
+
+PRESENCE_GRACE_SECONDS = float(os.getenv("PRESENCE_GRACE_SECONDS", "30"))
+PRESENCE_SWEEP_INTERVAL = float(os.getenv("PRESENCE_SWEEP_INTERVAL", "5"))
+# Players removed per sweep; the rest wait for the next one
+PRESENCE_SWEEP_BATCH = int(os.getenv("PRESENCE_SWEEP_BATCH", "200"))
+
+
+class PresenceTracker:
+    """sid <-> user <-> room map with a reconnect grace period and a sweeper"""
+
+    def __init__(
+        self,
+        grace_seconds: float = PRESENCE_GRACE_SECONDS,
+        sweep_interval: float = PRESENCE_SWEEP_INTERVAL,
+        sweep_batch: int = PRESENCE_SWEEP_BATCH,
+        collection=None,
+    ):
+        # Shared presence documents, or None when this is the only worker
+        self._collection = collection
+        self.grace_seconds = grace_seconds
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        # sid -> (user id, room code)
+        self._sockets = {}
+        # (user id, room code) -> sids currently connected for it
+        self._connections = {}
+        # (user id, room code) -> (when they went offline, had a socket before),
+        # oldest first
+        self._offline_since = {}
+        self._sweeper = None
+
+        self.sweeps = 0
+        self.swept_players = 0
+        self.swept_rooms = 0
+        self.reconnects = 0
+        self.handed_over = 0
+
+    # ---------------------------
+    # Socket and HTTP events
+    # ---------------------------
+
+    async def bind(self, sid: str, user_id: str, room_code: str):
+        """``sid`` belongs to ``user_id`` and joined ``room_code``"""
+        self.unbind(sid)
+        key = (user_id, room_code)
+        self._sockets[sid] = key
+        self._connections.setdefault(key, set()).add(sid)
+        offline = self._offline_since.pop(key, None)
+        if offline is not None and offline[1]:
+            self.reconnects += 1
+        if self._collection is not None:
+            # Right away, so a worker whose clock is about to run out sees it
+            try:
+                await self._collection.update_one(
+                    {"_id": _presence_id(key)}, {"$set": {"seen_at": datetime.utcnow()}}, upsert=True
+                )
+            except PyMongoError as e:
+                print(f"⚠️ Could not share presence of {user_id} in {room_code}: {e}")
+
+    def unbind(self, sid: str) -> Optional[tuple]:
+        """Forget ``sid``; starts the grace period if it was the player's last socket"""
+        key = self._sockets.pop(sid, None)
+        if key is None:
+            return None
+        sids = self._connections.get(key)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self._connections[key]
+                self._offline_since[key] = (time.monotonic(), True)
+        return key
+
+    def expect(self, user_id: str, room_code: str):
+        """``user_id`` joined ``room_code`` over HTTP; start their clock until a socket binds"""
+        key = (user_id, room_code)
+        if key not in self._connections:
+            self._offline_since.setdefault(key, (time.monotonic(), False))
+
+    def forget(self, user_id: str, room_code: str):
+        """``user_id`` left ``room_code`` on purpose; nothing to sweep"""
+        self._offline_since.pop((user_id, room_code), None)
+
+    # ---------------------------
+    # Sweeper
+    # ---------------------------
+
+    async def start(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.heartbeat()
+                await self.sweep()
+            except Exception as e:
+                print(f"⚠️ Presence sweep failed: {e}")
+
+    async def heartbeat(self):
+        """Stamp seen_at on every player with a socket here, for the other workers"""
+        if self._collection is None or not self._connections:
+            return
+        await self._collection.update_many(
+            {"_id": {"$in": [_presence_id(key) for key in self._connections]}},
+            {"$set": {"seen_at": datetime.utcnow()}},
+        )
+
+    async def _seen_elsewhere(self, keys: list) -> set:
+        """The keys some worker has held a socket for since their clock here started"""
+        if self._collection is None:
+            return set()
+        now, wall = time.monotonic(), datetime.utcnow()
+        started = {
+            _presence_id(key): wall - timedelta(seconds=now - self._offline_since[key][0])
+            for key in keys
+        }
+        docs = await self._collection.find({"_id": {"$in": list(started)}}).to_list(None)
+        return {doc["_id"] for doc in docs if doc["seen_at"] > started[doc["_id"]]}
+
+    async def sweep(self) -> int:
+        """Remove players whose grace period ran out; returns how many were removed"""
+        # Import here to avoid circular imports
+        from socket_server import broadcast_room_delta, departure_ops
+
+        deadline = time.monotonic() - self.grace_seconds
+        expired = []
+        for key, (since, _) in self._offline_since.items():
+            # Oldest first, so the first one still in grace ends the batch
+            if since > deadline or len(expired) >= self.sweep_batch:
+                break
+            expired.append(key)
+        if not expired:
+            return 0
+        self.sweeps += 1
+        seen_elsewhere = await self._seen_elsewhere(expired)
+
+        removed = 0
+        for key in expired:
+            # A reconnect or an HTTP leave may have landed while we awaited
+            if self._offline_since.pop(key, None) is None:
+                continue
+            if _presence_id(key) in seen_elsewhere:
+                # Connected to another worker; it takes over the grace period
+                self.handed_over += 1
+                continue
+            user_id, room_code = key
+            room = await room_store.remove_player(user_id, room_code=room_code)
+            if room is None:
+                continue  # already gone from the room
+            removed += 1
+            if not room.get("active", True):
+                self.swept_rooms += 1
+            await broadcast_room_delta(room, departure_ops(room, user_id))
+        self.swept_players += removed
+        if removed:
+            print(f"🧹 Swept {removed} disconnected players")
+        return removed
+
+    def stats(self) -> dict:
+        return {
+            "sockets": len(self._sockets),
+            "connected_players": len(self._connections),
+            "in_grace": len(self._offline_since),
+            "grace_seconds": self.grace_seconds,
+            "sweeps": self.sweeps,
+            "swept_players": self.swept_players,
+            "swept_rooms": self.swept_rooms,
+            "reconnects": self.reconnects,
+            "handed_over": self.handed_over,
+            "shared": self._collection is not None,
+        }
+
+
+def _presence_id(key: tuple) -> str:
+    user_id, room_code = key
+    return f"{room_code}:{user_id}"
+
+
+# A single worker has nothing to share
+presence = PresenceTracker(collection=db.presence if ROOM_STATE_ENGINE != "memory" else None)
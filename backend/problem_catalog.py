@@ -0,0 +1,368 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi.encoders import jsonable_encoder
+from pymongo.errors import OperationFailure, PyMongoError
+from database import db
+from verdict_cache import test_cases_version
+
+# Read-through cache of the problem catalog. Problems change only when
+# they are seeded or edited, yet every page load and every code run used to
+# fetch them from Mongo. Three kinds of entries are kept:
+#   - listing pages: compact {_id, title, difficulty, tags} rows for
+#     /api/problems, one entry per filter + cursor + page size, pre-encoded
+#   - details: one problem with only its first few (sample) test cases,
+#     by id and by title, along with its encoded JSON body and ETag
+#   - test data: a problem's test cases and version, only for code runs
+# Entries are dropped when a change stream reports a write to the problem.
+# If change streams aren't available (standalone mongod), the cache polls
+# each problem's version stamp (test_cases_version + updated_at) instead,
+# so writers that bypass change streams must bump updated_at.
+
+CATALOG_POLL_INTERVAL = float(os.getenv("PROBLEM_CATALOG_POLL_INTERVAL", "30"))
+# Upper bound on entry age, as a backstop for writes the watcher missed
+CATALOG_MAX_AGE = float(os.getenv("PROBLEM_CATALOG_MAX_AGE", "600"))
+# Seconds to wait before reopening a change stream that failed
+CATALOG_RETRY_DELAY = 5
+
+# Test cases shown on the problem page; practice runs use the same ones
+SAMPLE_CASE_COUNT = 3
+
+LISTING_FIELDS = {"title": 1, "difficulty": 1, "tags": 1}
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Distinct (filter, cursor, page size) pages kept in memory
+LISTING_PAGE_CACHE_SIZE = int(os.getenv("PROBLEM_LISTING_PAGE_CACHE_SIZE", "256"))
+# Everything but the hidden test cases
+DETAIL_PROJECTION = {"test_cases": {"$slice": SAMPLE_CASE_COUNT}}
+STAMP_FIELDS = {"test_cases_version": 1, "updated_at": 1}
+
+# Change streams need a replica set; standalone servers reject them with these codes
+CHANGE_STREAM_UNSUPPORTED = {40573, 40324}
+
+
+def _stamp(doc: dict) -> tuple:
+    return (doc.get("test_cases_version"), doc.get("updated_at"))
+
+
+def _encode(payload) -> tuple:
+    """JSON body bytes and a strong ETag for ``payload``"""
+    body = json.dumps(jsonable_encoder(payload)).encode("utf-8")
+    return body, '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+class ProblemDetail:
+    """A problem's public fields, pre-encoded for the detail endpoints"""
+
+    __slots__ = ("doc", "body", "etag")
+
+    def __init__(self, doc: dict):
+        self.doc = doc
+        self.body, self.etag = _encode(doc)
+
+
+class ListingPage:
+    """One page of the problem listing, pre-encoded for /api/problems"""
+
+    __slots__ = ("items", "next_cursor", "body", "etag")
+
+    def __init__(self, items: list, next_cursor: Optional[str]):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.body, self.etag = _encode({"items": items, "next_cursor": next_cursor})
+
+
+class ProblemCatalog:
+    """In-process problem cache kept fresh by change streams or polling"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        # (difficulty, tag, cursor, limit) -> (loaded_at, ListingPage), LRU
+        self._pages = OrderedDict()
+        # id -> version stamp of every problem, as of the last version poll
+        self._known_stamps = None
+        # id -> (loaded_at, version stamp, ProblemDetail)
+        self._details = {}
+        # id -> (loaded_at, version stamp, {"test_cases", "test_cases_version"})
+        self._tests = {}
+        self._id_by_title = {}
+        self._inflight = {}
+        # Bumped by every invalidation; a load that started before it is not stored
+        self._generation = 0
+        self._watcher = None
+        self.mode = "idle"
+
+        self.hits = {"listing": 0, "details": 0, "tests": 0}
+        self.misses = {"listing": 0, "details": 0, "tests": 0}
+        self.invalidations = 0
+
+    # ---------------------------
+    # Reads
+    # ---------------------------
+
+    async def get_listing_page(
+        self,
+        difficulty: Optional[str] = None,
+        tag: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+    ) -> ListingPage:
+        """Problems in _id order after ``cursor`` (the previous page's next_cursor).
+
+        Raises InvalidId for a malformed cursor.
+        """
+        key = (difficulty, tag, cursor, limit)
+        entry = self._pages.get(key)
+        if entry is not None and self._fresh(entry[0]):
+            self.hits["listing"] += 1
+            self._pages.move_to_end(key)
+            return entry[1]
+        self.misses["listing"] += 1
+        after = ObjectId(cursor) if cursor else None
+        return await self._single_flight(("page",) + key, lambda: self._load_page(key, after))
+
+    async def random_problem(self, difficulty: Optional[str] = None) -> Optional[dict]:
+        """One problem drawn uniformly from all of them (or all of ``difficulty``)"""
+        # $sample after an equality $match; not cached, every draw should differ
+        pipeline = [{"$match": {"difficulty": difficulty} if difficulty else {}}, {"$sample": {"size": 1}}]
+        rows = await self.collection.aggregate(pipeline + [{"$project": LISTING_FIELDS}]).to_list(length=1)
+        return rows[0] if rows else None
+
+    async def get_by_title(self, title: str) -> Optional[dict]:
+        detail = await self.get_detail_by_title(title)
+        # Callers get their own top-level copy so they can add fields freely
+        return dict(detail.doc) if detail else None
+
+    async def get_by_id(self, problem_id: str) -> Optional[dict]:
+        detail = await self.get_detail_by_id(problem_id)
+        return dict(detail.doc) if detail else None
+
+    async def get_detail_by_title(self, title: str) -> Optional[ProblemDetail]:
+        problem_id = self._id_by_title.get(title)
+        if problem_id is not None:
+            cached = self._cached_details(problem_id)
+            if cached is not None:
+                return cached
+        self.misses["details"] += 1
+        return await self._single_flight(("title", title), lambda: self._load_details({"title": title}))
+
+    async def get_detail_by_id(self, problem_id: str) -> Optional[ProblemDetail]:
+        cached = self._cached_details(problem_id)
+        if cached is not None:
+            return cached
+        self.misses["details"] += 1
+        try:
+            object_id = ObjectId(problem_id)
+        except (InvalidId, TypeError):
+            return None
+        return await self._single_flight(("id", problem_id), lambda: self._load_details({"_id": object_id}))
+
+    async def get_test_data(self, problem_id: str) -> Optional[dict]:
+        """``{"test_cases", "test_cases_version"}`` for a problem id"""
+        entry = self._tests.get(problem_id)
+        if entry is not None and self._fresh(entry[0]):
+            self.hits["tests"] += 1
+            return entry[2]
+        self.misses["tests"] += 1
+        return await self._single_flight(("tests", problem_id), lambda: self._load_tests(problem_id))
+
+    def _cached_details(self, problem_id: str) -> Optional[ProblemDetail]:
+        entry = self._details.get(problem_id)
+        if entry is None or not self._fresh(entry[0]):
+            return None
+        self.hits["details"] += 1
+        return entry[2]
+
+    def _fresh(self, loaded_at: float) -> bool:
+        return time.monotonic() - loaded_at < CATALOG_MAX_AGE
+
+    async def _single_flight(self, key: tuple, load):
+        """Share one Mongo query between concurrent misses for the same key"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(load())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    # ---------------------------
+    # Loads
+    # ---------------------------
+
+    async def _load_page(self, key: tuple, after: Optional[ObjectId]) -> ListingPage:
+        difficulty, tag, _, limit = key
+        generation = self._generation
+        # Served by the (difficulty, _id) / (tags, _id) indexes, or _id alone
+        query = {}
+        if difficulty:
+            query["difficulty"] = difficulty
+        if tag:
+            query["tags"] = tag
+        if after is not None:
+            query["_id"] = {"$gt": after}
+        # One extra row tells us whether there is a next page
+        rows = await self.collection.find(query, LISTING_FIELDS).sort("_id", 1).limit(limit + 1).to_list(length=limit + 1)
+        items = [
+            {
+                "_id": str(row["_id"]),
+                "title": row["title"],
+                "difficulty": row.get("difficulty"),
+                "tags": row.get("tags", []),
+            }
+            for row in rows[:limit]
+        ]
+        page = ListingPage(items, items[-1]["_id"] if len(rows) > limit else None)
+        if generation == self._generation:
+            self._pages[key] = (time.monotonic(), page)
+            while len(self._pages) > LISTING_PAGE_CACHE_SIZE:
+                self._pages.popitem(last=False)
+        return page
+
+    async def _load_details(self, query: dict) -> Optional[ProblemDetail]:
+        generation = self._generation
+        doc = await self.collection.find_one(query, DETAIL_PROJECTION)
+        if doc is None:
+            return None
+        problem_id = str(doc["_id"])
+        doc["_id"] = problem_id
+        doc["sample_cases"] = doc.pop("test_cases", [])
+        detail = ProblemDetail(doc)
+        if generation == self._generation:
+            self._forget_title(problem_id)
+            self._details[problem_id] = (time.monotonic(), _stamp(doc), detail)
+            self._id_by_title[doc["title"]] = problem_id
+        return detail
+
+    async def _load_tests(self, problem_id: str) -> Optional[dict]:
+        generation = self._generation
+        doc = await self.collection.find_one(
+            {"_id": ObjectId(problem_id)}, dict(STAMP_FIELDS, test_cases=1)
+        )
+        if doc is None:
+            return None
+        test_cases = doc.get("test_cases", [])
+        entry = {
+            "test_cases": test_cases,
+            # Stamp it once here instead of hashing the cases on every run
+            "test_cases_version": doc.get("test_cases_version") or test_cases_version(test_cases),
+        }
+        if generation == self._generation:
+            self._tests[problem_id] = (time.monotonic(), _stamp(doc), entry)
+        return entry
+
+    # ---------------------------
+    # Invalidation
+    # ---------------------------
+
+    def invalidate(self, problem_id: Optional[str] = None):
+        """Drop one problem's entries (and all listing pages), or everything"""
+        self.invalidations += 1
+        self._generation += 1
+        self._pages.clear()
+        if problem_id is None:
+            self._details.clear()
+            self._tests.clear()
+            self._id_by_title.clear()
+            return
+        self._forget_title(problem_id)
+        self._details.pop(problem_id, None)
+        self._tests.pop(problem_id, None)
+
+    def _forget_title(self, problem_id: str):
+        entry = self._details.get(problem_id)
+        if entry is not None and self._id_by_title.get(entry[2].doc["title"]) == problem_id:
+            del self._id_by_title[entry[2].doc["title"]]
+
+    async def start(self):
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+        self.mode = "idle"
+
+    async def _watch(self):
+        """Invalidate from the change stream; fall back to polling if unsupported"""
+        while True:
+            try:
+                async with self.collection.watch() as stream:
+                    self.mode = "change_stream"
+                    print("👀 Watching problems collection for changes")
+                    # Anything written while the stream was down is unknown
+                    self.invalidate()
+                    async for change in stream:
+                        if change["operationType"] in ("drop", "rename", "dropDatabase", "invalidate"):
+                            self.invalidate()
+                        else:
+                            self.invalidate(str(change["documentKey"]["_id"]))
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAM_UNSUPPORTED:
+                    print(f"⚠️ Change streams unavailable ({e.code}), polling problem versions every {CATALOG_POLL_INTERVAL}s")
+                    await self._poll()
+                    return
+                print(f"⚠️ Problem change stream failed: {e}")
+            except PyMongoError as e:
+                print(f"⚠️ Problem change stream failed: {e}")
+            except Exception as e:
+                # Never leave the cache without an invalidation source
+                print(f"⚠️ Problem change stream unusable ({e}), polling problem versions instead")
+                await self._poll()
+                return
+            self.mode = "reconnecting"
+            await asyncio.sleep(CATALOG_RETRY_DELAY)
+
+    async def _poll(self):
+        self.mode = "polling"
+        while True:
+            await asyncio.sleep(CATALOG_POLL_INTERVAL)
+            try:
+                docs = await self.collection.find({}, STAMP_FIELDS).to_list(length=None)
+            except PyMongoError as e:
+                print(f"⚠️ Problem version poll failed: {e}")
+                continue
+            current = {str(doc["_id"]): _stamp(doc) for doc in docs}
+            changed = {
+                problem_id
+                for entries in (self._details, self._tests)
+                for problem_id, (_, stamp, _) in entries.items()
+                # A missing id means the problem was deleted
+                if current.get(problem_id, ()) != stamp
+            }
+            for problem_id in changed:
+                self.invalidate(problem_id)
+            # Listing pages show every problem, opened or not: any new,
+            # deleted or edited problem since the last poll drops them all
+            if self._known_stamps is not None and current != self._known_stamps and not changed:
+                self._generation += 1
+                self._pages.clear()
+            self._known_stamps = current
+
+    def stats(self) -> dict:
+        lookups = {kind: self.hits[kind] + self.misses[kind] for kind in self.hits}
+        return {
+            "mode": self.mode,
+            "listing_pages": len(self._pages),
+            "details_entries": len(self._details),
+            "test_entries": len(self._tests),
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+            "hit_rate": {
+                kind: round(self.hits[kind] / lookups[kind], 3) if lookups[kind] else 0.0
+                for kind in self.hits
+            },
+            "invalidations": self.invalidations,
+            "max_age_seconds": CATALOG_MAX_AGE,
+        }
+
+
+problem_catalog = ProblemCatalog(db.problems)
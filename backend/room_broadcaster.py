@@ -0,0 +1,90 @@
+import asyncio
+import os
+
+# Per-room coalescing of room_delta broadcasts. When several players finish
+# within a few milliseconds of each other, each completion used to be its
+# own emit. Deltas are now held for a short window and then sent as one
+# room_delta whose ops cover every revision in it. Transitions everyone
+# must see at once (game start, game over, room closed) flush the room's
+# pending ops immediately along with their own.
+
+ROOM_BROADCAST_WINDOW_MS = float(os.getenv("ROOM_BROADCAST_WINDOW_MS", "30"))
+
+CRITICAL_OPS = {"game_started", "game_completed", "room_closed"}
+
+
+class RoomBroadcaster:
+    """Buffers room deltas per room and emits them in merged batches"""
+
+    def __init__(self, emit, window_ms: float = ROOM_BROADCAST_WINDOW_MS):
+        # emit(event, payload, to=room_code) - the Socket.IO server's emit
+        self._emit = emit
+        self.window = window_ms / 1000
+        # room code -> {rev: ops} waiting for the window to close
+        self._pending = {}
+        self._timers = {}
+        self._tasks = set()
+
+        self.deltas = 0
+        self.emits = 0
+        self.immediate_flushes = 0
+
+    async def publish(self, room_code: str, rev: int, ops: list):
+        """Queue the ops that took ``room_code`` to ``rev``"""
+        self.deltas += 1
+        self._pending.setdefault(room_code, {})[rev] = ops
+        if self.window <= 0 or any(op["op"] in CRITICAL_OPS for op in ops):
+            self.immediate_flushes += 1
+            await self.flush(room_code)
+        elif room_code not in self._timers:
+            loop = asyncio.get_running_loop()
+            self._timers[room_code] = loop.call_later(self.window, self._flush_later, room_code)
+
+    def _flush_later(self, room_code: str):
+        self._timers.pop(room_code, None)
+        task = asyncio.create_task(self.flush(room_code))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self, room_code: str):
+        timer = self._timers.pop(room_code, None)
+        if timer is not None:
+            timer.cancel()
+        pending = self._pending.pop(room_code, None)
+        if not pending:
+            return
+        # Concurrent handlers can publish out of order; a revision that is
+        # still missing splits the batch, and clients resync across the gap
+        for base_rev, rev, ops in _contiguous_runs(pending):
+            self.emits += 1
+            await self._emit(
+                "room_delta",
+                {"code": room_code, "baseRev": base_rev, "rev": rev, "ops": ops},
+                to=room_code,
+            )
+
+    async def flush_all(self):
+        for room_code in list(self._pending):
+            await self.flush(room_code)
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window * 1000,
+            "deltas": self.deltas,
+            "emits": self.emits,
+            "emits_saved": self.deltas - self.emits - sum(len(p) for p in self._pending.values()),
+            "immediate_flushes": self.immediate_flushes,
+            "pending_rooms": len(self._pending),
+        }
+
+
+def _contiguous_runs(pending: dict):
+    """(base rev, last rev, merged ops) for each run of consecutive revisions"""
+    runs = []
+    for rev in sorted(pending):
+        if runs and runs[-1][1] == rev - 1:
+            runs[-1][1] = rev
+            runs[-1][2].extend(pending[rev])
+        else:
+            runs.append([rev - 1, rev, list(pending[rev])])
+    return [tuple(run) for run in runs]
@@ -0,0 +1,425 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, PyMongoError, WTimeoutError
+import room_repository
+from room_repository import ROOM_RETENTION_HOURS
+from socket_manager import SOCKETIO_MESSAGE_QUEUE
+
+# Live-room engine: active rooms are held in process memory and are the
+# source of truth while they last. Mutations change the in-memory objects
+# and never await in between, so each one is applied atomically with
+# respect to every other mutation of that room (the event loop is the
+# per-room serializer). Mongo is written behind:
+#   - changed rooms are flushed in one batch every ROOM_FLUSH_INTERVAL
+#   - a room that closes (game over, cancelled, emptied) is flushed right away
+#   - on startup every active room is loaded back from its last flushed
+#     state, so a crash loses at most one flush interval of changes
+#
+# The engine exposes the same functions as room_repository, and room_store
+# below is whichever of the two ROOM_STATE_ENGINE selects. The memory engine
+# needs every room to be owned by one process, so as soon as there are
+# several workers (SOCKETIO_MESSAGE_QUEUE points at a real message bus, or
+# WEB_CONCURRENCY, uvicorn's default for --workers, is above 1) rooms go
+# straight to Mongo instead.
+
+ROOM_STATE_ENGINE = os.getenv("ROOM_STATE_ENGINE", "memory")
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+if ROOM_STATE_ENGINE == "memory" and (
+    (SOCKETIO_MESSAGE_QUEUE and not SOCKETIO_MESSAGE_QUEUE.startswith("local://")) or WEB_CONCURRENCY > 1
+):
+    print("⚠️ Live rooms can't be held in memory with several workers; using ROOM_STATE_ENGINE=mongo")
+    ROOM_STATE_ENGINE = "mongo"
+ROOM_FLUSH_INTERVAL = float(os.getenv("ROOM_FLUSH_INTERVAL", "1.0"))
+# Recovered rooms jump this far ahead in rev, so clients still holding a
+# newer (never flushed) rev see a gap and resync instead of ignoring deltas
+RECOVERY_REV_GAP = 1000
+
+
+def _expires_at() -> datetime:
+    return datetime.utcnow() + timedelta(hours=ROOM_RETENTION_HOURS)
+
+
+def _transient(error: PyMongoError) -> bool:
+    """Whether a failed write is worth retrying (network trouble, failover)"""
+    return isinstance(error, (ConnectionFailure, WTimeoutError)) or error.has_error_label("RetryableWriteError")
+
+
+class PlayerState:
+    __slots__ = ("id", "name", "score", "completed", "completedAt", "extra")
+
+    def __init__(self, doc: dict):
+        doc = dict(doc)
+        self.id = doc.pop("id")
+        self.name = doc.pop("name", None)
+        self.score = doc.pop("score", 0)
+        # None until the game starts (the field is absent from the document)
+        self.completed = doc.pop("completed", None)
+        self.completedAt = doc.pop("completedAt", None)
+        self.extra = doc
+
+    def to_doc(self) -> dict:
+        doc = {"id": self.id, "name": self.name, "score": self.score, **self.extra}
+        if self.completed is not None:
+            doc["completed"] = self.completed
+            doc["completedAt"] = self.completedAt
+        return doc
+
+
+class LiveRoom:
+    __slots__ = (
+        "_id", "code", "problemId", "hostId", "players", "started", "active",
+        "gameCompleted", "created_at", "expires_at", "rev", "hostRev", "endsAt",
+        "timeUp", "extra",
+    )
+
+    def __init__(self, doc: dict):
+        doc = dict(doc)
+        self._id = doc.pop("_id")
+        self.code = doc.pop("code")
+        self.problemId = doc.pop("problemId", None)
+        self.hostId = doc.pop("hostId", None)
+        # Player id -> state, in join order
+        self.players = {p["id"]: PlayerState(p) for p in doc.pop("players", [])}
+        self.started = doc.pop("started", False)
+        self.active = doc.pop("active", True)
+        self.gameCompleted = doc.pop("gameCompleted", None)
+        self.created_at = doc.pop("created_at", None)
+        self.expires_at = doc.pop("expires_at", None)
+        self.rev = doc.pop("rev", 0)
+        self.hostRev = doc.pop("hostRev", None)
+        # Match deadline (epoch ms) and whether the game ended on it
+        self.endsAt = doc.pop("endsAt", None)
+        self.timeUp = doc.pop("timeUp", None)
+        self.extra = doc
+
+    def to_doc(self) -> dict:
+        """The room as room_repository would return it"""
+        doc = {
+            "_id": self._id,
+            "problemId": self.problemId,
+            "hostId": self.hostId,
+            "code": self.code,
+            "players": [p.to_doc() for p in self.players.values()],
+            "started": self.started,
+            "active": self.active,
+            "created_at": self.created_at,
+            "rev": self.rev,
+            **self.extra,
+        }
+        for field in ("gameCompleted", "expires_at", "hostRev", "endsAt", "timeUp"):
+            value = getattr(self, field)
+            if value is not None:
+                doc[field] = value
+        return doc
+
+    def deactivate(self):
+        self.active = False
+        self.expires_at = _expires_at()
+
+
+class RoomEngine:
+    """Active rooms in memory, written behind to Mongo"""
+
+    def __init__(self, flush_interval: float = ROOM_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        # _id -> room, for active rooms and closed ones not yet flushed
+        self._rooms = {}
+        # code -> _id of the active room with that code
+        self._active_by_code = {}
+        # player id -> _id of the active room they are in
+        self._room_by_player = {}
+        # _ids changed since the last flush
+        self._dirty = set()
+        self._flusher = None
+        # One batch in flight at a time, so an older snapshot of a room can
+        # never land after a newer one
+        self._flush_lock = asyncio.Lock()
+
+        self.mutations = 0
+        self.flushes = 0
+        self.rooms_written = 0
+        self.flush_errors = 0
+        self.recovered = 0
+        self._last_flush_ms = 0.0
+
+    # ---------------------------
+    # Lifecycle
+    # ---------------------------
+
+    async def start(self):
+        """Load active rooms from their last flushed state and start flushing"""
+        if self._flusher is not None:
+            return
+        for doc in await room_repository.find_active_rooms():
+            doc["rev"] = doc.get("rev", 0) + RECOVERY_REV_GAP
+            room = LiveRoom(doc)
+            if room.code in self._active_by_code:
+                print(f"⚠️ Two active rooms share code {room.code}; keeping the first")
+                continue
+            self._track(room)
+            self._dirty.add(room._id)
+            self.recovered += 1
+        if self.recovered:
+            print(f"♻️ Recovered {self.recovered} active rooms from MongoDB")
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self, room_ids=None):
+        """Write changed rooms (or just ``room_ids``) to Mongo in one batch"""
+        async with self._flush_lock:
+            await self._flush(room_ids)
+
+    async def _flush(self, room_ids):
+        ids = set(self._dirty) if room_ids is None else set(room_ids) & self._dirty
+        if not ids:
+            return
+        self._dirty -= ids
+        docs = [self._rooms[room_id].to_doc() for room_id in ids]
+        started = time.perf_counter()
+        failed = set()
+        try:
+            await room_repository.save_rooms(docs)
+        except BulkWriteError as e:
+            # The batch is unordered, so only the documents listed failed.
+            # Their errors (a clashing code, validation) won't go away on a
+            # retry; a write concern error leaves the rest unconfirmed.
+            self.flush_errors += 1
+            failed = {docs[error["index"]]["_id"] for error in e.details.get("writeErrors", [])}
+            if e.details.get("writeConcernErrors"):
+                self._dirty |= ids - failed
+            print(f"⚠️ Room flush could not write {len(failed)} of {len(ids)} rooms, dropping them: {e}")
+        except PyMongoError as e:
+            self.flush_errors += 1
+            if _transient(e):
+                # Keep them dirty; the next flush retries
+                self._dirty |= ids
+                print(f"⚠️ Room flush failed for {len(ids)} rooms, will retry: {e}")
+                return
+            failed = ids
+            print(f"⚠️ Room flush failed for {len(ids)} rooms, dropping them: {e}")
+        self._last_flush_ms = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.rooms_written += len(docs) - len(failed)
+        # Closed rooms leave memory once their final state is stored (or
+        # can never be)
+        for room_id in ids:
+            room = self._rooms.get(room_id)
+            if room is not None and not room.active and room_id not in self._dirty:
+                del self._rooms[room_id]
+
+    # ---------------------------
+    # Index upkeep
+    # ---------------------------
+
+    def _track(self, room: LiveRoom):
+        self._rooms[room._id] = room
+        if room.active:
+            self._active_by_code[room.code] = room._id
+            for player_id in room.players:
+                self._room_by_player[player_id] = room._id
+
+    def _changed(self, room: LiveRoom) -> dict:
+        """Bump the rev, fix up the indexes and mark the room for flushing"""
+        room.rev += 1
+        self.mutations += 1
+        self._dirty.add(room._id)
+        if not room.active:
+            if self._active_by_code.get(room.code) == room._id:
+                del self._active_by_code[room.code]
+            for player_id in room.players:
+                if self._room_by_player.get(player_id) == room._id:
+                    del self._room_by_player[player_id]
+        return room.to_doc()
+
+    async def _closed(self, room: LiveRoom):
+        # Game over / cancelled / emptied rooms are persisted straight away
+        await self.flush([room._id])
+
+    def _find_live(self, room_code: str) -> Optional[LiveRoom]:
+        """The active room with this code, else a closed one not yet flushed"""
+        room_id = self._active_by_code.get(room_code)
+        if room_id is not None:
+            return self._rooms[room_id]
+        for room in self._rooms.values():
+            if room.code == room_code:
+                return room
+        return None
+
+    # ---------------------------
+    # room_repository interface
+    # ---------------------------
+
+    async def find_room(self, room_code: str) -> Optional[dict]:
+        room = self._find_live(room_code)
+        if room is not None:
+            return room.to_doc()
+        # Closed and flushed rooms only live in Mongo
+        return await room_repository.find_room(room_code)
+
+    async def find_active_room_for_player(self, user_id: str) -> Optional[dict]:
+        room_id = self._room_by_player.get(user_id)
+        return self._rooms[room_id].to_doc() if room_id is not None else None
+
+    async def insert_room(self, room: dict) -> dict:
+        # A room this process doesn't hold may still have the code in Mongo.
+        # Nothing awaits between the local check and tracking the room.
+        stored = await room_repository.find_room(room["code"])
+        if (stored is not None and stored.get("active")) or room["code"] in self._active_by_code:
+            raise DuplicateKeyError(f"Room code {room['code']} is in use")
+        room["_id"] = ObjectId()
+        room["rev"] = 1
+        live = LiveRoom(room)
+        self._track(live)
+        self._dirty.add(live._id)
+        self.mutations += 1
+        return room
+
+    async def remove_player(
+        self,
+        user_id: str,
+        room_code: Optional[str] = None,
+        exclude_code: Optional[str] = None,
+        cancel_if_host: bool = False,
+    ) -> Optional[dict]:
+        if room_code is not None:
+            room = self._find_live(room_code)
+            if room is None:
+                return await room_repository.remove_player(user_id, room_code=room_code)
+        else:
+            room_id = self._room_by_player.get(user_id)
+            room = self._rooms[room_id] if room_id is not None else None
+            if room is not None and room.code == exclude_code:
+                room = None
+        if room is None or user_id not in room.players:
+            return None
+
+        del room.players[user_id]
+        if room.active and self._room_by_player.get(user_id) == room._id:
+            del self._room_by_player[user_id]
+        was_host = room.hostId == user_id
+        finished = (
+            room.started and room.active and room.players
+            and all(p.completed for p in room.players.values())
+        )
+        if finished:
+            # They were the last one still playing
+            room.gameCompleted = True
+        if (cancel_if_host and was_host) or not room.players or finished:
+            room.deactivate()
+        if was_host and room.players and not cancel_if_host:
+            # Hand over to the next player; hostRev marks it for departure_ops
+            room.hostId = next(iter(room.players))
+            room.hostRev = room.rev + 1
+        doc = self._changed(room)
+        if not room.active:
+            await self._closed(room)
+        return doc
+
+    async def add_player(self, room_id, player: dict) -> Optional[dict]:
+        room = self._rooms.get(room_id)
+        if room is None:
+            return await room_repository.add_player(room_id, player)
+        if not room.active or room.started or player["id"] in room.players:
+            return None
+        room.players[player["id"]] = PlayerState(player)
+        self._room_by_player[player["id"]] = room._id
+        return self._changed(room)
+
+    async def cancel_room(self, room_code: str, host_id: str) -> Optional[dict]:
+        room = self._find_live(room_code)
+        if room is None:
+            return await room_repository.cancel_room(room_code, host_id)
+        if room.hostId != host_id or not room.active:
+            return None
+        room.deactivate()
+        doc = self._changed(room)
+        await self._closed(room)
+        return doc
+
+    async def start_room(self, room_code: str, host_id: str, ends_at: Optional[int] = None) -> Optional[dict]:
+        room = self._find_live(room_code)
+        if room is None:
+            return await room_repository.start_room(room_code, host_id, ends_at)
+        if room.hostId != host_id or not room.active or room.started:
+            return None
+        room.started = True
+        room.endsAt = ends_at
+        for player in room.players.values():
+            player.completed = False
+            player.completedAt = None
+        return self._changed(room)
+
+    async def complete_player(self, room_code: str, user_id: str) -> Optional[dict]:
+        room = self._find_live(room_code)
+        if room is None:
+            return await room_repository.complete_player(room_code, user_id)
+        player = room.players.get(user_id)
+        if not (room.active and room.started) or player is None or player.completed:
+            return None
+        player.completed = True
+        player.completedAt = datetime.utcnow().isoformat()
+        if all(p.completed for p in room.players.values()):
+            room.gameCompleted = True
+            room.deactivate()
+        elif room.gameCompleted is None:
+            room.gameCompleted = False
+        doc = self._changed(room)
+        if not room.active:
+            await self._closed(room)
+        return doc
+
+    async def expire_room(self, room_code: str, ends_at: int) -> Optional[dict]:
+        room = self._find_live(room_code)
+        if room is None:
+            return await room_repository.expire_room(room_code, ends_at)
+        if not (room.active and room.started and room.endsAt == ends_at):
+            return None
+        room.gameCompleted = True
+        room.timeUp = True
+        room.deactivate()
+        doc = self._changed(room)
+        await self._closed(room)
+        return doc
+
+    async def find_timed_rooms(self) -> list:
+        return [
+            {"_id": room._id, "code": room.code, "endsAt": room.endsAt}
+            for room in self._rooms.values()
+            if room.active and room.started and room.endsAt is not None
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "engine": ROOM_STATE_ENGINE,
+            "live_rooms": len(self._active_by_code),
+            "closing_rooms": len(self._rooms) - len(self._active_by_code),
+            "players": len(self._room_by_player),
+            "dirty_rooms": len(self._dirty),
+            "mutations": self.mutations,
+            "flushes": self.flushes,
+            "rooms_written": self.rooms_written,
+            "flush_errors": self.flush_errors,
+            "last_flush_ms": round(self._last_flush_ms, 2),
+            "recovered": self.recovered,
+            "flush_interval_seconds": self.flush_interval,
+        }
+
+
+room_engine = RoomEngine()
+
+# What the handlers talk to: the live engine, or Mongo directly
+room_store = room_engine if ROOM_STATE_ENGINE == "memory" else room_repository
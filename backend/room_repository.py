@@ -0,0 +1,249 @@
+import os
+import random
+import string
+from datetime import datetime, timedelta
+from typing import Optional
+from pymongo import ReplaceOne, ReturnDocument
+from database import db
+
+# Every room state transition is a single find_one_and_update that returns
+# the room as it is after the change. Membership, host and completion
+# changes are computed inside the update (atomic operators or an
+# aggregation pipeline), so concurrent joins, leaves and submissions never
+# overwrite each other's edits to the players array.
+#
+# Every change also bumps the room's ``rev``. Clients apply the deltas
+# socket_server broadcasts in rev order and ask for a snapshot on a gap.
+
+rooms = db.rooms
+
+# Deactivated rooms get an expires_at this far out; the TTL index in
+# indexes.py deletes them once it passes.
+ROOM_RETENTION_HOURS = float(os.getenv("ROOM_RETENTION_HOURS", str(7 * 24)))
+
+
+# Codes are reused once a room is inactive, so lookups by code prefer the
+# active room (served in order by the code+active index)
+ACTIVE_FIRST = [("active", -1)]
+
+
+def generate_room_code() -> str:
+    """Random 6-character code; insert_room rejects one already in use"""
+    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+
+
+def _expires_at() -> datetime:
+    return datetime.utcnow() + timedelta(hours=ROOM_RETENTION_HOURS)
+
+
+# Pipeline stage / update operator that bumps the room revision
+_BUMP_REV_STAGE = {"$set": {"rev": {"$add": [{"$ifNull": ["$rev", 0]}, 1]}}}
+_BUMP_REV = {"$inc": {"rev": 1}}
+
+
+def _deactivate_if(condition) -> dict:
+    """Pipeline ``$set`` fields that close the room when ``condition`` holds"""
+    return {
+        "active": {"$cond": [condition, False, "$active"]},
+        "expires_at": {"$cond": [condition, _expires_at(), "$expires_at"]},
+    }
+
+
+def serialize_room(room: dict) -> dict:
+    """Make a room document JSON-safe for HTTP responses and Socket.IO"""
+    room["_id"] = str(room["_id"])
+    if isinstance(room.get("created_at"), datetime):
+        room["created_at"] = room["created_at"].isoformat()
+    return room
+
+
+async def find_room(room_code: str) -> Optional[dict]:
+    return await rooms.find_one({"code": room_code}, sort=ACTIVE_FIRST)
+
+
+async def find_active_room_for_player(user_id: str) -> Optional[dict]:
+    return await rooms.find_one({"players.id": user_id, "active": True})
+
+
+async def find_active_rooms() -> list:
+    return await rooms.find({"active": True}).to_list(length=None)
+
+
+async def find_timed_rooms() -> list:
+    """Running games with a deadline, for match_clock to re-arm after a restart"""
+    return await rooms.find(
+        {"active": True, "started": True, "endsAt": {"$ne": None}},
+        {"code": 1, "endsAt": 1},
+    ).to_list(length=None)
+
+
+async def save_rooms(docs: list):
+    """Write whole room documents in one batch, inserting any that are new.
+
+    Used by room_engine's write-behind flush; the live state in memory is
+    authoritative, so each document simply replaces what is stored.
+    """
+    if docs:
+        await rooms.bulk_write([ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in docs], ordered=False)
+
+
+async def insert_room(room: dict) -> dict:
+    """Insert a new active room.
+
+    Raises DuplicateKeyError if another active room already has its code
+    (enforced by the partial unique index on code).
+    """
+    room["rev"] = 1
+    await rooms.insert_one(room)
+    return room
+
+
+def _remove_player_pipeline(user_id: str, cancel_if_host: bool) -> list:
+    """Pipeline that drops ``user_id`` from players and fixes up host/active.
+
+    An empty room is deactivated. If the leaving player was the host, the
+    room is either cancelled (``cancel_if_host``) or handed to the first
+    remaining player, in which case ``hostRev`` is set to the new ``rev``.
+    If they were the last player still playing a started game, the game
+    is completed.
+    """
+    was_host = {"$eq": ["$hostId", user_id]}
+    now_empty = {"$eq": [{"$size": "$players"}, 0]}
+    still_playing = {"$filter": {"input": "$players", "cond": {"$ne": ["$$this.completed", True]}}}
+    finished = {"$and": [
+        {"$eq": ["$started", True]},
+        {"$eq": ["$active", True]},
+        {"$gt": [{"$size": "$players"}, 0]},
+        {"$eq": [{"$size": still_playing}, 0]},
+    ]}
+    game_update = {"gameCompleted": {"$cond": [finished, True, "$gameCompleted"]}}
+    if cancel_if_host:
+        host_update = {**game_update, **_deactivate_if({"$or": [was_host, now_empty, finished]})}
+    else:
+        hand_over = {"$and": [was_host, {"$gt": [{"$size": "$players"}, 0]}]}
+        host_update = {
+            **game_update,
+            **_deactivate_if({"$or": [now_empty, finished]}),
+            "hostId": {"$cond": [hand_over, {"$arrayElemAt": ["$players.id", 0]}, "$hostId"]},
+            "hostRev": {"$cond": [hand_over, "$rev", "$hostRev"]},
+        }
+    return [
+        {"$set": {"players": {"$filter": {"input": "$players", "cond": {"$ne": ["$$this.id", user_id]}}}}},
+        _BUMP_REV_STAGE,
+        {"$set": host_update},
+    ]
+
+
+async def remove_player(
+    user_id: str,
+    room_code: Optional[str] = None,
+    exclude_code: Optional[str] = None,
+    cancel_if_host: bool = False,
+) -> Optional[dict]:
+    """Remove ``user_id`` from room ``room_code``, or else from their active room
+    (unless its code is ``exclude_code``).
+
+    Returns the updated room, or None if no such room contains them.
+    """
+    if room_code is not None:
+        query = {"code": room_code}
+    else:
+        query = {"active": True}
+        if exclude_code is not None:
+            query["code"] = {"$ne": exclude_code}
+    return await rooms.find_one_and_update(
+        dict(query, **{"players.id": user_id}),
+        _remove_player_pipeline(user_id, cancel_if_host),
+        sort=ACTIVE_FIRST,
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def add_player(room_id, player: dict) -> Optional[dict]:
+    """Append ``player`` to an open room; None if it is closed, started or they are already in it"""
+    return await rooms.find_one_and_update(
+        {"_id": room_id, "active": True, "started": False, "players.id": {"$ne": player["id"]}},
+        {"$push": {"players": player}, **_BUMP_REV},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def cancel_room(room_code: str, host_id: str) -> Optional[dict]:
+    """Deactivate the room if it is active and ``host_id`` hosts it; None otherwise"""
+    return await rooms.find_one_and_update(
+        {"code": room_code, "hostId": host_id, "active": True},
+        {"$set": {"active": False, "expires_at": _expires_at()}, **_BUMP_REV},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def start_room(room_code: str, host_id: str, ends_at: Optional[int] = None) -> Optional[dict]:
+    """Mark the room started and reset every player's completion.
+
+    None if ``host_id`` isn't the host or the room is closed or already
+    started. ``ends_at`` (epoch milliseconds) is the match deadline
+    match_clock enforces.
+    """
+    return await rooms.find_one_and_update(
+        {"code": room_code, "hostId": host_id, "active": True, "started": {"$ne": True}},
+        [
+            {"$set": {
+                "started": True,
+                "endsAt": ends_at,
+                "players": {"$map": {
+                    "input": "$players",
+                    "in": {"$mergeObjects": ["$$this", {"completed": False, "completedAt": None}]},
+                }},
+            }},
+            _BUMP_REV_STAGE,
+        ],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def complete_player(room_code: str, user_id: str) -> Optional[dict]:
+    """Mark ``user_id`` completed in a started room, finishing the game if they were last.
+
+    Returns the updated room, or None if the game isn't running (not
+    started yet, or over, e.g. because time ran out) or the player had
+    already completed. When the returned room has
+    ``gameCompleted`` set, this call is the one that finished the game.
+    """
+    still_playing = {"$filter": {"input": "$players", "cond": {"$ne": ["$$this.completed", True]}}}
+    everyone_done = {"$eq": [{"$size": still_playing}, 0]}
+    return await rooms.find_one_and_update(
+        {
+            "code": room_code,
+            "active": True,
+            "started": True,
+            "players": {"$elemMatch": {"id": user_id, "completed": {"$ne": True}}},
+        },
+        [
+            {"$set": {"players": {"$map": {
+                "input": "$players",
+                "in": {"$cond": [
+                    {"$eq": ["$$this.id", user_id]},
+                    {"$mergeObjects": ["$$this", {"completed": True, "completedAt": datetime.utcnow().isoformat()}]},
+                    "$$this",
+                ]},
+            }}}},
+            {"$set": {
+                "gameCompleted": {"$cond": [everyone_done, True, {"$ifNull": ["$gameCompleted", False]}]},
+                **_deactivate_if(everyone_done),
+            }},
+            _BUMP_REV_STAGE,
+        ],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def expire_room(room_code: str, ends_at: int) -> Optional[dict]:
+    """End a running game whose deadline ``ends_at`` has passed.
+
+    None if the game already ended or was restarted with another deadline.
+    """
+    return await rooms.find_one_and_update(
+        {"code": room_code, "active": True, "started": True, "endsAt": ends_at},
+        {"$set": {"gameCompleted": True, "timeUp": True, "active": False, "expires_at": _expires_at()}, **_BUMP_REV},
+        return_document=ReturnDocument.AFTER,
+    )
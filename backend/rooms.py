@@ -1,87 +1,90 @@
 from fastapi import APIRouter, HTTPException, Depends
-from bson import ObjectId
 from datetime import datetime
-import random
-import string
-from database import db
+from typing import Optional
+import time
+from pymongo.errors import DuplicateKeyError
 from auth import get_current_user
-from socket_server import broadcast_room_update
+from socket_server import broadcast_room_delta, departure_ops, room_broadcaster
+from room_engine import room_engine, room_store
+from presence import presence
+from matchmaker import matchmaker
+from match_clock import match_clock, MATCH_DURATION_SECONDS
+from room_repository import generate_room_code, serialize_room
 
 router = APIRouter(prefix="/api/rooms", tags=["rooms"])
 
 @router.post("/create")
 async def create_room(problemId: str, hostUserId: str, current_user=Depends(get_current_user)):
-    # Check if user is already in an active room and force them to leave
-    existing_room = db.rooms.find_one({
-        "players.id": hostUserId,
-        "active": True
-    })
-
+    # Playing with friends instead of quick play
+    await matchmaker.cancel(hostUserId)
+    # If user is already in an active room, force them to leave;
+    # if they were the host, that room is cancelled
+    existing_room = await room_store.remove_player(hostUserId, cancel_if_host=True)
     if existing_room:
-        # Remove user from existing room
-        existing_room["players"] = [p for p in existing_room["players"] if p["id"] != hostUserId]
-
-        # If they were the host, cancel the room
-        if existing_room["hostId"] == hostUserId:
-            db.rooms.update_one({"_id": existing_room["_id"]}, {"$set": {"active": False, "players": existing_room["players"]}})
-            existing_room["active"] = False
-        else:
-            db.rooms.update_one({"_id": existing_room["_id"]}, {"$set": {"players": existing_room["players"]}})
-
-        # Broadcast the update to the old room
-        existing_room["_id"] = str(existing_room["_id"])
-        if "created_at" in existing_room:
-            existing_room["created_at"] = existing_room["created_at"].isoformat()
-        await broadcast_room_update(existing_room)
-
-    # Generate truly random room code
-    def generate_room_code():
-        return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-
-    # Ensure unique room code
-    room_code = generate_room_code()
-    while db.rooms.find_one({"code": room_code, "active": True}):
-        room_code = generate_room_code()
-
-    # Create new room
-    room = {
-        "problemId": problemId,
-        "hostId": hostUserId,
-        "code": room_code,
-        "players": [
-            {"id": hostUserId, "name": current_user["email"], "score": 0}
-        ],
-        "started": False,
-        "active": True,  # Room is open for joining
-        "created_at": datetime.utcnow()
-    }
-    db.rooms.insert_one(room)
+        presence.forget(hostUserId, existing_room["code"])
+        # Tell the old room they left
+        await broadcast_room_delta(existing_room, departure_ops(existing_room, hostUserId))
+
+    # Create new room; the unique index on active codes rejects a clash,
+    # in which case we just draw another code
+    while True:
+        room = {
+            "problemId": problemId,
+            "hostId": hostUserId,
+            "code": generate_room_code(),
+            "players": [
+                {"id": hostUserId, "name": current_user["email"], "score": 0}
+            ],
+            "started": False,
+            "active": True,  # Room is open for joining
+            "created_at": datetime.utcnow()
+        }
+        try:
+            await room_store.insert_room(room)
+            break
+        except DuplicateKeyError:
+            print(f"🔁 Room code {room['code']} is taken, retrying")
 
     room["_id"] = str(room["_id"])
-    # Don't broadcast immediately - the creator hasn't joined the socket.io room yet
-    # They will get the room state from the HTTP response
+    # Swept unless a socket of theirs joins the room within the grace period
+    presence.expect(hostUserId, room["code"])
+    # Nothing to broadcast - the creator hasn't joined the socket.io room yet
+    # They will get the room state (rev 1) from the HTTP response
     return room
 
+@router.get("/broadcasts")
+async def get_broadcast_stats():
+    """How many room_delta emits the per-room coalescing window saved"""
+    return room_broadcaster.stats()
+
+@router.get("/engine")
+async def get_room_engine_stats():
+    """Live rooms held in memory and how their write-behind flushes are doing"""
+    return room_engine.stats()
+
+@router.get("/presence")
+async def get_presence_stats():
+    """Connected players, players in their reconnect grace period, and sweep counters"""
+    return presence.stats()
+
+@router.get("/clock")
+async def get_match_clock_stats():
+    """Armed match deadlines, tick events sent and time-ups fired"""
+    return match_clock.stats()
+
 @router.get("/user/{userId}")
 async def get_user_room(userId: str, current_user=Depends(get_current_user)):
     """Get the room that this user is currently in"""
-    room = db.rooms.find_one({
-        "players.id": userId,
-        "active": True  # Only return active rooms
-    })
+    room = await room_store.find_active_room_for_player(userId)
     if not room:
         return None
-
-    room["_id"] = str(room["_id"])
-    if "created_at" in room:
-        room["created_at"] = room["created_at"].isoformat()
-    return room
+    return serialize_room(room)
 
 @router.post("/join")
 async def join_room(roomCode: str, userId: str, username: str, current_user=Depends(get_current_user)):
     print(f"🔍 Join room attempt: {roomCode} by {userId}")
 
-    room = db.rooms.find_one({"code": roomCode})
+    room = await room_store.find_room(roomCode)
     if not room:
         print(f"❌ Room {roomCode} not found")
         raise HTTPException(status_code=404, detail="Room not found")
@@ -96,142 +99,91 @@ async def join_room(roomCode: str, userId: str, username: str, current_user=Depe
         print(f"❌ Room {roomCode} already started")
         raise HTTPException(status_code=400, detail="Cannot join a room that has already started")
 
-    # Check if user is already in a different active room and force them to leave
-    existing_room = db.rooms.find_one({
-        "players.id": userId,
-        "active": True,
-        "code": {"$ne": roomCode}  # Different room than the one they're trying to join
-    })
-
+    await matchmaker.cancel(userId)
+    # If user is already in a different active room, force them to leave it
+    existing_room = await room_store.remove_player(userId, exclude_code=roomCode)
     if existing_room:
-        print(f"🔄 User {userId} leaving existing room {existing_room['code']} to join {roomCode}")
-        # Remove user from existing room
-        existing_room["players"] = [p for p in existing_room["players"] if p["id"] != userId]
-
-        # Check if room is now empty and should be deactivated
-        if len(existing_room["players"]) == 0:
-            # No players left, deactivate room
-            db.rooms.update_one({"_id": existing_room["_id"]}, {"$set": {"active": False, "players": existing_room["players"]}})
-            existing_room["active"] = False
-        elif existing_room["hostId"] == userId:
-            # Host left but there are still players - transfer host to first remaining player
-            new_host = existing_room["players"][0]
-            db.rooms.update_one(
-                {"_id": existing_room["_id"]},
-                {"$set": {"hostId": new_host["id"], "players": existing_room["players"]}}
-            )
-            existing_room["hostId"] = new_host["id"]
-        else:
-            # Non-host leaving, just update players list
-            db.rooms.update_one({"_id": existing_room["_id"]}, {"$set": {"players": existing_room["players"]}})
-
-        # Broadcast the update to the old room
-        existing_room["_id"] = str(existing_room["_id"])
-        if "created_at" in existing_room:
-            existing_room["created_at"] = existing_room["created_at"].isoformat()
-        await broadcast_room_update(existing_room)
+        print(f"🔄 User {userId} left existing room {existing_room['code']} to join {roomCode}")
+        presence.forget(userId, existing_room["code"])
+        # Tell the old room they left
+        await broadcast_room_delta(existing_room, departure_ops(existing_room, userId))
 
     # Add new player if not already present
-    if not any(p["id"] == userId for p in room["players"]):
-        print(f"✅ Adding {userId} to room {roomCode}")
-        room["players"].append({"id": userId, "name": username, "score": 0})
-        db.rooms.update_one({"_id": room["_id"]}, {"$set": {"players": room["players"]}})
+    player = {"id": userId, "name": username, "score": 0}
+    updated_room = await room_store.add_player(room["_id"], player)
+    if updated_room:
+        print(f"✅ Added {userId} to room {roomCode}")
+        room = updated_room
+        presence.expect(userId, roomCode)
+        # Push the new player to all socket clients in this room
+        await broadcast_room_delta(room, [{"op": "player_joined", "player": player}])
     else:
+        # Already in the room, or it started/closed since we looked it up
+        room = await room_store.find_room(roomCode)
+        if room is None:
+            raise HTTPException(status_code=404, detail="Room not found")
+        if not any(p["id"] == userId for p in room["players"]):
+            raise HTTPException(status_code=400, detail="Room is no longer open for joining")
         print(f"ℹ️ User {userId} already in room {roomCode}")
 
-    room["_id"] = str(room["_id"])
-    # Convert datetime to ISO string for JSON serialization
-    if "created_at" in room:
-        room["created_at"] = room["created_at"].isoformat()
-    # Push update to all socket clients in this room
-    await broadcast_room_update(room)
+    serialize_room(room)
     print(f"✅ Successfully joined room {roomCode}")
     return room
 
 @router.post("/cancel")
 async def cancel_room(roomCode: str, hostUserId: str, current_user=Depends(get_current_user)):
     """Host cancels/closes a room"""
-    room = db.rooms.find_one({"code": roomCode})
+    room = await room_store.cancel_room(roomCode, hostUserId)
     if not room:
-        raise HTTPException(status_code=404, detail="Room not found")
-
-    if room["hostId"] != hostUserId:
+        room = await room_store.find_room(roomCode)
+        if not room:
+            raise HTTPException(status_code=404, detail="Room not found")
+        if not room.get("active", True):
+            raise HTTPException(status_code=400, detail="Room is no longer active")
         raise HTTPException(status_code=403, detail="Only the host can cancel the room")
 
-    # Mark room as inactive
-    db.rooms.update_one({"_id": room["_id"]}, {"$set": {"active": False}})
-
     # Notify all players that room was canceled
-    room["active"] = False
-    room["_id"] = str(room["_id"])
-    if "created_at" in room:
-        room["created_at"] = room["created_at"].isoformat()
-    await broadcast_room_update(room)
+    await broadcast_room_delta(room, [{"op": "room_closed"}])
     return {"message": "Room canceled"}
 
 @router.post("/leave")
 async def leave_room(roomCode: str, userId: str, current_user=Depends(get_current_user)):
     """Player leaves a room (works for both started and non-started rooms)"""
-    room = db.rooms.find_one({"code": roomCode})
+    presence.forget(userId, roomCode)
+    # Empty rooms are deactivated; a departing host hands over to the next player
+    room = await room_store.remove_player(userId, room_code=roomCode)
     if not room:
-        raise HTTPException(status_code=404, detail="Room not found")
+        if not await room_store.find_room(roomCode):
+            raise HTTPException(status_code=404, detail="Room not found")
+        # Not in the room, nothing changed
+        return {"message": "Left room"}
 
-    # Remove player from room
-    room["players"] = [p for p in room["players"] if p["id"] != userId]
-
-    # Check if room is now empty and should be deactivated
-    if len(room["players"]) == 0:
-        # No players left, deactivate room
-        db.rooms.update_one({"_id": room["_id"]}, {"$set": {"active": False, "players": room["players"]}})
-        room["active"] = False
-    elif room["hostId"] == userId:
-        # Host left but there are still players - transfer host to first remaining player
-        new_host = room["players"][0]
-        db.rooms.update_one(
-            {"_id": room["_id"]},
-            {"$set": {"hostId": new_host["id"], "players": room["players"]}}
-        )
-        room["hostId"] = new_host["id"]
-    else:
-        # Non-host leaving, just update players list
-        db.rooms.update_one({"_id": room["_id"]}, {"$set": {"players": room["players"]}})
-
-    room["_id"] = str(room["_id"])
-    if "created_at" in room:
-        room["created_at"] = room["created_at"].isoformat()
-    await broadcast_room_update(room)
+    await broadcast_room_delta(room, departure_ops(room, userId))
     return {"message": "Left room"}
 
 @router.post("/start")
-async def start_game(roomCode: str, hostUserId: str, current_user=Depends(get_current_user)):
+async def start_game(roomCode: str, hostUserId: str, durationSeconds: Optional[int] = None, current_user=Depends(get_current_user)):
     """Host starts the game - redirects all players to problem screen"""
-    room = db.rooms.find_one({"code": roomCode})
-    if not room:
-        raise HTTPException(status_code=404, detail="Room not found")
+    duration = durationSeconds or MATCH_DURATION_SECONDS
+    if duration <= 0:
+        raise HTTPException(status_code=400, detail="durationSeconds must be positive")
+    ends_at = int((time.time() + duration) * 1000)
 
-    if room["hostId"] != hostUserId:
+    # Mark room as started and add player completion status
+    room = await room_store.start_room(roomCode, hostUserId, ends_at=ends_at)
+    if not room:
+        room = await room_store.find_room(roomCode)
+        if not room:
+            raise HTTPException(status_code=404, detail="Room not found")
+        if not room.get("active", True):
+            raise HTTPException(status_code=400, detail="Room is no longer active")
+        if room.get("started", False):
+            raise HTTPException(status_code=400, detail="Game already started")
         raise HTTPException(status_code=403, detail="Only the host can start the game")
 
-    # Mark room as started and add player completion status
-    players_with_status = []
-    for player in room["players"]:
-        players_with_status.append({
-            **player,
-            "completed": False,
-            "completedAt": None
-        })
-
-    db.rooms.update_one(
-        {"_id": room["_id"]},
-        {"$set": {"started": True, "players": players_with_status}}
-    )
-
-    # Get updated room
-    room = db.rooms.find_one({"_id": room["_id"]})
-    room["_id"] = str(room["_id"])
-    if "created_at" in room:
-        room["created_at"] = room["created_at"].isoformat()
+    serialize_room(room)
+    match_clock.arm(room["code"], ends_at)
 
     # Broadcast game start to all players
-    await broadcast_room_update(room)
-    return {"message": "Game started", "room": room}
\ No newline at end of file
+    await broadcast_room_delta(room, [{"op": "game_started", "endsAt": ends_at}])
+    return {"message": "Game started", "room": room}
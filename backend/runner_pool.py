@@ -0,0 +1,126 @@
+import asyncio
+import json
+import os
+import socket
+
+# Warm worker pool running inside the leet-code-runner container
+# (see runner/pool_server.py). The port is published on localhost by docker-compose.
+RUNNER_POOL_HOST = os.getenv("RUNNER_POOL_HOST", "127.0.0.1")
+RUNNER_POOL_PORT = int(os.getenv("RUNNER_POOL_PORT", "8765"))
+
+# Extra seconds to wait for the pool beyond the job's own timeout
+POOL_RESPONSE_GRACE = 5
+POOL_CONNECT_TIMEOUT = 2
+# Replies carry the whole stdout/stderr of a run on one line
+POOL_READ_LIMIT = 16 * 1024 * 1024
+
+
+class RunnerPoolError(Exception):
+    """The runner pool could not be reached or returned a malformed reply"""
+
+
+def _parse_reply(line: bytes) -> dict:
+    if not line:
+        raise RunnerPoolError("Runner pool closed the connection without replying")
+    try:
+        reply = json.loads(line)
+    except json.JSONDecodeError:
+        raise RunnerPoolError(f"Invalid reply from runner pool: {line[:200]!r}")
+    if "error" in reply:
+        raise RunnerPoolError(reply["error"])
+    return reply
+
+
+def ping_runner_pool() -> dict:
+    """Return the pool's health/stats reply (blocking, used at startup)"""
+    try:
+        with socket.create_connection((RUNNER_POOL_HOST, RUNNER_POOL_PORT), timeout=POOL_CONNECT_TIMEOUT) as sock:
+            sock.sendall(b'{"op": "ping"}\n')
+            line = sock.makefile("rb").readline()
+    except OSError as e:
+        raise RunnerPoolError(f"Runner pool unreachable: {e}")
+    return _parse_reply(line)
+
+
+def check_runner_pool() -> bool:
+    try:
+        stats = ping_runner_pool()
+        print(f"✅ Runner pool is up: {stats.get('idle')}/{stats.get('size')} workers idle")
+        return True
+    except RunnerPoolError as e:
+        print(f"⚠️ Runner pool not available, falling back to docker exec: {e}")
+        return False
+
+
+async def _pool_job(payload: dict, timeout: float, on_line=None) -> dict:
+    """Send one request to the pool and wait for its final reply.
+
+    Streamed ``{"line": ...}`` frames are handed to ``on_line`` (which may
+    be a coroutine function) as they arrive. If the awaiting task is
+    cancelled the connection is closed, which makes the pool kill the job's
+    process group.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout + POOL_RESPONSE_GRACE
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(RUNNER_POOL_HOST, RUNNER_POOL_PORT, limit=POOL_READ_LIMIT),
+            timeout=POOL_CONNECT_TIMEOUT,
+        )
+        payload = dict(payload, stream=on_line is not None)
+        writer.write(json.dumps(payload).encode("utf-8") + b"\n")
+        await writer.drain()
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout=max(0, deadline - loop.time()))
+            reply = _parse_reply(line)
+            if "line" not in reply:
+                return reply
+            if on_line is not None:
+                maybe_coro = on_line(reply["line"])
+                if asyncio.iscoroutine(maybe_coro):
+                    await maybe_coro
+    except asyncio.TimeoutError:
+        raise RunnerPoolError("Runner pool did not reply in time")
+    except (OSError, ValueError) as e:
+        raise RunnerPoolError(f"Runner pool unreachable: {e}")
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def run_in_pool(script: str, timeout: float, on_line=None) -> dict:
+    """Run a complete test runner script on a warm worker.
+
+    Returns a dict with ``returncode``, ``stdout``, ``stderr``, ``timed_out``
+    and ``rusage`` (the job process's wall/CPU time and peak RSS).
+    """
+    return await _pool_job({"op": "run", "script": script, "timeout": timeout}, timeout, on_line)
+
+
+async def upload_cases(cases_key: str, test_cases: list) -> int:
+    """Store a problem's test cases in the runner as a reusable artifact"""
+    reply = await _pool_job(
+        {"op": "load_cases", "cases_key": cases_key, "cases": test_cases},
+        timeout=POOL_CONNECT_TIMEOUT,
+    )
+    print(f"📦 Uploaded test case artifact {cases_key} ({reply.get('bytes')} bytes)")
+    return reply.get("bytes", 0)
+
+
+async def run_harness_in_pool(job: dict, test_cases: list, timeout: float, on_line=None) -> dict:
+    """Run the precompiled harness against a cached test case artifact.
+
+    ``job`` carries ``cases_key``, ``code``, ``func_name``, ``problem_title``
+    and the ``start``/``end``/``total`` case range. ``test_cases`` is the
+    full case list for ``cases_key`` and is only sent when the runner does
+    not have the artifact yet. Returns the same shape as ``run_in_pool``.
+    """
+    payload = dict(job, op="run_harness", timeout=timeout)
+    reply = await _pool_job(payload, timeout, on_line)
+    if reply.get("missing_cases"):
+        await upload_cases(job["cases_key"], test_cases)
+        reply = await _pool_job(payload, timeout, on_line)
+        if reply.get("missing_cases"):
+            raise RunnerPoolError(f"Runner pool lost test case artifact {job['cases_key']}")
+    return reply
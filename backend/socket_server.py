@@ -1,11 +1,20 @@
 import socketio
+from room_broadcaster import RoomBroadcaster
+from socket_manager import create_client_manager
+from presence import presence
+from match_clock import match_clock
 
-# Create Socket.IO server
+# Create Socket.IO server; with SOCKETIO_MESSAGE_QUEUE set, emits are shared
+# with every other worker/node through the bus (see socket_manager.py)
 sio = socketio.AsyncServer(
     cors_allowed_origins="*",
-    async_mode="asgi"
+    async_mode="asgi",
+    client_manager=create_client_manager(),
 )
 
+# Coalesces room_delta emits per room (see room_broadcaster.py)
+room_broadcaster = RoomBroadcaster(sio.emit)
+
 @sio.event
 async def connect(sid, environ):
     print("🔌 Client connected:", sid)
@@ -13,8 +22,22 @@ async def connect(sid, environ):
 @sio.event
 async def disconnect(sid):
     print("❌ Client disconnected:", sid)
-    # Note: Room cleanup is handled by the HTTP leave endpoint
-    # Socket disconnection doesn't automatically remove from rooms
+    # The player stays in their room for the presence grace period; if no
+    # socket of theirs rejoins by then, the sweeper removes them
+    presence.unbind(sid)
+
+async def send_room_snapshot(sid, room_code: str):
+    """Send the full room state (including its rev) to one client"""
+    from room_engine import room_store
+    from room_repository import serialize_room
+    room = await room_store.find_room(room_code)
+    if room:
+        print(f"📡 Sending room snapshot for {room_code} (rev {room.get('rev')}) to {sid}")
+        # Convert ObjectId/datetime for JSON serialization
+        serialize_room(room)
+        await sio.emit("room_update", room, to=sid)
+    else:
+        print(f"❌ Room {room_code} not found in database")
 
 @sio.on("join_room")
 async def handle_join_room(sid, data):
@@ -23,21 +46,29 @@ async def handle_join_room(sid, data):
     if room_code:
         await sio.enter_room(sid, room_code)
         print(f"✅ {sid} joined room {room_code}")
+        if data.get("userId"):
+            await presence.bind(sid, data["userId"], room_code)
+        # Only the client that just joined needs the full state; everyone
+        # else already has it and keeps up through room_delta
+        await send_room_snapshot(sid, room_code)
+
+def user_channel(user_id: str) -> str:
+    """Socket.IO room holding every socket of one user (quick-play notifications)"""
+    return f"user:{user_id}"
 
-        # Only send current room state to the specific client that just joined
-        # Don't broadcast to everyone unless there was an actual room change
-        from main import db
-        room = db.rooms.find_one({"code": room_code})
-        if room:
-            print(f"📡 Sending room state to new client for {room_code}: {room.get('players', [])}")
-            room["_id"] = str(room["_id"])
-            # Convert datetime to ISO string for JSON serialization
-            if "created_at" in room:
-                room["created_at"] = room["created_at"].isoformat()
-            # Send only to the client that just joined, not to everyone
-            await sio.emit("room_update", room, to=sid)
-        else:
-            print(f"❌ Room {room_code} not found in database")
+@sio.on("watch_matchmaking")
+async def handle_watch_matchmaking(sid, data):
+    """Client waits in the quick-play queue and wants its match_found"""
+    user_id = data.get("userId")
+    if user_id:
+        await sio.enter_room(sid, user_channel(user_id))
+
+@sio.on("sync_room")
+async def handle_sync_room(sid, data):
+    """Client saw a gap in room_delta revisions and asks for a fresh snapshot"""
+    room_code = data.get("roomCode")
+    if room_code:
+        await send_room_snapshot(sid, room_code)
 
 @sio.on("leave_room")
 async def handle_leave_room(sid, data):
@@ -46,10 +77,46 @@ async def handle_leave_room(sid, data):
     if room_code:
         await sio.leave_room(sid, room_code)
         print(f"❌ {sid} left room {room_code}")
+        presence.unbind(sid)
+
+# ---------------------------
+# Room deltas
+# ---------------------------
+# Instead of the whole room, changes go out as
+#   room_delta {code, baseRev, rev, ops: [{op, ...}]}
+# where the ops take the room from baseRev to rev (several revisions when
+# room_broadcaster merged them). A client applies a delta only if baseRev
+# is the rev it holds; on a gap it emits sync_room and gets a room_update
+# snapshot back. Ops:
+#   player_joined {player}        player_left {id}
+#   host_changed {hostId}         game_started {}
+#   player_completed {id, completedAt}
+#   game_completed {}             room_closed {}
+
+def departure_ops(room: dict, user_id: str) -> list:
+    """Ops for room_store.remove_player having removed ``user_id``"""
+    ops = [{"op": "player_left", "id": user_id}]
+    if room.get("hostRev") == room.get("rev"):
+        ops.append({"op": "host_changed", "hostId": room["hostId"]})
+    if room.get("gameCompleted"):
+        # Everyone left in the game had already finished
+        ops.append({"op": "game_completed"})
+    if not room.get("active", True):
+        ops.append({"op": "room_closed"})
+    return ops
+
+def completion_ops(room: dict, user_id: str) -> list:
+    """Ops for room_store.complete_player having marked ``user_id`` done"""
+    player = next(p for p in room["players"] if p["id"] == user_id)
+    ops = [{"op": "player_completed", "id": user_id, "completedAt": player.get("completedAt")}]
+    if room.get("gameCompleted"):
+        ops += [{"op": "game_completed"}, {"op": "room_closed"}]
+    return ops
 
-async def broadcast_room_update(room: dict):
-    """Send the latest room state to all clients in that room"""
-    print(f"📡 Broadcasting room update to room {room['code']}")
-    print(f"📡 Room players: {room.get('players', [])}")
-    await sio.emit("room_update", room, to=room["code"])
-    print(f"📡 Room update broadcasted successfully")
+async def broadcast_room_delta(room: dict, ops: list):
+    """Send the ops that took the room to its current rev to all clients in it"""
+    print(f"📡 Room {room['code']} rev {room.get('rev')}: {', '.join(op['op'] for op in ops)}")
+    if any(op["op"] == "room_closed" for op in ops):
+        # Finished, cancelled or emptied before its deadline
+        match_clock.cancel(room["code"])
+    await room_broadcaster.publish(room["code"], room.get("rev"), ops)
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+# Run from the backend directory: python -m pytest tests
+# Backend modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tests marked "mongo" talk to a real server, so they only run when
+# MONGO_URI is set explicitly, e.g. in CI next to a mongo service
+MONGO_URI_GIVEN = "MONGO_URI" in os.environ
+
+# Never the real cluster; the client connects lazily, so nothing needs to
+# listen here unless a test actually queries the database
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "mongo: needs a MongoDB server at MONGO_URI")
+
+
+def pytest_collection_modifyitems(config, items):
+    if MONGO_URI_GIVEN:
+        return
+    skip = pytest.mark.skip(reason="MONGO_URI is not set")
+    for item in items:
+        if "mongo" in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,88 @@
+import asyncio
+
+import presence as presence_module
+from presence import PresenceTracker
+
+
+class SharedCollection:
+    """The few collection calls PresenceTracker makes, over one dict"""
+
+    def __init__(self):
+        self.docs = {}
+
+    async def update_one(self, query, update, upsert=False):
+        if upsert or query["_id"] in self.docs:
+            self.docs.setdefault(query["_id"], {"_id": query["_id"]}).update(update["$set"])
+
+    async def update_many(self, query, update):
+        for doc_id in query["_id"]["$in"]:
+            if doc_id in self.docs:
+                self.docs[doc_id].update(update["$set"])
+
+    def find(self, query):
+        docs = [dict(self.docs[doc_id]) for doc_id in query["_id"]["$in"] if doc_id in self.docs]
+
+        class Cursor:
+            async def to_list(self, length):
+                return docs
+
+        return Cursor()
+
+
+class RecordingStore:
+    def __init__(self):
+        self.removed = []
+
+    async def remove_player(self, user_id, room_code=None):
+        self.removed.append((user_id, room_code))
+        return None
+
+
+def run_workers(scenario):
+    """Run ``scenario(worker_a, worker_b, store)`` with two workers sharing presence"""
+    collection = SharedCollection()
+    store = RecordingStore()
+    original = presence_module.room_store
+    presence_module.room_store = store
+    try:
+        workers = [PresenceTracker(grace_seconds=0.05, collection=collection) for _ in range(2)]
+        asyncio.run(scenario(*workers, store))
+    finally:
+        presence_module.room_store = original
+    return store
+
+
+def test_player_connected_to_another_worker_is_not_swept():
+    async def scenario(http_worker, socket_worker, store):
+        # Joined over HTTP on one worker, socket on the other
+        http_worker.expect("u1", "ROOM01")
+        await asyncio.sleep(0.01)
+        await socket_worker.bind("sid-1", "u1", "ROOM01")
+        await asyncio.sleep(0.1)
+        await socket_worker.heartbeat()
+        assert await http_worker.sweep() == 0
+        assert store.removed == []
+        assert http_worker.stats()["handed_over"] == 1
+
+        # Once that socket goes, its worker sweeps them after the grace period
+        await asyncio.sleep(0.01)
+        socket_worker.unbind("sid-1")
+        await asyncio.sleep(0.1)
+        await socket_worker.sweep()
+        await http_worker.sweep()
+        assert store.removed == [("u1", "ROOM01")]
+
+    run_workers(scenario)
+
+
+def test_player_who_never_connects_is_swept():
+    async def scenario(http_worker, socket_worker, store):
+        http_worker.expect("u1", "ROOM01")
+        await asyncio.sleep(0.01)
+        # Someone else's socket doesn't count
+        await socket_worker.bind("sid-2", "u2", "ROOM01")
+        await asyncio.sleep(0.1)
+        await http_worker.sweep()
+        assert store.removed == [("u1", "ROOM01")]
+
+    run_workers(scenario)
@@ -0,0 +1,16 @@
+import asyncio
+
+import pytest
+
+from check_query_plans import winning_plans
+from indexes import ensure_indexes
+
+
+@pytest.mark.mongo
+def test_hot_queries_do_not_scan_collections():
+    async def explain_all():
+        await ensure_indexes()
+        return await winning_plans()
+
+    scans = {description: stages for description, stages in asyncio.run(explain_all()) if "COLLSCAN" in stages}
+    assert scans == {}
@@ -0,0 +1,67 @@
+import asyncio
+
+import socketio
+
+from socket_manager import LocalPubSubManager, create_client_manager
+
+
+def make_server(channel: str):
+    """A Socket.IO server on ``channel`` that records the packets it sends to its sockets"""
+    server = socketio.AsyncServer(async_mode="asgi", client_manager=LocalPubSubManager(channel=channel))
+    server.sent = []
+
+    # Room emits are encoded once and handed over as raw Engine.IO packets
+    async def send_eio_packet(eio_sid, eio_pkt):
+        server.sent.append((eio_sid, server.packet_class(encoded_packet=eio_pkt.data).data))
+
+    server._send_eio_packet = send_eio_packet
+    return server
+
+
+async def wait_for(condition, timeout: float = 1.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+
+def test_room_emit_reaches_socket_on_another_server():
+    async def scenario():
+        publisher = make_server("test-cross")
+        holder = make_server("test-cross")
+        other_channel = make_server("test-other")
+        for server in (publisher, holder, other_channel):
+            server.manager.initialize()
+
+        # The player's socket lives on ``holder``; the emit happens on ``publisher``
+        sid = await holder.manager.connect("eio-1", "/")
+        await holder.enter_room(sid, "ABC123")
+        stray = await other_channel.manager.connect("eio-2", "/")
+        await other_channel.enter_room(stray, "ABC123")
+        await asyncio.sleep(0.05)  # let the listeners subscribe
+
+        await publisher.emit("room_delta", {"code": "ABC123", "rev": 2, "ops": []}, to="ABC123")
+
+        assert await wait_for(lambda: holder.sent)
+        assert holder.sent == [("eio-1", ["room_delta", {"code": "ABC123", "rev": 2, "ops": []}])]
+        # The publisher has no sockets in the room, and other channels hear nothing
+        assert publisher.sent == []
+        assert other_channel.sent == []
+
+        for server in (publisher, holder, other_channel):
+            server.manager.thread.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_create_client_manager_schemes():
+    assert create_client_manager("") is None
+    assert isinstance(create_client_manager("local://", channel="test-schemes"), LocalPubSubManager)
+    try:
+        create_client_manager("kafka://localhost")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("unsupported scheme was accepted")
@@ -0,0 +1,147 @@
+import hashlib
+import io
+import json
+import os
+import time
+import tokenize
+from collections import OrderedDict
+from typing import Optional
+
+# Cache of finished verdicts so re-submitting identical code (double clicks,
+# retries after a network hiccup, teammates pasting the same solution)
+# doesn't go back through the runner.
+VERDICT_CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", "2048"))
+VERDICT_CACHE_TTL = float(os.getenv("VERDICT_CACHE_TTL", "600"))
+
+# Tokens that never change what the code does
+_IGNORED_TOKENS = {tokenize.COMMENT, tokenize.NL, tokenize.ENCODING}
+
+
+def test_cases_version(test_cases: list) -> str:
+    """Content stamp for a problem's test set; changes whenever the cases do"""
+    payload = json.dumps(test_cases, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()[:16]
+
+
+def normalize_source(code: str) -> str:
+    """Reduce source to its token stream, dropping comments and layout.
+
+    Blank lines, trailing whitespace, comments and indentation width all
+    disappear, while string literals are kept verbatim, so two sources only
+    normalize the same way if they run the same way.
+    """
+    try:
+        parts = []
+        for token in tokenize.generate_tokens(io.StringIO(code).readline):
+            if token.type in _IGNORED_TOKENS:
+                continue
+            if token.type == tokenize.INDENT:
+                parts.append("<INDENT>")
+            elif token.type == tokenize.NEWLINE:
+                parts.append("\n")
+            else:
+                parts.append(token.string)
+        return " ".join(parts)
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        # Not valid Python; fall back to only ignoring trailing whitespace
+        lines = [line.rstrip() for line in code.splitlines()]
+        return "\n".join(line for line in lines if line)
+
+
+def verdict_key(
+    code: str, problem_title: str, test_version: str, is_submit: bool, limits: Optional[dict] = None
+) -> str:
+    mode = "submit" if is_submit else "run"
+    # Changing a problem's limits can change the verdict, so they are part of the key
+    limits_stamp = json.dumps(limits or {}, sort_keys=True)
+    digest = hashlib.sha256()
+    for part in (normalize_source(code), problem_title, test_version, mode, limits_stamp):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class VerdictCache:
+    """Size-bounded LRU of verdicts with a TTL, grouped by problem title"""
+
+    def __init__(self, max_entries: int = VERDICT_CACHE_SIZE, ttl: float = VERDICT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (expires_at, problem_title, verdict)
+        self._entries = OrderedDict()
+        self._keys_by_problem = {}
+        self._versions = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, problem_title, verdict = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(verdict)
+
+    def put(self, key: str, problem_title: str, verdict: dict):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, problem_title, dict(verdict))
+        self._keys_by_problem.setdefault(problem_title, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def observe_version(self, problem_title: str, test_version: str):
+        """Drop a problem's verdicts as soon as its test set changes"""
+        previous = self._versions.get(problem_title)
+        self._versions[problem_title] = test_version
+        if previous is not None and previous != test_version:
+            print(f"♻️ Test cases for '{problem_title}' changed, invalidating cached verdicts")
+            self.invalidate_problem(problem_title)
+
+    def invalidate_problem(self, problem_title: str):
+        for key in list(self._keys_by_problem.get(problem_title, ())):
+            self._remove(key)
+            self.invalidations += 1
+
+    def clear(self):
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._keys_by_problem.clear()
+
+    def _remove(self, key: str):
+        _, problem_title, _ = self._entries.pop(key)
+        keys = self._keys_by_problem.get(problem_title)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_problem[problem_title]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+verdict_cache = VerdictCache()
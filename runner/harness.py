@@ -0,0 +1,246 @@
+"""Test harness executed inside the leet-code-runner container.
+
+Imported once by every warm pool worker, so only the user's solution has
+to be compiled per submission. ``run_cases`` prints one progress line per
+passing test and the verdict as the final JSON line, which is the output
+contract the backend parses. Verdicts carry a ``stats`` block with the
+wall and CPU time of every test call and the process's peak RSS.
+
+``apply_limits`` installs a job's CPU, address space and file size rlimits
+in the process that is about to run a submission. The memory limit is on
+peak RSS, checked by whoever waits for the process; the address space cap
+is only a backstop. A solution that runs out of memory exits with
+MEMORY_LIMIT_EXIT instead of reporting a failed test, so the caller can
+tell it apart from a wrong answer.
+"""
+import json
+import math
+import os
+import resource
+import sys
+import time
+import traceback
+import heapq
+import bisect
+import itertools
+import functools
+import operator
+from collections import defaultdict, deque, Counter, OrderedDict
+from typing import List, Dict, Set, Optional, Tuple
+
+# Names user solutions have always been able to use without importing them
+SOLUTION_GLOBALS = {
+    "json": json, "sys": sys, "traceback": traceback, "math": math,
+    "heapq": heapq, "bisect": bisect, "itertools": itertools,
+    "functools": functools, "operator": operator,
+    "defaultdict": defaultdict, "deque": deque, "Counter": Counter,
+    "OrderedDict": OrderedDict, "List": List, "Dict": Dict, "Set": Set,
+    "Optional": Optional, "Tuple": Tuple,
+}
+
+
+# Exit status of a job that hit its memory limit
+MEMORY_LIMIT_EXIT = 86
+# Address space cap (MB) for every job, whatever its memory limit. Preloaded
+# numpy and thread stacks reserve far more address space than they touch,
+# so capping it at memory_mb failed trivial solutions on import.
+ADDRESS_SPACE_MB = int(os.getenv("RUNNER_ADDRESS_SPACE_MB", "4096"))
+
+
+def apply_limits(limits):
+    """Set rlimits for the current process from a job's ``limits`` dict.
+
+    ``cpu_seconds`` becomes RLIMIT_CPU (SIGXCPU at the soft limit, SIGKILL a
+    second later) and ``output_bytes`` RLIMIT_FSIZE for anything the
+    solution writes to files. ``memory_mb`` is compared with the peak RSS
+    (see ``memory_exceeded``); RLIMIT_AS only stops a runaway allocation at
+    ADDRESS_SPACE_MB, or at ``memory_mb`` if that is higher. Output to the
+    pipes is counted by whoever reads them.
+    """
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    cpu_seconds = limits.get("cpu_seconds")
+    if cpu_seconds:
+        soft = max(1, math.ceil(cpu_seconds))
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, soft + 1))
+    memory_mb = limits.get("memory_mb")
+    if memory_mb:
+        size = int(max(memory_mb, ADDRESS_SPACE_MB) * 1024 * 1024)
+        resource.setrlimit(resource.RLIMIT_AS, (size, size))
+    output_bytes = limits.get("output_bytes")
+    if output_bytes:
+        resource.setrlimit(resource.RLIMIT_FSIZE, (output_bytes, output_bytes))
+
+
+def memory_exceeded(limits, max_rss_kb) -> bool:
+    """Whether a peak RSS (ru_maxrss, in kilobytes on Linux) broke ``memory_mb``"""
+    memory_mb = limits.get("memory_mb")
+    return bool(memory_mb) and max_rss_kb > memory_mb * 1024
+
+
+def validate_solution(actual_output, expected_output, input_data, problem_title):
+    """Custom validation for problems that may have multiple valid solutions"""
+
+    if problem_title == "Two Sum":
+        # For Two Sum, check if the returned indices sum to the target
+        if not isinstance(actual_output, list) or len(actual_output) != 2:
+            return False
+        try:
+            nums = input_data.get("nums") if isinstance(input_data, dict) else input_data
+            target = input_data.get("target") if isinstance(input_data, dict) else None
+            if target is None:
+                return actual_output == expected_output
+
+            i, j = actual_output[0], actual_output[1]
+            if i < 0 or j < 0 or i >= len(nums) or j >= len(nums) or i == j:
+                return False
+            return nums[i] + nums[j] == target
+        except (IndexError, KeyError, TypeError):
+            return False
+
+    elif problem_title == "Reverse String":
+        # For string reversal, both should be strings and one should be reverse of input
+        if not isinstance(actual_output, str):
+            return False
+        try:
+            s = input_data.get("s") if isinstance(input_data, dict) else input_data
+            return actual_output == s[::-1]
+        except:
+            return actual_output == expected_output
+
+    elif problem_title == "Merge Two Sorted Lists":
+        # For merged lists, check if result is properly sorted and contains all elements
+        if not isinstance(actual_output, list):
+            return False
+        try:
+            list1 = input_data.get("list1", []) if isinstance(input_data, dict) else []
+            list2 = input_data.get("list2", []) if isinstance(input_data, dict) else []
+            all_elements = sorted(list1 + list2)
+            return sorted(actual_output) == all_elements and actual_output == sorted(actual_output)
+        except:
+            return actual_output == expected_output
+
+    # For other problems, use exact match
+    return actual_output == expected_output
+
+
+def run_cases(user_code, func_name, test_cases, problem_title, case_offset=0, total_cases=None):
+    """Run ``user_code``'s ``func_name`` against ``test_cases`` and print the verdict"""
+    if total_cases is None:
+        total_cases = len(test_cases)
+
+    namespace = dict(SOLUTION_GLOBALS, __name__="__main__")
+    try:
+        exec(compile(user_code, "<solution>", "exec"), namespace)
+    except MemoryError:
+        raise
+    except Exception:
+        # Report it as a runtime error, showing only the solution's frames
+        exc_type, exc, tb = sys.exc_info()
+        traceback.print_exception(exc_type, exc, tb.tb_next)
+        sys.exit(1)
+
+    passed_count = 0
+    case_stats = []
+    for i, test_case in enumerate(test_cases):
+        input_data = None
+        expected_output = None
+        try:
+            # Get input parameters
+            input_data = test_case["input"]
+            expected_output = test_case["output"]
+
+            if func_name not in namespace:
+                raise NameError(f"name '{func_name}' is not defined")
+            func = namespace[func_name]
+
+            # Call user's function
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            if isinstance(input_data, dict):
+                # Multiple parameters
+                actual_output = func(**input_data)
+            else:
+                # Single parameter
+                actual_output = func(input_data)
+            case_stats.append({
+                "test_number": case_offset + i + 1,
+                "wall_ms": round((time.perf_counter() - wall_start) * 1000, 3),
+                "cpu_ms": round((time.process_time() - cpu_start) * 1000, 3),
+                "peak_rss_kb": _peak_rss_kb(),
+            })
+
+            # Check if output matches expected (with custom validation for certain problems)
+            passed = validate_solution(actual_output, expected_output, input_data, problem_title)
+        except MemoryError:
+            raise
+        except Exception as e:
+            # Exception occurred, stop here and return error details
+            _emit({
+                "passed": False,
+                "failed_at": case_offset + i + 1,
+                "total_tests": total_cases,
+                "input": input_data,
+                "expected": expected_output,
+                "output": None,
+                "error": str(e),
+                "passed_tests": case_offset + passed_count,
+                "stats": _run_stats(case_stats)
+            })
+            return
+
+        if not passed:
+            # Test failed, stop here and return failure details
+            _emit({
+                "passed": False,
+                "failed_at": case_offset + i + 1,
+                "total_tests": total_cases,
+                "input": input_data,
+                "expected": expected_output,
+                "output": actual_output,
+                "passed_tests": case_offset + passed_count,
+                "stats": _run_stats(case_stats)
+            })
+            return
+
+        passed_count += 1
+        # Progress line so the backend can report results as they finish
+        _emit({"progress": dict(case_stats[-1], passed=True)})
+
+    # If we get here, all tests passed
+    _emit({
+        "passed": True,
+        "passed_tests": passed_count,
+        "total_tests": total_cases,
+        "all_passed": True,
+        "stats": _run_stats(case_stats)
+    })
+
+
+def run_limited(limits, *args):
+    """Entry point for one-off scripts: apply ``limits``, then ``run_cases(*args)``"""
+    apply_limits(limits)
+    try:
+        run_cases(*args)
+    except MemoryError:
+        os._exit(MEMORY_LIMIT_EXIT)
+    if memory_exceeded(limits, _peak_rss_kb()):
+        sys.stdout.flush()
+        os._exit(MEMORY_LIMIT_EXIT)
+
+
+def _peak_rss_kb():
+    # Linux reports ru_maxrss in kilobytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _run_stats(case_stats):
+    return {
+        "wall_ms": round(sum(case["wall_ms"] for case in case_stats), 3),
+        "cpu_ms": round(sum(case["cpu_ms"] for case in case_stats), 3),
+        "peak_rss_kb": _peak_rss_kb(),
+        "cases": case_stats,
+    }
+
+
+def _emit(payload):
+    print(json.dumps(payload, default=str), flush=True)
@@ -0,0 +1,571 @@
+"""Warm worker pool for the leet-code-runner container.
+
+Runs inside the runner container and keeps a pool of long-lived Python
+worker processes with the harness modules already imported. The backend
+sends one job per TCP connection as a line of JSON; a free worker picks it
+up, forks an isolated child to execute the submission and returns the
+child's exit code and output. Workers are recycled after a configurable
+number of jobs so leaked state from one submission can't build up. If the
+backend closes the connection before the reply arrives, the job is
+cancelled and its whole process group is killed. Jobs sent with
+``"stream": true`` get each stdout line relayed as soon as it is printed.
+
+Besides raw scripts (``run``), the pool runs the precompiled harness
+(``run_harness``): a problem's test cases are uploaded once with
+``load_cases`` and stored as a marshal artifact keyed by problem and test
+set version, so a job only carries the user's code, the artifact key and
+the slice of cases to run. A job whose artifact is missing (e.g. after a
+container restart) is answered with ``{"missing_cases": true}``.
+
+Jobs may carry ``limits`` (``cpu_seconds``, ``memory_mb``,
+``output_bytes``). The child applies them as rlimits before running the
+submission, the supervisor kills the whole process group once the output
+budget or the wall clock timeout is spent and checks the child's peak RSS
+against ``memory_mb`` when it is reaped, and the result names the limit
+that was hit in ``limit_exceeded`` ("time", "memory" or "output").
+
+Configuration (environment variables):
+    RUNNER_POOL_HOST             bind address (default 0.0.0.0)
+    RUNNER_POOL_PORT             listen port (default 8765)
+    RUNNER_POOL_SIZE             number of warm workers (default 4)
+    RUNNER_MAX_JOBS_PER_WORKER   recycle a worker after N jobs (default 50)
+    RUNNER_HEALTH_INTERVAL       seconds between worker health sweeps (default 5)
+    RUNNER_DEFAULT_TIMEOUT       wall clock limit per job in seconds (default 10)
+    RUNNER_ARTIFACT_DIR          where test case artifacts are stored
+                                 (default /tmp/runner-artifacts, a tmpfs in compose)
+    RUNNER_ARTIFACT_TTL          seconds an unused artifact is kept (default 6h)
+
+Run ``python pool_server.py --health`` to ping a running pool; it exits 0
+when the pool answers, which is what the container healthcheck uses.
+"""
+import hashlib
+import importlib
+import json
+import marshal
+import multiprocessing
+import os
+import queue
+import select
+import selectors
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+
+import harness
+
+POOL_HOST = os.getenv("RUNNER_POOL_HOST", "0.0.0.0")
+POOL_PORT = int(os.getenv("RUNNER_POOL_PORT", "8765"))
+POOL_SIZE = int(os.getenv("RUNNER_POOL_SIZE", "4"))
+MAX_JOBS_PER_WORKER = int(os.getenv("RUNNER_MAX_JOBS_PER_WORKER", "50"))
+HEALTH_INTERVAL = float(os.getenv("RUNNER_HEALTH_INTERVAL", "5"))
+DEFAULT_TIMEOUT = float(os.getenv("RUNNER_DEFAULT_TIMEOUT", "10"))
+ARTIFACT_DIR = os.getenv("RUNNER_ARTIFACT_DIR", "/tmp/runner-artifacts")
+ARTIFACT_TTL = float(os.getenv("RUNNER_ARTIFACT_TTL", str(6 * 3600)))
+ARTIFACT_JANITOR_INTERVAL = 300
+
+# Modules every generated test runner imports; loading them once per worker
+# is what makes the pool "warm".
+PRELOADED_MODULES = (
+    "json", "sys", "traceback", "math", "heapq", "bisect", "itertools",
+    "functools", "operator", "collections", "typing", "harness",
+)
+
+# Decoded test case artifacts each worker keeps in memory
+WORKER_CASE_CACHE_SIZE = 32
+
+# Extra seconds the supervisor waits on a worker beyond the job timeout
+# before declaring the worker hung.
+WORKER_GRACE_SECONDS = 5
+
+# How often a waiting job checks whether the backend hung up
+CANCEL_POLL_INTERVAL = 0.05
+
+# Workers are started from a single-threaded fork server rather than from the
+# (threaded) supervisor, and the fork server itself preloads the modules.
+_mp_context = multiprocessing.get_context("forkserver")
+
+
+# ---------------------------
+# Worker side
+# ---------------------------
+
+def run_isolated(target, timeout: float, limits=None, on_start=None, on_line=None) -> dict:
+    """Call ``target()`` in a forked child and collect its output.
+
+    ``limits`` are applied to the child with ``harness.apply_limits``.
+    ``on_start`` is called with the child's pid (which is also its process
+    group id) right after the fork, so the supervisor can kill it early.
+    ``on_line`` is called with each complete stdout line as it arrives.
+    """
+    limits = limits or {}
+    output_budget = limits.get("output_bytes")
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    pid = os.fork()
+    if pid == 0:
+        # Child: own process group so a timeout can kill everything it spawns
+        os.setsid()
+        os.dup2(out_w, 1)
+        os.dup2(err_w, 2)
+        # Drop every other inherited descriptor, including the worker's pipe
+        # back to the supervisor
+        os.closerange(3, os.sysconf("SC_OPEN_MAX"))
+        exit_code = 0
+        try:
+            harness.apply_limits(limits)
+            target()
+        except MemoryError:
+            os._exit(harness.MEMORY_LIMIT_EXIT)
+        except SystemExit as e:
+            if e.code is None:
+                exit_code = 0
+            elif isinstance(e.code, int):
+                exit_code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                exit_code = 1
+        except BaseException:
+            traceback.print_exc()
+            exit_code = 1
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(exit_code)
+
+    # Parent: drain both pipes until the child closes them or time runs out
+    started = time.monotonic()
+    if on_start is not None:
+        on_start(pid)
+    os.close(out_w)
+    os.close(err_w)
+    chunks = {out_r: [], err_r: []}
+    partial_line = b""
+    deadline = time.monotonic() + timeout
+    timed_out = False
+    output_exceeded = False
+    output_size = 0
+
+    with selectors.DefaultSelector() as selector:
+        selector.register(out_r, selectors.EVENT_READ)
+        selector.register(err_r, selectors.EVENT_READ)
+        while selector.get_map() and not output_exceeded:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                break
+            for key, _ in selector.select(remaining):
+                data = os.read(key.fd, 65536)
+                if data and output_budget:
+                    output_size += len(data)
+                    if output_size > output_budget:
+                        output_exceeded = True
+                        break
+                if data:
+                    chunks[key.fd].append(data)
+                    if on_line is not None and key.fd == out_r:
+                        *lines, partial_line = (partial_line + data).split(b"\n")
+                        for line in lines:
+                            on_line(line.decode("utf-8", errors="replace"))
+                else:
+                    selector.unregister(key.fd)
+
+    if timed_out or output_exceeded:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    _, status, rusage = os.wait4(pid, 0)
+    wall_ms = (time.monotonic() - started) * 1000
+    os.close(out_r)
+    os.close(err_r)
+
+    if os.WIFEXITED(status):
+        returncode = os.WEXITSTATUS(status)
+    else:
+        returncode = -os.WTERMSIG(status)
+
+    limit_exceeded = None
+    cpu_seconds = limits.get("cpu_seconds")
+    if output_exceeded:
+        limit_exceeded = "output"
+    elif timed_out:
+        limit_exceeded = "time"
+    elif returncode == -signal.SIGXCPU or (
+        # Past the soft limit the kernel follows up with SIGKILL
+        returncode == -signal.SIGKILL and cpu_seconds
+        and rusage.ru_utime + rusage.ru_stime >= cpu_seconds
+    ):
+        limit_exceeded = "time"
+    elif returncode == harness.MEMORY_LIMIT_EXIT or harness.memory_exceeded(limits, rusage.ru_maxrss):
+        limit_exceeded = "memory"
+
+    return {
+        "returncode": returncode,
+        "stdout": b"".join(chunks[out_r]).decode("utf-8", errors="replace"),
+        "stderr": b"".join(chunks[err_r]).decode("utf-8", errors="replace"),
+        "timed_out": timed_out,
+        "limit_exceeded": limit_exceeded,
+        # Whole-process accounting for the child, including interpreter overhead
+        "rusage": {
+            "wall_ms": round(wall_ms, 3),
+            "user_cpu_ms": round(rusage.ru_utime * 1000, 3),
+            "sys_cpu_ms": round(rusage.ru_stime * 1000, 3),
+            "max_rss_kb": rusage.ru_maxrss,
+        },
+    }
+
+
+def artifact_path(cases_key: str) -> str:
+    digest = hashlib.sha1(cases_key.encode("utf-8")).hexdigest()
+    return os.path.join(ARTIFACT_DIR, f"{digest}.marshal")
+
+
+def store_cases(cases_key: str, cases: list) -> int:
+    """Write a test case artifact atomically; returns its size in bytes"""
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    data = marshal.dumps(cases)
+    path = artifact_path(cases_key)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return len(data)
+
+
+_case_cache = OrderedDict()
+
+
+def load_cases(cases_key: str) -> list:
+    """Worker-side artifact loader with a small in-memory LRU"""
+    cases = _case_cache.get(cases_key)
+    if cases is None:
+        with open(artifact_path(cases_key), "rb") as f:
+            cases = marshal.load(f)
+        _case_cache[cases_key] = cases
+        if len(_case_cache) > WORKER_CASE_CACHE_SIZE:
+            _case_cache.popitem(last=False)
+    else:
+        _case_cache.move_to_end(cases_key)
+    return cases
+
+
+def job_target(job: dict):
+    """Turn a job into the zero-argument callable its forked child runs"""
+    if "harness" in job:
+        spec = job["harness"]
+        # Loaded before the fork, so the child shares the decoded cases
+        cases = load_cases(spec["cases_key"])[spec["start"]:spec["end"]]
+        return lambda: harness.run_cases(
+            spec["code"], spec["func_name"], cases, spec["problem_title"], spec["start"], spec["total"]
+        )
+
+    script = job["script"]
+    return lambda: exec(compile(script, "<submission>", "exec"), {"__name__": "__main__"})
+
+
+def worker_main(conn, max_jobs: int):
+    """Long-lived worker loop: one job in, one result out, until recycled"""
+    for name in PRELOADED_MODULES:
+        importlib.import_module(name)
+
+    for _ in range(max_jobs):
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        try:
+            target = job_target(job)
+        except FileNotFoundError:
+            # The janitor removed the artifact after the supervisor checked
+            # for it; the backend uploads it again and retries
+            conn.send({"missing_cases": True})
+            continue
+        try:
+            result = run_isolated(
+                target,
+                job.get("timeout", DEFAULT_TIMEOUT),
+                limits=job.get("limits"),
+                on_start=lambda pid: conn.send({"started": pid}),
+                on_line=(lambda line: conn.send({"line": line})) if job.get("stream") else None,
+            )
+        except Exception as e:
+            result = {"returncode": 1, "stdout": "", "stderr": f"Worker error: {e}", "timed_out": False}
+        conn.send(result)
+
+
+# ---------------------------
+# Supervisor side
+# ---------------------------
+
+class Worker:
+    def __init__(self, max_jobs: int):
+        self.conn, child_conn = _mp_context.Pipe()
+        self.process = _mp_context.Process(target=worker_main, args=(child_conn, max_jobs), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.max_jobs = max_jobs
+        self.jobs = 0
+        # Process group of the job running right now, if it has started
+        self.child_pid = None
+
+    def is_healthy(self) -> bool:
+        return self.process.is_alive() and self.jobs < self.max_jobs
+
+    def run(self, job: dict, cancelled=None, on_line=None) -> dict:
+        """Send ``job`` to the worker and wait for its result.
+
+        ``cancelled`` is polled while the job runs; once it returns True the
+        job's process group is killed and the (discarded) result is drained.
+        Streamed stdout lines are handed to ``on_line``.
+        """
+        self.conn.send(job)
+        self.jobs += 1
+        deadline = time.monotonic() + job.get("timeout", DEFAULT_TIMEOUT) + WORKER_GRACE_SECONDS
+        self.child_pid = None
+        while True:
+            if self.conn.poll(CANCEL_POLL_INTERVAL):
+                message = self.conn.recv()
+                if "line" in message:
+                    if on_line is not None:
+                        on_line(message["line"])
+                    continue
+                if "started" not in message:
+                    self.child_pid = None
+                    return message
+                self.child_pid = message["started"]
+                continue
+            if time.monotonic() > deadline:
+                # The job's group is left for stop() to kill
+                raise TimeoutError("worker did not answer in time")
+            if self.child_pid is not None and cancelled is not None and cancelled():
+                self.kill_job()
+
+    def kill_job(self):
+        """SIGKILL the running job's process group; it lives on if only the worker dies"""
+        if self.child_pid is None:
+            return
+        try:
+            os.killpg(self.child_pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.child_pid = None
+
+    def stop(self):
+        self.kill_job()
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    def __init__(self, size: int, max_jobs: int):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.jobs_completed = 0
+        self.workers_recycled = 0
+        for _ in range(size):
+            self.idle.put(Worker(max_jobs))
+
+    def _replace(self, worker: Worker) -> Worker:
+        worker.stop()
+        with self.lock:
+            self.workers_recycled += 1
+        return Worker(self.max_jobs)
+
+    def submit(self, job: dict, cancelled=None, on_line=None) -> dict:
+        worker = None
+        while worker is None:
+            try:
+                worker = self.idle.get(timeout=CANCEL_POLL_INTERVAL)
+            except queue.Empty:
+                if cancelled is not None and cancelled():
+                    return {"returncode": -1, "stdout": "", "stderr": "Cancelled", "timed_out": False}
+        try:
+            result = worker.run(job, cancelled, on_line)
+        except Exception as e:
+            worker = self._replace(worker)
+            result = {"returncode": 1, "stdout": "", "stderr": f"Pool error: {e}", "timed_out": False}
+        finally:
+            if not worker.is_healthy():
+                worker = self._replace(worker)
+            self.idle.put(worker)
+        with self.lock:
+            self.jobs_completed += 1
+        return result
+
+    def health_sweep(self):
+        """Replace idle workers that died between jobs"""
+        checked = []
+        while True:
+            try:
+                worker = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            if not worker.is_healthy():
+                worker = self._replace(worker)
+            checked.append(worker)
+        for worker in checked:
+            self.idle.put(worker)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "ok": True,
+                "size": self.size,
+                "idle": self.idle.qsize(),
+                "jobs_completed": self.jobs_completed,
+                "workers_recycled": self.workers_recycled,
+                "max_jobs_per_worker": self.max_jobs,
+            }
+
+
+class PoolRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError:
+            self._reply({"error": "invalid request"})
+            return
+
+        op = request.get("op")
+        if op == "ping":
+            self._reply(self.server.pool.stats())
+        elif op == "load_cases":
+            size = store_cases(request["cases_key"], request["cases"])
+            self._reply({"ok": True, "bytes": size})
+        elif op in ("run", "run_harness"):
+            stream = bool(request.get("stream"))
+            job = {
+                "timeout": float(request.get("timeout", DEFAULT_TIMEOUT)),
+                "limits": request.get("limits") or {},
+                "stream": stream,
+            }
+            if op == "run":
+                job["script"] = request["script"]
+            else:
+                try:
+                    # Touch it so the janitor sees the artifact is still in use
+                    os.utime(artifact_path(request["cases_key"]))
+                except FileNotFoundError:
+                    self._reply({"missing_cases": True})
+                    return
+                job["harness"] = {
+                    key: request[key]
+                    for key in ("cases_key", "code", "func_name", "problem_title", "start", "end", "total")
+                }
+            # Streamed jobs get one {"line": ...} frame per stdout line before the result
+            on_line = (lambda line: self._reply({"line": line})) if stream else None
+            self._reply(self.server.pool.submit(job, self._client_gone, on_line))
+        else:
+            self._reply({"error": f"unknown op: {op}"})
+
+    def _client_gone(self) -> bool:
+        """True once the backend has closed its end, i.e. it gave up on the job"""
+        readable, _, _ = select.select([self.connection], [], [], 0)
+        if not readable:
+            return False
+        try:
+            return self.connection.recv(1, socket.MSG_PEEK) == b""
+        except OSError:
+            return True
+
+    def _reply(self, payload: dict):
+        try:
+            self.wfile.write(json.dumps(payload).encode("utf-8") + b"\n")
+        except OSError:
+            pass  # Backend already hung up
+
+
+class PoolServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, pool: WorkerPool):
+        super().__init__(address, PoolRequestHandler)
+        self.pool = pool
+
+
+def sweep_artifacts(max_age: float = ARTIFACT_TTL) -> int:
+    """Delete artifacts (and stray temp files) unused for ``max_age`` seconds"""
+    removed = 0
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(ARTIFACT_DIR))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def _health_loop(pool: WorkerPool):
+    last_janitor_run = time.monotonic()
+    while True:
+        time.sleep(HEALTH_INTERVAL)
+        try:
+            pool.health_sweep()
+        except Exception as e:
+            print(f"⚠️ Health sweep failed: {e}", flush=True)
+        if time.monotonic() - last_janitor_run >= ARTIFACT_JANITOR_INTERVAL:
+            last_janitor_run = time.monotonic()
+            try:
+                removed = sweep_artifacts()
+                if removed:
+                    print(f"🧹 Removed {removed} stale test case artifacts", flush=True)
+            except Exception as e:
+                print(f"⚠️ Artifact janitor failed: {e}", flush=True)
+
+
+def ping(host: str = "127.0.0.1", port: int = POOL_PORT, timeout: float = 2) -> dict:
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall(b'{"op": "ping"}\n')
+        return json.loads(sock.makefile("rb").readline())
+
+
+def main():
+    if "--health" in sys.argv:
+        try:
+            stats = ping()
+        except Exception as e:
+            print(f"❌ Runner pool unreachable: {e}")
+            sys.exit(1)
+        print(json.dumps(stats))
+        sys.exit(0 if stats.get("ok") else 1)
+
+    _mp_context.set_forkserver_preload(list(PRELOADED_MODULES))
+    pool = WorkerPool(POOL_SIZE, MAX_JOBS_PER_WORKER)
+    threading.Thread(target=_health_loop, args=(pool,), daemon=True).start()
+    server = PoolServer((POOL_HOST, POOL_PORT), pool)
+    print(f"✅ Runner pool listening on {POOL_HOST}:{POOL_PORT} with {POOL_SIZE} workers", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
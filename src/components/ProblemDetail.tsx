@@ -3,6 +3,8 @@ import { useParams, Link, useNavigate } from "react-router-dom";
 import axios from "axios";
 import { useRoom } from "../context/RoomContext";
 import { useSocket } from "../hooks/useSocket";
+import { useRoomSync } from "../hooks/useRoomSync";
+import { useMatchClock, formatClock } from "../hooks/useMatchClock";
 import { useUser } from "../context/UserContext";
 import Editor from "@monaco-editor/react";
 
@@ -10,7 +12,8 @@ interface Problem {
   title: string;
   description: string;
   difficulty: string;
-  test_cases: { input: any; output: any }[];
+  // Only the first few cases; the full test set stays on the server
+  sample_cases: { input: any; output: any }[];
   function_template?: string;
 }
 
@@ -22,6 +25,7 @@ const ProblemDetail = () => {
   const [code, setCode] = useState("");
   const [runResult, setRunResult] = useState<any>(null);
   const [isRunning, setIsRunning] = useState(false);
+  const [testProgress, setTestProgress] = useState<{ completed: number; total: number } | null>(null);
   const [showCompletionBanner, setShowCompletionBanner] = useState(false);
   const [showGameEndModal, setShowGameEndModal] = useState(false);
   const [countdown, setCountdown] = useState(5);
@@ -32,6 +36,7 @@ const ProblemDetail = () => {
   const { user } = useUser();
   const navigate = useNavigate();
   const token = localStorage.getItem("token");
+  const secondsLeft = useMatchClock(socket, room);
 
   useEffect(() => {
     const fetchProblem = async () => {
@@ -53,48 +58,63 @@ const ProblemDetail = () => {
     fetchProblem();
   }, [decodedTitle]);
 
-  useEffect(() => {
-    if (!socket) return;
-    socket.on("room_update", (updatedRoom) => {
-      console.log("🔄 Room update received:", updatedRoom);
-      console.log("🔄 Room players completion status:", updatedRoom.players?.map(p => ({ name: p.name, completed: p.completed })));
-
-      if (!updatedRoom.active) {
-        setRoom(null);
-        setGameEndProcessed(false); // Reset when room becomes inactive
-      } else {
-        // Check if everyone has completed the game
-        if (updatedRoom.started && updatedRoom.players && updatedRoom.players.length > 0) {
-          const allCompleted = updatedRoom.players.every((p: any) => p.completed);
-          console.log("🏁 All completed?", allCompleted, "Game end processed?", gameEndProcessed, "Show modal?", showGameEndModal);
-          console.log("🏁 Room gameCompleted flag?", updatedRoom.gameCompleted);
-
-          // Only show animation if:
-          // 1. All players completed
-          // 2. Game completion animation hasn't been processed yet
-          // Note: We removed the gameCompleted check because we want to show animation BEFORE setting that flag
-          if (allCompleted && !showGameEndModal && !gameEndProcessed) {
-            console.log("🎉 Showing game completion animation");
-            // Show game end animation
-            setShowGameEndModal(true);
-            setCountdown(5);
-            setGameEndProcessed(true); // Prevent showing again
-          }
-        }
-        // Force a new object to trigger React re-render
+  // Snapshots and deltas both end up here with the full, current room
+  useRoomSync(socket, room, (updatedRoom) => {
+    console.log("🔄 Room update received:", updatedRoom);
+    console.log("🔄 Room players completion status:", updatedRoom.players?.map(p => ({ name: p.name, completed: p.completed })));
+
+    // The last completion also closes the room, so look for the end of the
+    // game before treating an inactive room as gone
+    if (updatedRoom.started && updatedRoom.players && updatedRoom.players.length > 0) {
+      const allCompleted = updatedRoom.players.every((p) => p.completed);
+      console.log("🏁 All completed?", allCompleted, "Game end processed?", gameEndProcessed, "Show modal?", showGameEndModal);
+      console.log("🏁 Room gameCompleted flag?", updatedRoom.gameCompleted);
+
+      // Only show animation if:
+      // 1. All players completed, or the match clock ran out
+      // 2. Game completion animation hasn't been processed yet
+      if ((allCompleted || updatedRoom.timeUp) && !showGameEndModal && !gameEndProcessed) {
+        console.log("🎉 Showing game completion animation");
+        // Show game end animation; the countdown clears the room afterwards
+        setShowGameEndModal(true);
+        setCountdown(5);
+        setGameEndProcessed(true); // Prevent showing again
         setRoom({...updatedRoom});
+        return;
       }
+    }
+
+    if (updatedRoom.active === false) {
+      setRoom(null);
+      setGameEndProcessed(false); // Reset when room becomes inactive
+    } else {
+      // Force a new object to trigger React re-render
+      setRoom({...updatedRoom});
+    }
+  });
+
+  useEffect(() => {
+    if (!socket) return;
+    socket.on("test_progress", (progress) => {
+      setTestProgress({ completed: progress.completed, total: progress.total });
     });
     return () => {
-      socket.off("room_update");
+      socket.off("test_progress");
     };
-  }, [socket, showGameEndModal, gameEndProcessed, navigate]);
+  }, [socket]);
 
+  // Join the socket.io room once per room code; later changes arrive as deltas.
+  // Rejoining after a reconnect tells the server we're back before our
+  // presence grace period runs out.
   useEffect(() => {
-    if (socket && room) {
-      socket.emit("join_room", { roomCode: room.code });
-    }
-  }, [socket, room]);
+    if (!socket || !room) return;
+    const join = () => socket.emit("join_room", { roomCode: room.code, userId: user?.id });
+    if (socket.connected) join();
+    socket.on("connect", join);
+    return () => {
+      socket.off("connect", join);
+    };
+  }, [socket, room?.code, user?.id]);
 
   // Countdown timer for game end modal
   useEffect(() => {
@@ -135,6 +155,7 @@ const ProblemDetail = () => {
 
     setIsRunning(true);
     setRunResult(null);
+    setTestProgress(null);
 
     try {
       const res = await axios.post(
@@ -144,7 +165,8 @@ const ProblemDetail = () => {
           problem_title: problem.title,
           user_id: user.id,
           room_code: room?.code,
-          is_submit: isSubmit
+          is_submit: isSubmit,
+          socket_id: socket?.id
         },
         { headers: { Authorization: `Bearer ${token}` } }
       );
@@ -195,6 +217,11 @@ const ProblemDetail = () => {
             <h2 className="text-lg font-semibold text-white">
               🏆 Live Leaderboard
             </h2>
+            {secondsLeft !== null && (
+              <span className={`font-mono text-sm ${secondsLeft <= 60 ? "text-red-400" : "text-gray-300"}`}>
+                ⏱️ {formatClock(secondsLeft)}
+              </span>
+            )}
             <button
               onClick={async () => {
                 if (!user || !room) return;
@@ -294,7 +321,7 @@ const ProblemDetail = () => {
             <div className="text-center mb-8">
               <div className="text-6xl mb-4 animate-bounce">🏆</div>
               <h1 className="text-4xl font-bold text-white mb-2 bg-gradient-to-r from-yellow-400 to-orange-500 bg-clip-text text-transparent">
-                Game Complete!
+                {room.timeUp ? "Time's Up!" : "Game Complete!"}
               </h1>
               <p className="text-gray-300 text-lg">Final Rankings</p>
             </div>
@@ -428,7 +455,7 @@ const ProblemDetail = () => {
           Test Cases
         </h2>
         <ul className="space-y-4">
-          {problem.test_cases && problem.test_cases.slice(0, 3).map((tc, idx) => (
+          {problem.sample_cases && problem.sample_cases.map((tc, idx) => (
             <li
               key={idx}
               className="p-4 bg-[#2D2D2D] rounded-lg border border-gray-600 shadow-md hover:border-blue-500 transition"
@@ -561,14 +588,14 @@ const ProblemDetail = () => {
                 disabled={isRunning}
                 className="bg-blue-600 hover:bg-blue-700 disabled:bg-blue-400 px-4 py-2 rounded text-sm font-semibold text-white shadow-md transition"
               >
-                {isRunning ? "Running..." : "Run Code"}
+                {isRunning ? `Running...${testProgress ? ` ${testProgress.completed}/${testProgress.total}` : ""}` : "Run Code"}
               </button>
               <button
                 onClick={() => handleRunCode(true)}
                 disabled={isRunning}
                 className="bg-green-600 hover:bg-green-700 disabled:bg-green-400 px-4 py-2 rounded text-sm font-semibold text-white shadow-md transition"
               >
-                {isRunning ? "Submitting..." : "Submit"}
+                {isRunning ? `Submitting...${testProgress ? ` ${testProgress.completed}/${testProgress.total}` : ""}` : "Submit"}
               </button>
             </div>
           </div>
@@ -594,7 +621,7 @@ const ProblemDetail = () => {
             <div className="p-4 border-t border-gray-600 bg-[#1A1A1A] max-h-48 overflow-y-auto">
               {runResult.error ? (
                 <div className="text-red-400">
-                  <p className="font-semibold">Error:</p>
+                  <p className="font-semibold">{runResult.verdict ? `${runResult.verdict}:` : "Error:"}</p>
                   <p className="font-mono text-sm">{runResult.error}</p>
                 </div>
               ) : runResult.passed === false ? (
@@ -1,35 +1,51 @@
 import { useEffect, useState } from "react";
 import { Link, useNavigate } from "react-router-dom";
 import axios from "axios";
-import { useRoom } from "../context/RoomContext";
+import { Room, useRoom } from "../context/RoomContext";
 import { useSocket } from "../hooks/useSocket";
+import { useRoomSync } from "../hooks/useRoomSync";
 import { useUser } from "../context/UserContext";
 
 interface Problem {
   _id: string;
   title: string;
-  description: string;
   difficulty: string;
+  tags?: string[];
   status?: "solved" | "attempted" | "none";
 }
 
 const Problems = () => {
   const [data, setData] = useState<Problem[]>([]);
   const [searchQuery, setSearchQuery] = useState("");
+  const [difficulty, setDifficulty] = useState("");
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [searching, setSearching] = useState(false);
   const { room, setRoom } = useRoom();
   const socket = useSocket();
   const { user, logout } = useUser();
   const navigate = useNavigate();
   const token = localStorage.getItem("token");
 
+  // The listing is paged: each response carries the cursor for the next page
+  const fetchProblemPage = async (cursor: string | null) => {
+    const params: Record<string, string> = {};
+    if (difficulty) params.difficulty = difficulty;
+    if (cursor) params.cursor = cursor;
+    const res = await axios.get("http://127.0.0.1:8000/api/problems", {
+      params,
+      headers: { Authorization: `Bearer ${token}` },
+    });
+    return res.data as { items: Problem[]; next_cursor: string | null };
+  };
+
   useEffect(() => {
     const fetchProblems = async () => {
       try {
-        const res = await axios.get("http://127.0.0.1:8000/api/problems", {
-          headers: { Authorization: `Bearer ${token}` },
-        });
-        setData(res.data);
+        const page = await fetchProblemPage(null);
+        setData(page.items);
+        setNextCursor(page.next_cursor);
       } catch (err) {
         console.error("Error fetching problems:", err);
       } finally {
@@ -37,7 +53,21 @@ const Problems = () => {
       }
     };
     fetchProblems();
-  }, []);
+  }, [difficulty]);
+
+  const handleLoadMore = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const page = await fetchProblemPage(nextCursor);
+      setData((prev) => [...prev, ...page.items]);
+      setNextCursor(page.next_cursor);
+    } catch (err) {
+      console.error("Error fetching more problems:", err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   useEffect(() => {
     const fetchExistingRoom = async () => {
@@ -63,28 +93,96 @@ const Problems = () => {
     fetchExistingRoom();
   }, [user, token]);
 
-  useEffect(() => {
-    if (!socket) return;
-    socket.on("room_update", (updatedRoom) => {
-      if (!updatedRoom.active) {
-        setRoom(null);
-      } else {
-        setRoom(updatedRoom);
-        if (updatedRoom.started && updatedRoom.problemId) {
-          navigate(`/problems/${encodeURIComponent(updatedRoom.problemId)}`);
-        }
+  useRoomSync(socket, room, (updatedRoom) => {
+    if (updatedRoom.active === false) {
+      setRoom(null);
+    } else {
+      setRoom(updatedRoom);
+      if (updatedRoom.started && updatedRoom.problemId) {
+        navigate(`/problems/${encodeURIComponent(updatedRoom.problemId)}`);
       }
-    });
+    }
+  });
+
+  // Join the socket.io room once per room code; later changes arrive as deltas.
+  // Rejoining after a reconnect tells the server we're back before our
+  // presence grace period runs out.
+  useEffect(() => {
+    if (!socket || !room) return;
+    const join = () => socket.emit("join_room", { roomCode: room.code, userId: user?.id });
+    if (socket.connected) join();
+    socket.on("connect", join);
     return () => {
-      socket.off("room_update");
+      socket.off("connect", join);
     };
-  }, [socket, navigate, room, user]);
+  }, [socket, room?.code, user?.id]);
 
+  // Quick play: the server sends match_found on our user channel once we're
+  // paired; after a reconnect we also ask in case we missed it
   useEffect(() => {
-    if (socket && room) {
-      socket.emit("join_room", { roomCode: room.code });
+    if (!socket || !searching || !user) return;
+    const handleMatch = ({ room: matched }: { room: Room }) => {
+      setSearching(false);
+      setRoom(matched);
+      navigate(`/problems/${encodeURIComponent(matched.problemId ?? "")}`);
+    };
+    const watch = async () => {
+      socket.emit("watch_matchmaking", { userId: user.id });
+      try {
+        const res = await axios.get(
+          `http://127.0.0.1:8000/api/matchmaking/status/${user.id}`,
+          { headers: { Authorization: `Bearer ${token}` } }
+        );
+        if (res.data.status === "matched") handleMatch(res.data);
+        else if (res.data.status === "idle") setSearching(false);
+      } catch (err) {
+        console.error("Error checking matchmaking status:", err);
+      }
+    };
+    socket.on("match_found", handleMatch);
+    socket.on("connect", watch);
+    if (socket.connected) watch();
+    return () => {
+      socket.off("match_found", handleMatch);
+      socket.off("connect", watch);
+    };
+  }, [socket, searching, user?.id]);
+
+  const handleQuickPlay = async () => {
+    if (!user) {
+      alert("Please log in first");
+      return;
+    }
+    try {
+      await axios.post(
+        "http://127.0.0.1:8000/api/matchmaking/enqueue",
+        {},
+        {
+          params: { userId: user.id, username: user.email, difficulty: difficulty || "any" },
+          headers: { Authorization: `Bearer ${token}` },
+        }
+      );
+      setSearching(true);
+    } catch (err) {
+      console.error("Error joining matchmaking:", err);
+      alert("Could not start quick play, please try again.");
+    }
+  };
+
+  const handleCancelQuickPlay = async () => {
+    if (!user) return;
+    setSearching(false);
+    try {
+      await axios.post(
+        `http://127.0.0.1:8000/api/matchmaking/cancel?userId=${user.id}`,
+        {},
+        { headers: { Authorization: `Bearer ${token}` } }
+      );
+    } catch (err) {
+      // Already matched or no longer queued
+      console.error("Error leaving matchmaking:", err);
     }
-  }, [socket, room]);
+  };
 
   const handleJoinRoom = async () => {
     if (!user) {
@@ -172,6 +270,25 @@ const Problems = () => {
                 Join Room
               </button>
             )}
+
+            {/* Quick Play: matched with another player on the selected difficulty */}
+            {!room && (
+              searching ? (
+                <button
+                  onClick={handleCancelQuickPlay}
+                  className="bg-gray-700 text-white py-3 px-6 rounded-full hover:bg-gray-600 transition-all duration-300 animate-pulse"
+                >
+                  Finding a match... Cancel
+                </button>
+              ) : (
+                <button
+                  onClick={handleQuickPlay}
+                  className="bg-gradient-to-r from-orange-600 to-red-500 text-white py-3 px-6 rounded-full hover:bg-gradient-to-l transition-all duration-300"
+                >
+                  Quick Play
+                </button>
+              )
+            )}
           </div>
         </div>
 
@@ -239,15 +356,25 @@ const Problems = () => {
           </div>
         )}
 
-        {/* Search Bar */}
-        <div className="mb-6">
+        {/* Search Bar and Difficulty Filter */}
+        <div className="mb-6 flex gap-3">
           <input
             type="text"
             placeholder="Search problems..."
             value={searchQuery}
             onChange={(e) => setSearchQuery(e.target.value)}
-            className="w-full px-4 py-3 bg-[#333] border border-[#444] rounded-lg text-gray-300 placeholder-gray-500 focus:outline-none focus:ring-2 focus:ring-orange-500"
+            className="flex-1 px-4 py-3 bg-[#333] border border-[#444] rounded-lg text-gray-300 placeholder-gray-500 focus:outline-none focus:ring-2 focus:ring-orange-500"
           />
+          <select
+            value={difficulty}
+            onChange={(e) => setDifficulty(e.target.value)}
+            className="px-4 py-3 bg-[#333] border border-[#444] rounded-lg text-gray-300 focus:outline-none focus:ring-2 focus:ring-orange-500"
+          >
+            <option value="">All</option>
+            <option value="Easy">Easy</option>
+            <option value="Medium">Medium</option>
+            <option value="Hard">Hard</option>
+          </select>
         </div>
 
         {/* Problem List */}
@@ -281,6 +408,19 @@ const Problems = () => {
             <div className="text-center text-white">No problems found</div>
           )}
         </div>
+
+        {/* Load More */}
+        {nextCursor && (
+          <div className="mt-6 text-center">
+            <button
+              onClick={handleLoadMore}
+              disabled={loadingMore}
+              className="bg-[#333] hover:bg-[#444] disabled:opacity-50 px-6 py-2 rounded-lg text-gray-300 transition-colors"
+            >
+              {loadingMore ? "Loading..." : "Load more"}
+            </button>
+          </div>
+        )}
       </div>
     </div>
   );
@@ -1,18 +1,29 @@
 import { createContext, useContext, useState } from "react";
 
-interface Player {
+export interface Player {
   id: string;
   name: string;
   score: number;
+  completed?: boolean;
+  completedAt?: string | null;
 }
 
-interface Room {
+export interface Room {
   id: string;
   code: string;
   hostId: string;
+  problemId?: string;
   players: Player[];
   started: boolean;
+  active?: boolean;
+  gameCompleted?: boolean;
+  // Revision of the room on the server; deltas apply on top of it
+  rev?: number;
   timeLeft?: number;
+  // Epoch ms when the server's match clock ends the game
+  endsAt?: number | null;
+  // The game ended because the clock ran out
+  timeUp?: boolean;
 }
 
 const RoomContext = createContext<{
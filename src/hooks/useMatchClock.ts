@@ -0,0 +1,52 @@
+import { useEffect, useRef, useState } from "react";
+import { Socket } from "socket.io-client";
+import { Room } from "../context/RoomContext";
+
+interface MatchTick {
+  code: string;
+  remaining: number;
+  endsAt: number;
+}
+
+// Seconds left in the room's match, counted down locally from endsAt. The
+// server sends a match_tick at a few marks before the deadline; each one
+// corrects for skew between our clock and the server's. The server ends the
+// game itself when time is up, so this is display only.
+export const useMatchClock = (socket: Socket | null, room: Room | null): number | null => {
+  const [secondsLeft, setSecondsLeft] = useState<number | null>(null);
+  // Server time minus local time, learned from match_tick
+  const skewRef = useRef(0);
+  const code = room?.code;
+  const endsAt = room?.started && room.active !== false ? room.endsAt ?? null : null;
+
+  useEffect(() => {
+    if (!socket) return;
+    const handleTick = (tick: MatchTick) => {
+      if (tick.code !== code) return;
+      skewRef.current = tick.endsAt - tick.remaining * 1000 - Date.now();
+    };
+    socket.on("match_tick", handleTick);
+    return () => {
+      socket.off("match_tick", handleTick);
+    };
+  }, [socket, code]);
+
+  useEffect(() => {
+    if (endsAt == null) {
+      setSecondsLeft(null);
+      return;
+    }
+    const update = () =>
+      setSecondsLeft(Math.max(0, Math.ceil((endsAt - (Date.now() + skewRef.current)) / 1000)));
+    update();
+    const timer = setInterval(update, 1000);
+    return () => clearInterval(timer);
+  }, [endsAt]);
+
+  return secondsLeft;
+};
+
+export const formatClock = (seconds: number): string => {
+  const minutes = Math.floor(seconds / 60);
+  return `${minutes}:${String(seconds % 60).padStart(2, "0")}`;
+};
@@ -0,0 +1,111 @@
+import { useEffect, useRef } from "react";
+import { Socket } from "socket.io-client";
+import { Room } from "../context/RoomContext";
+
+export type RoomOp =
+  | { op: "player_joined"; player: Room["players"][number] }
+  | { op: "player_left"; id: string }
+  | { op: "host_changed"; hostId: string }
+  | { op: "game_started"; endsAt?: number }
+  | { op: "player_completed"; id: string; completedAt: string | null }
+  | { op: "time_up" }
+  | { op: "game_completed" }
+  | { op: "room_closed" };
+
+// The ops take the room from baseRev to rev; the server may merge several
+// revisions into one delta
+export interface RoomDelta {
+  code: string;
+  baseRev?: number;
+  rev: number;
+  ops: RoomOp[];
+}
+
+export const applyRoomDelta = (room: Room, delta: RoomDelta): Room => {
+  let next: Room = { ...room, rev: delta.rev };
+  for (const op of delta.ops) {
+    switch (op.op) {
+      case "player_joined":
+        next = { ...next, players: [...next.players.filter((p) => p.id !== op.player.id), op.player] };
+        break;
+      case "player_left":
+        next = { ...next, players: next.players.filter((p) => p.id !== op.id) };
+        break;
+      case "host_changed":
+        next = { ...next, hostId: op.hostId };
+        break;
+      case "game_started":
+        next = {
+          ...next,
+          started: true,
+          endsAt: op.endsAt ?? null,
+          timeUp: false,
+          players: next.players.map((p) => ({ ...p, completed: false, completedAt: null })),
+        };
+        break;
+      case "player_completed":
+        next = {
+          ...next,
+          players: next.players.map((p) =>
+            p.id === op.id ? { ...p, completed: true, completedAt: op.completedAt } : p
+          ),
+        };
+        break;
+      case "time_up":
+        next = { ...next, timeUp: true };
+        break;
+      case "game_completed":
+        next = { ...next, gameCompleted: true };
+        break;
+      case "room_closed":
+        next = { ...next, active: false };
+        break;
+    }
+  }
+  return next;
+};
+
+// Keeps a room in sync with the server: full room_update snapshots (sent on
+// join and on request) replace it, room_delta patches are applied when they
+// start at our rev, and a gap in revisions asks the server for a fresh snapshot.
+export const useRoomSync = (
+  socket: Socket | null,
+  room: Room | null,
+  onRoom: (room: Room) => void
+) => {
+  const roomRef = useRef(room);
+  const onRoomRef = useRef(onRoom);
+  roomRef.current = room;
+  onRoomRef.current = onRoom;
+
+  useEffect(() => {
+    if (!socket) return;
+
+    const handleSnapshot = (snapshot: Room) => {
+      roomRef.current = snapshot;
+      onRoomRef.current(snapshot);
+    };
+
+    const handleDelta = (delta: RoomDelta) => {
+      const current = roomRef.current;
+      if (!current || current.code !== delta.code) return;
+      const rev = current.rev ?? 0;
+      if (delta.rev <= rev) return; // already applied (or older than our snapshot)
+      if ((delta.baseRev ?? delta.rev - 1) !== rev) {
+        console.log(`🔁 Room ${delta.code} jumped from rev ${rev} to ${delta.rev}, resyncing`);
+        socket.emit("sync_room", { roomCode: delta.code });
+        return;
+      }
+      const next = applyRoomDelta(current, delta);
+      roomRef.current = next;
+      onRoomRef.current(next);
+    };
+
+    socket.on("room_update", handleSnapshot);
+    socket.on("room_delta", handleDelta);
+    return () => {
+      socket.off("room_update", handleSnapshot);
+      socket.off("room_delta", handleDelta);
+    };
+  }, [socket]);
+};